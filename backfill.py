@@ -0,0 +1,196 @@
+"""
+backfill.py
+-----------
+
+Parallel historical backfill of route schedules and path details.
+
+Plans one (kind, route, date) work unit per route and date in the range,
+skips units whose csv partition already exists and runs the rest on a
+thread pool. All threads share ratelimit.RATE_LIMITER, so concurrency hides
+API latency without exceeding the rate budget.
+
+    python backfill.py 2021-08-01 2021-08-31 --sched --path --routes '7*' S2
+"""
+# built-in modules
+import os
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+from time import monotonic
+
+# project modules
+from codec import decode
+from extract import fetch_route_sched, fetch_path_details
+from ratelimit import RATE_LIMITER
+from utils import csv_file_prefix, timestamp_dir
+from wmata import get_routes, get_route_ids, set_api_host
+
+WorkUnit = namedtuple('WorkUnit', ['kind', 'route_id', 'date'])
+
+# work unit kind -> (csv data types it writes, fetch function)
+BACKFILL_KINDS = {
+    'route_scheds': (['route_scheds'], fetch_route_sched),
+    'path_details': (['path_details_stops', 'shape_map'], fetch_path_details)
+}
+
+
+def date_range(start: str, end: str) -> list:
+    """Return YYYY-MM-DD dates from start to end, inclusive."""
+    day = datetime.strptime(start, '%Y-%m-%d')
+    last = datetime.strptime(end, '%Y-%m-%d')
+    dates = list()
+    while day <= last:
+        dates.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    return dates
+
+
+def filter_routes(route_ids: list, patterns: list) -> list:
+    """Return route ids matching any of the shell style patterns, e.g. 7*."""
+    if not patterns:
+        return list(route_ids)
+    return [r for r in route_ids if any(fnmatchcase(r, p) for p in patterns)]
+
+
+def partition_exists(unit: WorkUnit) -> bool:
+    """Return True if every csv of the unit was already saved for its date."""
+    data_types = BACKFILL_KINDS[unit.kind][0]
+    timestamp = datetime.strptime(unit.date, '%Y-%m-%d')
+    for data_type in data_types:
+        path = timestamp_dir(data_type, level=3, timestamp=timestamp)
+        prefix = csv_file_prefix(data_type, unit.route_id)
+        if not os.path.isdir(path) or not any(
+            name.startswith(prefix) for name in os.listdir(path)
+        ):
+            return False
+    return True
+
+
+def plan_backfill(
+        start: str, end: str, route_ids: list, kinds: list, skip_existing=True
+) -> list:
+    """Return work units for routes and dates, minus already stored ones."""
+    units = [
+        WorkUnit(kind, route_id, date)
+        for date in date_range(start, end)
+        for kind in kinds
+        for route_id in route_ids
+    ]
+    if skip_existing:
+        units = [unit for unit in units if not partition_exists(unit)]
+    return units
+
+
+def run_unit(unit: WorkUnit, to_csv=True, to_firehose=False) -> WorkUnit:
+    fetch = BACKFILL_KINDS[unit.kind][1]
+    fetch(
+        [unit.route_id], date=unit.date, to_csv=to_csv, to_firehose=to_firehose
+    )
+    return unit
+
+
+def run_backfill(units: list, workers: int = 8, to_csv=True, to_firehose=False) -> dict:
+    """Run work units concurrently, printing progress and ETA.
+
+    Returns:
+        dict with lists of done and failed units.
+    """
+    done, failed = list(), list()
+    start = monotonic()
+    total = len(units)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_unit, unit, to_csv, to_firehose): unit
+            for unit in units
+        }
+        for future in as_completed(futures):
+            unit = futures[future]
+            try:
+                future.result()
+                done.append(unit)
+            except Exception as e:
+                failed.append(unit)
+                print(f'[backfill] {unit.kind} {unit.route_id} {unit.date} failed: {e!r}')
+
+            finished = len(done) + len(failed)
+            elapsed = monotonic() - start
+            eta = elapsed / finished * (total - finished)
+            print(
+                f'[backfill] {finished}/{total} units, {len(failed)} failed, '
+                f'elapsed {timedelta(seconds=int(elapsed))}, '
+                f'eta {timedelta(seconds=int(eta))}'
+            )
+    return {'done': done, 'failed': failed}
+
+
+def backfill(
+        start: str, end: str, routes: list = None, sched=True, path=False,
+        workers: int = 8, force=False, to_csv=True, to_firehose=False
+) -> dict:
+    """Fetch schedules and/or path details of matching routes for a date range.
+
+    Args:
+        start (str): first date, YYYY-MM-DD.
+        end (str): last date, YYYY-MM-DD.
+        routes (list): Optional; route id patterns, e.g. ['70', 'S*'],
+            defaults to all routes.
+        sched (bool): fetch route schedules.
+        path (bool): fetch path details.
+        workers (int): concurrent fetches.
+        force (bool): refetch units whose partitions already exist.
+        to_csv (bool): save local as csv.
+        to_firehose (bool): send data to aws_firehose.
+    """
+    kinds = [k for k, wanted in [('route_scheds', sched), ('path_details', path)] if wanted]
+    route_ids = filter_routes(get_route_ids(decode(get_routes())), routes)
+    units = plan_backfill(start, end, route_ids, kinds, skip_existing=not force)
+    planned = len(date_range(start, end)) * len(kinds) * len(route_ids)
+    print(
+        f'[backfill] {len(units)} of {planned} units to fetch for '
+        f'{len(route_ids)} routes, {len(kinds)} kinds at '
+        f'{RATE_LIMITER.rate:g} calls/s'
+    )
+    return run_backfill(units, workers=workers, to_csv=to_csv, to_firehose=to_firehose)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Backfill historical WMATA schedules and path details.'
+    )
+    arg_parser.add_argument('start', help='First date in YYYY-MM-DD format.')
+    arg_parser.add_argument('end', help='Last date in YYYY-MM-DD format.')
+    arg_parser.add_argument(
+        '--routes', nargs='*',
+        help='Route ids or shell style patterns, e.g. 70 S*; default all.'
+    )
+    arg_parser.add_argument(
+        '--sched', action='store_true', help='Fetch route schedules.'
+    )
+    arg_parser.add_argument(
+        '--path', action='store_true', help='Fetch path details.'
+    )
+    arg_parser.add_argument('--workers', type=int, default=8)
+    arg_parser.add_argument(
+        '--force', action='store_true',
+        help='Refetch dates already present in the data directory.'
+    )
+    arg_parser.add_argument(
+        '--rate-limit', type=float,
+        help='WMATA API calls/second budget shared by all workers.'
+    )
+    arg_parser.add_argument(
+        '--api-host',
+        help='Use an alternate WMATA compatible host, e.g. proxy or simulator.'
+    )
+    args = vars(arg_parser.parse_args())
+    rate_limit = args.pop('rate_limit')
+    if rate_limit:
+        RATE_LIMITER.configure(rate=rate_limit)
+    api_host = args.pop('api_host')
+    if api_host:
+        set_api_host(api_host)
+    result = backfill(**args)
+    if result['failed']:
+        raise SystemExit(1)
@@ -0,0 +1,300 @@
+"""
+bench.py
+--------
+
+Benchmarks for the flatteners, sinks and end-to-end extraction.
+
+Each stage runs against synthetic payloads of realistic size, or responses
+recorded by simulator.py with --fixtures, and reports wall time, rows/s and
+peak memory. Results can be saved as a baseline and later runs compared to
+it, exiting non-zero when a stage regresses past the threshold.
+
+    python bench.py --save bench_baseline.json
+    python bench.py --compare bench_baseline.json --threshold 0.2
+"""
+# built-in modules
+import os
+import sys
+import argparse
+import json
+import subprocess
+import tracemalloc
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter
+
+# project modules
+import wmata
+from extract import _save_csv, fetch_bus_positions
+from positions import PositionBatch
+from utils import ROOT_DIR
+from simulator import SimulatorServer, DEFAULT_FIXTURE
+from wmata import flatten_route_sched_data, flatten_path_details_data
+
+
+def synthetic_route_sched(trips=150, stops=60) -> dict:
+    """Return jRouteSchedule payload, defaults are about a busy route's day."""
+    payload = {'Name': '70 - SILVER SPRING - ARCHIVES'}
+    for direction in range(2):
+        payload[f'Direction{direction}'] = [
+            {
+                'RouteID': '70', 'DirectionNum': str(direction),
+                'TripDirectionText': 'NORTH' if direction else 'SOUTH',
+                'TripHeadsign': 'SILVER SPRING STATION',
+                'StartTime': '2021-08-10T05:00:00',
+                'EndTime': '2021-08-10T06:10:00',
+                'TripID': str(1000000 + direction * trips + trip),
+                'StopTimes': [
+                    {
+                        'StopID': str(1001000 + stop),
+                        'StopName': f'GEORGIA AVE NW + STOP {stop}',
+                        'StopSeq': stop + 1,
+                        'Time': '2021-08-10T05:%02d:00' % (stop % 60)
+                    } for stop in range(stops)
+                ]
+            } for trip in range(trips)
+        ]
+    return payload
+
+
+def synthetic_path_details(stops=80, shape_points=1500) -> dict:
+    """Return jRouteDetails payload."""
+    payload = {'Name': '70 - SILVER SPRING - ARCHIVES', 'RouteID': '70'}
+    for direction in range(2):
+        payload[f'Direction{direction}'] = {
+            'DirectionNum': str(direction),
+            'DirectionText': 'NORTH' if direction else 'SOUTH',
+            'TripHeadsign': 'SILVER SPRING STATION',
+            'Shape': [
+                {
+                    'Lat': 38.89 + i * 1e-5, 'Lon': -77.02 + i * 1e-5,
+                    'SeqNum': i + 1
+                } for i in range(shape_points)
+            ],
+            'Stops': [
+                {
+                    'StopID': str(1001000 + i), 'Name': f'STOP {i}',
+                    'Lat': 38.89 + i * 1e-4, 'Lon': -77.02 + i * 1e-4,
+                    'Routes': ['70', '79']
+                } for i in range(stops)
+            ]
+        }
+    return payload
+
+
+def synthetic_positions(vehicles=1500) -> dict:
+    """Return jBusPositions payload for a full-fleet snapshot."""
+    routes = [str(r) for r in range(300)]
+    return {'BusPositions': [
+        {
+            'BlockNumber': str(7000 + i), 'DateTime': '2021-08-10T10:20:42',
+            'Deviation': float(i % 10), 'DirectionNum': i % 2,
+            'DirectionText': 'NORTH' if i % 2 else 'SOUTH',
+            'Lat': 38.9 + i * 1e-4, 'Lon': -77.0 - i * 1e-4,
+            'RouteID': routes[i % len(routes)],
+            'TripEndTime': '2021-08-10T11:05:00',
+            'TripHeadsign': 'SILVER SPRING STATION', 'TripID': str(20000 + i),
+            'TripStartTime': '2021-08-10T10:00:00', 'VehicleID': str(3000 + i)
+        } for i in range(vehicles)
+    ]}
+
+
+def synthetic_stops(stops=10000) -> dict:
+    """Return jStops payload for the full stop list."""
+    return {'Stops': [
+        {
+            'StopID': str(1000000 + i), 'Name': f'STOP {i}',
+            'Lat': 38.8 + i * 1e-5, 'Lon': -77.1 + i * 1e-5,
+            'Routes': ['70', '79', 'S2']
+        } for i in range(stops)
+    ]}
+
+
+def load_payloads(fixtures: str = None) -> dict:
+    """Return raw payload bytes by endpoint, recorded ones when available."""
+    payloads = {
+        'jRouteSchedule': json.dumps(synthetic_route_sched()).encode(),
+        'jRouteDetails': json.dumps(synthetic_path_details()).encode(),
+        'jBusPositions': json.dumps(synthetic_positions()).encode(),
+        'jStops': json.dumps(synthetic_stops()).encode()
+    }
+    if fixtures:
+        for endpoint in payloads:
+            endpoint_dir = os.path.join(fixtures, endpoint)
+            if not os.path.isdir(endpoint_dir):
+                continue
+            # use the largest recording of each endpoint
+            paths = [os.path.join(endpoint_dir, f) for f in os.listdir(endpoint_dir)]
+            if paths:
+                with open(max(paths, key=os.path.getsize), mode='rb') as f:
+                    payloads[endpoint] = f.read()
+    return payloads
+
+
+def stages(payloads: dict) -> dict:
+    """Return stage name -> setup function returning (run, rows)."""
+    def decode_sched():
+        rows = len(flatten_route_sched_data(json.loads(payloads['jRouteSchedule'])))
+        return lambda: json.loads(payloads['jRouteSchedule']), rows
+
+    def flatten_sched():
+        data = json.loads(payloads['jRouteSchedule'])
+        rows = len(flatten_route_sched_data(json.loads(payloads['jRouteSchedule'])))
+        return lambda: flatten_route_sched_data(data), rows
+
+    def flatten_path():
+        data = json.loads(payloads['jRouteDetails'])
+        rows = sum(
+            len(v) for v in flatten_path_details_data(
+                json.loads(payloads['jRouteDetails'])
+            ).values()
+        )
+        return lambda: flatten_path_details_data(data), rows
+
+    def save_sched():
+        data = flatten_route_sched_data(json.loads(payloads['jRouteSchedule']))
+        return lambda: _save_csv(data, api_type='route_scheds', custom='bench'), len(data)
+
+    def save_stops():
+        data = json.loads(payloads['jStops'])['Stops']
+        return lambda: _save_csv(data, api_type='stops'), len(data)
+
+    def position_batch():
+        data = json.loads(payloads['jBusPositions'])['BusPositions']
+        return lambda: PositionBatch.from_records(data), len(data)
+
+    def fetch_positions():
+        rows = len(json.loads(payloads['jBusPositions'])['BusPositions'])
+        return lambda: fetch_bus_positions(to_firehose=False), rows
+
+    def startup(module):
+        # cold start of a cron entry point, i.e. a fresh interpreter import
+        command = [sys.executable, '-c', f'import {module}']
+        return lambda: subprocess.run(command, cwd=ROOT_DIR, check=True), 1
+
+    return {
+        'startup_extract': lambda: startup('extract'),
+        'startup_wmata': lambda: startup('wmata'),
+        'decode_route_sched': decode_sched,
+        'flatten_route_sched': flatten_sched,
+        'flatten_path_details': flatten_path,
+        'save_csv_route_sched': save_sched,
+        'save_csv_stops': save_stops,
+        'position_batch': position_batch,
+        'fetch_bus_positions': fetch_positions
+    }
+
+
+def measure(setup, repeat: int) -> dict:
+    """Return best wall time, rows/s and peak traced memory of a stage."""
+    best = float('inf')
+    for _ in range(repeat):
+        run, rows = setup()
+        start = perf_counter()
+        run()
+        best = min(best, perf_counter() - start)
+
+    run, rows = setup()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'rows': rows,
+        'wall_s': best,
+        'rows_per_s': rows / best if best else 0.0,
+        'peak_mb': peak / 2 ** 20
+    }
+
+
+def run_benchmarks(fixtures: str = None, repeat=5, only: list = None) -> dict:
+    payloads = load_payloads(fixtures)
+    cwd = os.getcwd()
+    host = wmata.API_HOST
+    with TemporaryDirectory() as tmp:
+        # serve payloads for end-to-end stages
+        for endpoint, content in payloads.items():
+            os.makedirs(os.path.join(tmp, 'fixtures', endpoint))
+            with open(os.path.join(tmp, 'fixtures', endpoint, DEFAULT_FIXTURE), 'wb') as f:
+                f.write(content)
+        server = SimulatorServer(('127.0.0.1', 0), os.path.join(tmp, 'fixtures'))
+        Thread(target=server.serve_forever, daemon=True).start()
+        wmata.set_api_host(server.url)
+        os.chdir(tmp)  # sinks write under ./data
+        try:
+            results = dict()
+            for name, setup in stages(payloads).items():
+                if only and name not in only:
+                    continue
+                results[name] = measure(setup, repeat)
+        finally:
+            os.chdir(cwd)
+            wmata.set_api_host(host)
+            server.shutdown()
+            server.server_close()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return regression messages for stages slower or larger than baseline."""
+    regressions = list()
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['rows_per_s'] < base['rows_per_s'] * (1 - threshold):
+            regressions.append(
+                f'{name}: {result["rows_per_s"]:,.0f} rows/s vs '
+                f'baseline {base["rows_per_s"]:,.0f}'
+            )
+        if result['peak_mb'] > base['peak_mb'] * (1 + threshold):
+            regressions.append(
+                f'{name}: {result["peak_mb"]:.1f} MB peak vs '
+                f'baseline {base["peak_mb"]:.1f}'
+            )
+    return regressions
+
+
+def report(results: dict) -> None:
+    print(f'{"stage":<24}{"rows":>9}{"wall ms":>11}{"rows/s":>14}{"peak MB":>10}')
+    for name, r in results.items():
+        print(
+            f'{name:<24}{r["rows"]:>9}{r["wall_s"] * 1000:>11.2f}'
+            f'{r["rows_per_s"]:>14,.0f}{r["peak_mb"]:>10.2f}'
+        )
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Benchmark flatteners, sinks and extraction.'
+    )
+    arg_parser.add_argument(
+        '--fixtures', help='Use responses recorded by simulator.py.'
+    )
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument(
+        '--stage', action='append', dest='only',
+        help='Only run the given stage, may be repeated.'
+    )
+    arg_parser.add_argument('--save', help='Save results as baseline json.')
+    arg_parser.add_argument('--compare', help='Compare with baseline json.')
+    arg_parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='Allowed fractional regression vs the baseline.'
+    )
+    args = arg_parser.parse_args()
+
+    bench_results = run_benchmarks(
+        fixtures=args.fixtures, repeat=args.repeat, only=args.only
+    )
+    report(bench_results)
+    if args.save:
+        with open(args.save, mode='w') as f:
+            json.dump(bench_results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            found = compare(bench_results, json.load(f), args.threshold)
+        for regression in found:
+            print(f'REGRESSION {regression}')
+        if found:
+            raise SystemExit(1)
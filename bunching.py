@@ -0,0 +1,192 @@
+"""
+bunching.py
+-----------
+
+Incremental bus bunching and gap detection on every positions poll.
+
+BunchingDetector is a positions listener of extract.watch_bus_positions.
+Each vehicle is projected onto the shape of its route direction, loaded
+with shapes.load_route_shapes. The projection searches from the vehicle's
+segment in the previous poll, so a poll costs a few segments per vehicle
+instead of the whole shape. Vehicles of each route direction are then
+ordered by distance along the shape, and the spacing to the vehicle ahead
+is checked:
+
+    - bunching: closer than bunch_distance meters to the vehicle ahead
+    - gap: further than gap_factor times the median spacing of the route
+      direction, with at least min_gap_vehicles on it
+
+Events are emitted when a condition starts (bunching, gap) and ends
+(bunching_end, gap_end), and appended to hourly csv files:
+
+    data/bunching_events/YYYY/MM/DD/HH/bunching_events_MM-DD-YYYY_HH.csv
+
+Vehicles off the shape, near a terminal or not updated for stale_after
+seconds are left out, as they are laying over or off route.
+"""
+# built-in modules
+from datetime import timedelta
+
+# project modules
+from positions import PositionBatch, MISSING_TIME
+from rollups import append_csv
+from shapes import RouteLine, load_route_shapes
+from utils import EPOCH, from_epoch
+
+BUNCHING = 'bunching'
+GAP = 'gap'
+
+
+class BunchingDetector:
+    """Per-poll spacing checks of the vehicles of each route direction.
+
+    Args:
+        bunch_distance (float): meters to the vehicle ahead below which a
+            vehicle is bunched.
+        gap_factor (float): spacing over this multiple of the median spacing
+            of the route direction is a gap.
+        min_gap_vehicles (int): vehicles a route direction needs for gaps.
+        max_offset (float): meters a vehicle may be off its shape.
+        terminal_buffer (float): meters from either end of the shape in
+            which vehicles are ignored.
+        stale_after (int): seconds after which a position is ignored,
+            relative to the newest position of the poll.
+        shapes (dict): Optional; (RouteID, DirectionNum) -> shape points,
+            defaults to the saved shapes of each poll's day.
+        to_csv (bool): append events to bunching_events csv files.
+    """
+
+    def __init__(
+            self, bunch_distance: float = 250, gap_factor: float = 2.5,
+            min_gap_vehicles: int = 3, max_offset: float = 150,
+            terminal_buffer: float = 200, stale_after: int = 300, shapes=None,
+            to_csv=True
+    ):
+        self.bunch_distance = bunch_distance
+        self.gap_factor = gap_factor
+        self.min_gap_vehicles = min_gap_vehicles
+        self.max_offset = max_offset
+        self.terminal_buffer = terminal_buffer
+        self.stale_after = stale_after
+        self.to_csv = to_csv
+        self.fixed_shapes = shapes is not None
+        self.shapes_day = None  # day of the loaded shapes
+        self.lines = dict()  # (RouteID, DirectionNum) -> RouteLine
+        self.segments = dict()  # VehicleID -> (route direction, segment)
+        self.active = dict()  # (kind, route direction, VehicleID) -> event
+        if shapes is not None:
+            self._set_shapes(shapes)
+
+    def _set_shapes(self, shapes: dict) -> None:
+        self.lines = {
+            key: RouteLine(points) for key, points in shapes.items() if points
+        }
+        self.segments = dict()
+
+    def __call__(self, batch: PositionBatch) -> None:
+        events = self.detect(batch)
+        for event in events:
+            if event['Event'] in (BUNCHING, GAP):
+                print(
+                    f"[bunching] {event['Event']} route {event['RouteID']}/"
+                    f"{event['DirectionNum']}: {event['VehicleID']} "
+                    f"{event['Spacing']} m behind {event['LeadVehicleID']}"
+                )
+        if self.to_csv and events:
+            newest = max(batch.columns['DateTime'])
+            append_csv(
+                'bunching_events', events,
+                EPOCH + timedelta(seconds=newest - newest % 3600)
+            )
+
+    def locate(self, vehicle: str, key: tuple, lat: float, lon: float):
+        """Return distance along the route direction's shape, None if off it."""
+        line = self.lines.get(key)
+        if line is None:
+            return None
+        previous = self.segments.get(vehicle)
+        if previous is not None and previous[0] == key:
+            # vehicles move a few shape points per poll, search near the last
+            distance, offset, segment = line.project(
+                lat, lon, previous[1] - 2, previous[1] + 30
+            )
+            if offset > self.max_offset:
+                distance, offset, segment = line.project(lat, lon)
+        else:
+            distance, offset, segment = line.project(lat, lon)
+        if offset > self.max_offset:
+            self.segments.pop(vehicle, None)
+            return None
+        self.segments[vehicle] = (key, segment)
+        if not self.terminal_buffer <= distance <= line.length - self.terminal_buffer:
+            return None
+        return distance
+
+    def detect(self, batch: PositionBatch) -> list:
+        """Return events started or ended by a poll's positions."""
+        columns = batch.columns
+        times = columns['DateTime']
+        newest = max(times, default=MISSING_TIME)
+        if newest == MISSING_TIME:
+            return list()
+        day = from_epoch(newest)[:10]
+        if not self.fixed_shapes and day != self.shapes_day:
+            self.shapes_day = day
+            self._set_shapes(load_route_shapes(day))
+
+        decode = batch.pool.decode
+        vehicles = dict()  # route direction -> [(distance, VehicleID, epoch)]
+        polled = set()
+        for vehicle, route, direction, t, lat, lon in zip(
+            columns['VehicleID'], columns['RouteID'], columns['DirectionNum'],
+            times, columns['Lat'], columns['Lon']
+        ):
+            if t == MISSING_TIME or newest - t > self.stale_after:
+                continue
+            key = (decode(route), direction)
+            vehicle = decode(vehicle)
+            polled.add(vehicle)
+            distance = self.locate(vehicle, key, lat, lon)
+            if distance is not None:
+                vehicles.setdefault(key, list()).append((distance, vehicle, t))
+
+        conditions = dict()  # (kind, route direction, VehicleID) -> event
+        for key, positions in vehicles.items():
+            positions.sort()
+            spacings = [
+                ahead[0] - behind[0]
+                for behind, ahead in zip(positions, positions[1:])
+            ]
+            if not spacings:
+                continue
+            gap_spacing = None
+            if len(positions) >= self.min_gap_vehicles:
+                gap_spacing = self.gap_factor * sorted(spacings)[len(spacings) // 2]
+            for (distance, vehicle, t), ahead, spacing in zip(
+                positions, positions[1:], spacings
+            ):
+                if spacing < self.bunch_distance:
+                    kind = BUNCHING
+                elif gap_spacing is not None and spacing > gap_spacing:
+                    kind = GAP
+                else:
+                    continue
+                conditions[kind, key, vehicle] = {
+                    'DateTime': from_epoch(max(t, ahead[2])), 'Event': kind,
+                    'RouteID': key[0], 'DirectionNum': key[1],
+                    'VehicleID': vehicle, 'LeadVehicleID': ahead[1],
+                    'Spacing': round(spacing, 1), 'DistanceAlong': round(distance, 1)
+                }
+
+        events = [
+            event for condition, event in conditions.items()
+            if condition not in self.active
+        ]
+        events += [
+            dict(event, DateTime=from_epoch(newest), Event=event['Event'] + '_end')
+            for condition, event in self.active.items() if condition not in conditions
+        ]
+        self.active = conditions
+        for vehicle in [v for v in self.segments if v not in polled]:
+            del self.segments[vehicle]
+        return events
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 cd ~/jk-apps/bus_wmata/
 source wmata_env/bin/activate
-python extract position
+python extract.py position
@@ -0,0 +1,133 @@
+"""
+codec.py
+--------
+
+JSON decoding and encoding for API responses and sink records.
+
+Uses orjson or ujson when installed and falls back to the json module.
+Responses are decoded once with decode(resp); iter_array() streams the
+elements of a large top-level array, e.g. Stops, without building the
+whole document.
+"""
+# built-in modules
+import codecs
+import json
+from json import JSONDecodeError
+
+try:
+    import orjson as _backend
+    BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson as _backend
+        BACKEND = 'ujson'
+    except ImportError:
+        _backend = json
+        BACKEND = 'json'
+
+_raw_decode = json.JSONDecoder().raw_decode
+_WHITESPACE = ' \t\n\r'
+
+
+def loads(data):
+    """Decode JSON document from bytes or str."""
+    return _backend.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """Encode obj as compact JSON bytes."""
+    data = _backend.dumps(obj)
+    return data if isinstance(data, bytes) else data.encode()
+
+
+def dumps_lines(records) -> bytes:
+    """Encode records as a single JSON lines payload."""
+    return b''.join(line + b'\n' for line in map(dumps, records))
+
+
+def decode(resp):
+    """Return decoded JSON of a response, decoding it at most once.
+
+    The decoded object is cached on the response and may be shared by
+    callers coalesced onto the same request, so it must not be mutated.
+    """
+    data = getattr(resp, '_decoded_json', None)
+    if data is None:
+        data = loads(resp.content)
+        resp._decoded_json = data
+    return data
+
+
+def iter_array(source, key: str, chunk_size: int = 65536):
+    """Yield elements of the top-level array member key one at a time.
+
+    Args:
+        source: response object, bytes, str or iterable of bytes chunks.
+        key (str): top-level member holding the array, e.g. Stops.
+        chunk_size (int): bytes per chunk read from a response.
+
+    The array is located by searching for the first "key": [ in the
+    document, which holds for the WMATA payloads where the array is the
+    first member with that name. Elements should be objects or strings.
+    """
+    if hasattr(source, 'iter_content'):
+        chunks = source.iter_content(chunk_size=chunk_size)
+    elif isinstance(source, (bytes, str)):
+        chunks = [source]
+    else:
+        chunks = source
+    chunks = iter(chunks)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def read() -> str:
+        for chunk in chunks:
+            text = chunk if isinstance(chunk, str) else decoder.decode(chunk)
+            if text:
+                return text
+        return ''
+
+    # find start of the array
+    buf, pos, marker = '', 0, f'"{key}"'
+    while True:
+        found = buf.find(marker)
+        if found >= 0:
+            pos = found + len(marker)
+            while True:
+                pos = _skip(buf, pos, _WHITESPACE + ':')
+                if pos < len(buf):
+                    break
+                more = read()
+                if not more:
+                    raise JSONDecodeError(f'Array {key} not found', buf, pos)
+                buf += more
+            if buf[pos] == '[':
+                pos += 1
+                break
+            raise JSONDecodeError(f'{key} is not an array', buf, pos)
+        more = read()
+        if not more:
+            raise JSONDecodeError(f'Array {key} not found', buf, 0)
+        buf = buf[-len(marker):] + more  # keep enough to match across chunks
+
+    # decode elements as they become complete
+    while True:
+        pos = _skip(buf, pos, _WHITESPACE + ',')
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            item, end = _raw_decode(buf, pos)
+        except JSONDecodeError:
+            more = read()
+            if not more:
+                raise
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        yield item
+        pos = end
+
+
+def _skip(buf: str, pos: int, chars: str) -> int:
+    while pos < len(buf) and buf[pos] in chars:
+        pos += 1
+    return pos
@@ -0,0 +1,222 @@
+"""
+coerce.py
+---------
+
+Typed coercion of flattened API rows, done once at ingest.
+
+API values arrive as whatever JSON types WMATA sent, e.g. DirectionNum is
+an int in bus positions and a string in path details, and timestamps are
+ISO strings that every consumer parses again. coerce_rows converts the
+columns of DATA_FIELDNAMES_MAP data types to native types column by column:
+
+    - timestamps to epoch seconds in array('q'), MISSING_TIME if empty
+    - coordinates and deviations to floats in array('d'), nan if empty
+    - directions, sequence numbers and counts to array('i'), MISSING_INT
+      if empty
+
+Rows holding a value that doesn't convert are dropped from the batch and
+written with the error to a JSON lines quarantine file:
+
+    data/quarantine/<data type>/YYYY/MM/DD/quarantine_<data type>_<timestamp>.jsonl
+
+Coercion is opt-in: extract.py --coerce calls enable(), after which typed()
+returns TypedBatches instead of the rows it is given. TypedBatches iterate
+as canonical row dicts, so sinks write them like any other rows.
+
+Parsing once covers ingest validation and in-process consumers: position
+listeners get a PositionBatch built from the typed columns, with epoch
+DateTime, see positions.PositionBatch.from_typed. String csv files and
+Firehose JSON lines stay the at-rest format, so jobs reading saved
+partitions, e.g. rollups.py and travel_times.py, parse their timestamps
+once per read.
+"""
+# built-in modules
+import os
+from array import array
+from datetime import datetime
+from math import isnan
+
+# project modules
+from codec import dumps
+from positions import MISSING_INT, MISSING_TIME
+from utils import DATA_FIELDNAMES_MAP, SAVE_PATH_QUARANTINE, to_epoch, from_epoch
+
+TIME = 'time'
+FLOAT = 'float'
+INT = 'int'
+FIELD_TYPES = {
+    'DateTime': TIME, 'TripStartTime': TIME, 'TripEndTime': TIME,
+    'StartTime': TIME, 'EndTime': TIME, 'Time': TIME, 'DateUpdated': TIME,
+    'Minute': TIME,
+    'Lat': FLOAT, 'Lon': FLOAT, 'Deviation': FLOAT, 'DeviationMean': FLOAT,
+    'DeviationP50': FLOAT, 'DeviationP90': FLOAT, 'Coverage': FLOAT,
+    'Spacing': FLOAT, 'DistanceAlong': FLOAT,
+    'DirectionNum': INT, 'StopSeq': INT, 'StopNum': INT, 'SeqNum': INT,
+    'Vehicles': INT, 'Positions': INT, 'Points': INT
+}
+# data type -> field -> type, fields not listed are kept as they are
+SCHEMAS = {
+    data_type: {f: FIELD_TYPES[f] for f in fields if f in FIELD_TYPES}
+    for data_type, fields in DATA_FIELDNAMES_MAP.items()
+}
+CONVERT_ERRORS = (TypeError, ValueError, OverflowError)
+
+_quarantine_root = None  # coercion is enabled once set
+
+
+def _to_time(value) -> int:
+    return MISSING_TIME if value is None or value == '' else to_epoch(value)
+
+
+def _to_float(value) -> float:
+    return float('nan') if value is None or value == '' else float(value)
+
+
+def _to_int(value) -> int:
+    return MISSING_INT if value is None or value == '' else int(value)
+
+
+# type -> (array typecode, converter, missing value)
+CONVERTERS = {
+    TIME: ('q', _to_time, MISSING_TIME),
+    FLOAT: ('d', _to_float, float('nan')),
+    INT: ('i', _to_int, MISSING_INT)
+}
+
+
+def _from_time(value: int):
+    return None if value == MISSING_TIME else from_epoch(value)
+
+
+def _from_float(value: float):
+    return None if isnan(value) else value
+
+
+def _from_int(value: int):
+    return None if value == MISSING_INT else value
+
+
+FORMATTERS = {TIME: _from_time, FLOAT: _from_float, INT: _from_int}
+
+
+class TypedBatch:
+    """Column-wise rows of a data type, typed per SCHEMAS.
+
+    Args:
+        data_type (str): type of api data.
+        columns (dict): field -> array of typed values, or list of values
+            of untyped fields.
+    """
+    __slots__ = ('data_type', 'columns')
+
+    def __init__(self, data_type: str, columns: dict):
+        self.data_type = data_type
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def __iter__(self):
+        return self.rows()
+
+    def column(self, field: str):
+        """Return typed values of a single column."""
+        return self.columns[field]
+
+    def take(self, indexes) -> 'TypedBatch':
+        """Return a batch of the rows at indexes."""
+        indexes = list(indexes)
+        columns = dict()
+        for field, values in self.columns.items():
+            kept = [values[i] for i in indexes]
+            if isinstance(values, array):
+                kept = array(values.typecode, kept)
+            columns[field] = kept
+        return TypedBatch(self.data_type, columns)
+
+    def rows(self):
+        """Yield rows as dicts of csv/JSON friendly values, timestamps as ISO
+        strings and missing values as None."""
+        schema = SCHEMAS[self.data_type]
+        fields = list(self.columns)
+        formatted = [
+            map(FORMATTERS[schema[f]], self.columns[f]) if f in schema
+            else self.columns[f]
+            for f in fields
+        ]
+        for values in zip(*formatted):
+            yield dict(zip(fields, values))
+
+
+def coerce_rows(data_type: str, rows, quarantine_root: str = None) -> TypedBatch:
+    """Return rows converted to a TypedBatch, quarantining malformed rows.
+
+    Args:
+        data_type (str): type of api data, a key of DATA_FIELDNAMES_MAP.
+        rows: iterable of row dicts.
+        quarantine_root (str): Optional; directory of quarantine files,
+            defaults to the one passed to enable().
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    schema = SCHEMAS[data_type]
+    columns = dict()
+    bad = dict()  # row index -> error
+    for field in DATA_FIELDNAMES_MAP[data_type]:
+        values = [row.get(field) for row in rows]
+        if field not in schema:
+            columns[field] = values
+            continue
+        typecode, convert, missing = CONVERTERS[schema[field]]
+        try:  # the whole column at once, unless some value is malformed
+            columns[field] = array(typecode, map(convert, values))
+        except CONVERT_ERRORS:
+            converted = array(typecode)
+            for i, value in enumerate(values):
+                try:
+                    converted.append(convert(value))
+                except CONVERT_ERRORS as e:
+                    bad.setdefault(i, f'{field}: {e}')
+                    converted.append(missing)
+            columns[field] = converted
+
+    if bad:
+        keep = [i for i in range(len(rows)) if i not in bad]
+        for field, values in columns.items():
+            kept = [values[i] for i in keep]
+            columns[field] = array(values.typecode, kept) if field in schema else kept
+        _quarantine(
+            data_type, [(rows[i], error) for i, error in sorted(bad.items())],
+            quarantine_root or _quarantine_root or SAVE_PATH_QUARANTINE
+        )
+    return TypedBatch(data_type, columns)
+
+
+def _quarantine(data_type: str, rows: list, root: str) -> str:
+    now = datetime.now()
+    path = os.path.join(root, data_type, *now.strftime('%Y-%m-%d').split('-'))
+    os.makedirs(path, exist_ok=True)
+    path = os.path.join(
+        path, f'quarantine_{data_type}_{now.strftime("%m-%d-%Y_%H-%M-%S")}.jsonl'
+    )
+    with open(path, mode='ab') as f:
+        for row, error in rows:
+            f.write(dumps({'error': error, 'row': row}) + b'\n')
+    print(f'[{data_type}] quarantined {len(rows)} malformed rows: {path}')
+    return path
+
+
+def enable(quarantine_root: str = SAVE_PATH_QUARANTINE) -> None:
+    """Coerce rows handed to typed() from now on."""
+    global _quarantine_root
+    _quarantine_root = quarantine_root
+
+
+def enabled() -> bool:
+    return _quarantine_root is not None
+
+
+def typed(data_type: str, rows):
+    """Return rows as a TypedBatch if coercion is enabled, else unchanged."""
+    if _quarantine_root is None:
+        return rows
+    return coerce_rows(data_type, rows)
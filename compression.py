@@ -0,0 +1,165 @@
+"""
+compression.py
+--------------
+
+Streaming compression for csv files and Firehose records.
+
+Codecs are gzip, and zstd or lz4 when the zstandard or lz4 packages are
+installed. The codec and level are chosen per data type in the optional
+[compression] section of config.ini, as codec[:level]; files and Firehose
+records are configured separately and are uncompressed by default:
+
+    [compression]
+    default = gzip:6
+    bus_positions = zstd:3
+    firehose_default = none
+    firehose_bus_positions = gzip:9
+
+Files are written through a compressing stream, so nothing is buffered
+whole in memory. Readers infer the codec from the file suffix. Compressed
+Firehose records are self-contained gzip/zstd/lz4 frames; frames
+concatenated by Firehose into one S3 object still decompress as one
+stream.
+"""
+# built-in modules
+import io
+import gzip
+from functools import lru_cache
+
+# project modules
+from utils import config_defaults
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+NONE = 'none'
+SUFFIXES = {NONE: '', 'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4'}
+DEFAULT_LEVELS = {NONE: None, 'gzip': 6, 'zstd': 3, 'lz4': 0}
+AVAILABLE = {NONE, 'gzip'} | ({'zstd'} if zstandard else set()) | (
+    {'lz4'} if lz4_frame else set()
+)
+COMPRESSION_DEFAULTS = {'default': NONE, 'firehose_default': NONE}
+
+# Firehose limits: 1000 KiB per record, 500 records and 4 MiB per batch call;
+# records are filled with up to 1000 KB, leaving room for compression overhead
+MAX_RECORD_BYTES = 1000 * 1000
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+
+
+def parse_setting(setting: str) -> tuple:
+    """Return (codec, level) of a codec[:level] setting."""
+    codec, _, level = setting.strip().lower().partition(':')
+    codec = codec or NONE
+    if codec not in SUFFIXES:
+        raise ValueError(f'unknown compression codec {codec!r}')
+    if codec not in AVAILABLE:
+        print(f'[compression] {codec} not installed, using gzip')
+        codec, level = 'gzip', ''
+    return codec, int(level) if level else DEFAULT_LEVELS[codec]
+
+
+@lru_cache(maxsize=None)
+def codec_for(data_type: str, sink: str = 'file') -> tuple:
+    """Return configured (codec, level) of data_type for a file or firehose sink."""
+    opts = config_defaults('compression', COMPRESSION_DEFAULTS)
+    prefix = '' if sink == 'file' else sink + '_'
+    return parse_setting(opts.get(prefix + data_type, opts[prefix + 'default']))
+
+
+def codec_of(path: str) -> str:
+    """Return codec of a file from its suffix."""
+    for codec, suffix in SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return codec
+    return NONE
+
+
+def is_csv(name: str) -> bool:
+    """Return True for csv files, compressed or not."""
+    return any(name.endswith('.csv' + suffix) for suffix in SUFFIXES.values())
+
+
+def open_text(path: str, mode: str = 'r', codec: str = None, level: int = None):
+    """Open a text file for csv reading or writing through its codec.
+
+    Args:
+        path (str): file path, including the codec's suffix.
+        mode (str): r, w or a; appending adds a new compressed frame.
+        codec (str): Optional; defaults to the codec of the path suffix.
+        level (int): Optional; compression level, defaults per codec.
+    """
+    codec = codec or codec_of(path)
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == NONE:
+        return open(path, mode=mode, newline='')
+    if codec == 'gzip':
+        return gzip.open(path, mode=mode + 't', compresslevel=level, newline='')
+    if codec == 'lz4':
+        return lz4_frame.open(
+            path, mode=mode + 't', compression_level=level, newline=''
+        )
+    raw = open(path, mode=mode + 'b')
+    if mode == 'r':
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    else:
+        stream = zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=True)
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+
+def compress(data: bytes, codec: str, level: int = None) -> bytes:
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == NONE:
+        return data
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == 'lz4':
+        return lz4_frame.compress(data, compression_level=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def firehose_records(lines, data_type: str) -> list:
+    """Aggregate JSON lines into as few Firehose records as fit, compressed
+    with the data type's firehose codec.
+
+    Args:
+        lines: iterable of newline terminated JSON bytes.
+        data_type (str): type of api data.
+    """
+    codec, level = codec_for(data_type, 'firehose')
+    records = list()
+    chunk, size = list(), 0
+    for line in lines:
+        # a line too large for one record is split, Firehose rejoins them
+        for start in range(0, len(line), MAX_RECORD_BYTES):
+            piece = line[start:start + MAX_RECORD_BYTES]
+            if chunk and size + len(piece) > MAX_RECORD_BYTES:
+                records.append({'Data': compress(b''.join(chunk), codec, level)})
+                chunk, size = list(), 0
+            chunk.append(piece)
+            size += len(piece)
+    if chunk:
+        records.append({'Data': compress(b''.join(chunk), codec, level)})
+    return records
+
+
+def record_batches(records: list):
+    """Yield lists of records within Firehose put_record_batch limits."""
+    batch, size = list(), 0
+    for record in records:
+        if batch and (
+            len(batch) == MAX_BATCH_RECORDS
+            or size + len(record['Data']) > MAX_BATCH_BYTES
+        ):
+            yield batch
+            batch, size = list(), 0
+        batch.append(record)
+        size += len(record['Data'])
+    if batch:
+        yield batch
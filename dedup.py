@@ -0,0 +1,208 @@
+"""
+dedup.py
+--------
+
+Deterministic record keys and a persistent, time-windowed dedup index, so
+records delivered more than once are dropped before the sinks.
+
+Retries, replays and overlapping polls deliver the same bus position or
+schedule row again. record_key hashes a data type's KEY_FIELDS, e.g.
+VehicleID and DateTime of a position, or all fields of data types without
+a natural key, into a 64-bit int. A DedupIndex maps the keys delivered
+within its window to the BUCKET_SECONDS of arrival time they expire with.
+Each bucket is also appended to a file, so a restarted process still drops
+what was delivered before the restart:
+
+    data/dedup/<data type>/<bucket epoch>.keys
+
+Windows are seconds per data type, set in the optional [dedup] section of
+config.ini (keys are data types, default applies to the rest):
+
+    [dedup]
+    default = 3600
+    incidents = 86400
+
+Dedup is opt-in: extract.py --dedup calls enable(), after which fresh()
+yields only the records not delivered yet. The keys are committed when the
+block exits without error, so a failed sink doesn't mark records delivered.
+"""
+# built-in modules
+import os
+import hashlib
+from array import array
+from contextlib import contextmanager
+from time import time
+
+# project modules
+from coerce import TypedBatch
+from metrics import DUPLICATES
+from positions import PositionBatch, MISSING_TIME
+from utils import (
+    DATA_FIELDNAMES_MAP, SAVE_PATH_DEDUP, config_defaults, from_epoch
+)
+
+# data type -> fields identifying a record, other types use all fields
+KEY_FIELDS = {
+    'bus_positions': ('VehicleID', 'DateTime'),
+    'vehicle_tracks': ('VehicleID', 'DateTime'),
+    'position_rollups': ('Minute', 'RouteID'),
+    'bunching_events': ('DateTime', 'Event', 'VehicleID'),
+    'route_scheds': ('TripID', 'StopID', 'StopSeq', 'Time'),
+    'route_sched_changes': ('Op', 'TripID', 'StopID', 'StopSeq', 'Time', 'Changed'),
+    'incidents': ('IncidentID', 'DateUpdated'),
+    'incident_changes': ('Change', 'IncidentID', 'DateUpdated')
+}
+DEDUP_DEFAULTS = {'default': '3600'}
+BUCKET_SECONDS = 300
+_SEPARATOR = '\x1f'
+
+_root = None  # dedup is enabled once set
+_indexes = dict()  # data type -> DedupIndex
+
+
+def _key(values) -> int:
+    text = _SEPARATOR.join('' if v is None else str(v) for v in values)
+    return int.from_bytes(
+        hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big'
+    )
+
+
+def record_key(data_type: str, record: dict) -> int:
+    """Return the 64-bit key of a record, equal for every delivery of it."""
+    fields = KEY_FIELDS.get(data_type) or DATA_FIELDNAMES_MAP[data_type]
+    return _key(record.get(field) for field in fields)
+
+
+def position_keys(batch: PositionBatch) -> list:
+    """Return record_key of each position of a batch, from its columns."""
+    decode = batch.pool.decode
+    return [  # positions without DateTime are keyed as record_key keys None
+        _key((decode(vehicle), None if t == MISSING_TIME else from_epoch(t)))
+        for vehicle, t in zip(batch.columns['VehicleID'], batch.columns['DateTime'])
+    ]
+
+
+class DedupIndex:
+    """Keys delivered within the last window seconds, persisted per bucket.
+
+    Args:
+        data_type (str): type of api data, names the index directory.
+        window (int): seconds keys are remembered.
+        root (str): Optional; directory of index directories, no files are
+            kept if None.
+        clock: Optional; function returning epoch seconds.
+    """
+
+    def __init__(
+            self, data_type: str, window: int = 3600, root: str = None, clock=time
+    ):
+        self.window = window
+        self.clock = clock
+        self.path = os.path.join(root, data_type) if root else None
+        self.buckets = dict()  # bucket epoch -> set of keys, for expiry
+        self.keys = dict()  # key -> bucket epoch, for lookups
+        if self.path and os.path.isdir(self.path):
+            oldest = self._bucket(self.clock()) - window
+            for name in sorted(os.listdir(self.path)):
+                bucket = int(name.split('.')[0])
+                if bucket < oldest:
+                    os.remove(os.path.join(self.path, name))
+                    continue
+                keys = array('Q')
+                with open(os.path.join(self.path, name), mode='rb') as f:
+                    keys.frombytes(f.read())
+                self._remember(bucket, keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.keys
+
+    def _remember(self, bucket: int, keys) -> None:
+        self.buckets.setdefault(bucket, set()).update(keys)
+        self.keys.update(dict.fromkeys(keys, bucket))
+
+    @staticmethod
+    def _bucket(now: float) -> int:
+        return int(now) - int(now) % BUCKET_SECONDS
+
+    def expire(self) -> None:
+        """Forget buckets entirely older than the window."""
+        oldest = self._bucket(self.clock()) - self.window
+        for bucket in [b for b in self.buckets if b < oldest]:
+            for key in self.buckets.pop(bucket):
+                if self.keys.get(key) == bucket:  # not delivered again since
+                    del self.keys[key]
+            if self.path:
+                try:
+                    os.remove(os.path.join(self.path, f'{bucket}.keys'))
+                except FileNotFoundError:
+                    pass
+
+    def new(self, keys: list) -> list:
+        """Return indexes of keys not delivered yet, first occurrences only."""
+        self.expire()
+        fresh, batch_keys = list(), set()
+        for i, key in enumerate(keys):
+            if key not in batch_keys and key not in self:
+                fresh.append(i)
+            batch_keys.add(key)
+        return fresh
+
+    def add(self, keys: list) -> None:
+        """Remember keys as delivered."""
+        if not keys:
+            return
+        bucket = self._bucket(self.clock())
+        self._remember(bucket, keys)
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, f'{bucket}.keys'), mode='ab') as f:
+                f.write(array('Q', keys).tobytes())
+
+
+def enable(root: str = SAVE_PATH_DEDUP) -> None:
+    """Drop already delivered records in fresh() from now on."""
+    global _root
+    _root = root
+    _indexes.clear()
+
+
+def enabled() -> bool:
+    return _root is not None
+
+
+def index(data_type: str) -> DedupIndex:
+    """Return the process's DedupIndex of data_type."""
+    if data_type not in _indexes:
+        windows = config_defaults('dedup', DEDUP_DEFAULTS)
+        _indexes[data_type] = DedupIndex(
+            data_type, int(windows.get(data_type, windows['default'])), _root
+        )
+    return _indexes[data_type]
+
+
+@contextmanager
+def fresh(data_type: str, records):
+    """Yield the records not delivered yet and remember them as delivered
+    when the block exits without error. PositionBatches and TypedBatches are
+    yielded as batches, other records as a list. Yields records unchanged if
+    dedup isn't enabled."""
+    if _root is None:
+        yield records
+        return
+
+    batch = isinstance(records, (PositionBatch, TypedBatch))
+    if isinstance(records, PositionBatch):
+        keys = position_keys(records)
+    else:
+        records = records if batch else list(records)
+        keys = [record_key(data_type, record) for record in records]
+    dedup_index = index(data_type)
+    keep = dedup_index.new(keys)
+    if len(keep) < len(keys):
+        DUPLICATES.inc(len(keys) - len(keep), data_name=data_type)
+        records = records.take(keep) if batch else [records[i] for i in keep]
+    yield records
+    dedup_index.add([keys[i] for i in keep])
@@ -1,108 +1,207 @@
 # built-in modules
 import os
 import argparse
+from collections import deque
 from csv import DictWriter
 from datetime import datetime
-from time import sleep
-
-# libraries
-import json
+from itertools import count
+from time import sleep, monotonic
 
 # project modules
+from codec import decode, dumps, loads, iter_array
 from utils import (
-    get_aws_session, add_name_timestamp,
-    firehose_put, firehose_batch, POS_STREAM_NAME,
+    get_firehose_client, add_name_timestamp,
+    firehose_batch, POS_STREAM_NAME,
     ROUTES_STREAM_NAME, ROUTES_SCHED_STREAM_NAME,
-    STOPS_STREAM_NAME, STOPS_SCHED_STREAM_NAME,
-    mkdir_timestamp, DATA_FIELDNAMES_MAP
+    ROUTES_SCHED_CHANGES_STREAM_NAME,
+    STOPS_STREAM_NAME, STOPS_SCHED_STREAM_NAME, INCIDENTS_STREAM_NAME,
+    INCIDENTS_STATE_FILE, mkdir_timestamp, csv_file_prefix,
+    DATA_FIELDNAMES_MAP
 )
 from wmata import (
     get_bus_position, get_routes, get_schedule,
     get_stops, get_stop_schedule, get_route_ids,
     get_stop_ids, flatten_route_sched_data,
-    get_path_details, flatten_path_details_data
+    get_path_details, flatten_path_details_data, get_incidents,
+    set_api_host, set_api_key_section
+)
+from metrics import (
+    FLATTEN_LATENCY, SINK_LATENCY, ROWS,
+    write_prometheus, serve as serve_metrics
+)
+from positions import PositionBatch
+from ratelimit import RATE_LIMITER
+from tracing import (
+    span, enable as enable_tracing, disable as disable_tracing, profile
+)
+from position_store import PositionStore
+from rollups import PositionRollup
+from fanout import PositionFanout, serve as serve_fanout
+from bunching import BunchingDetector
+from dedup import fresh, enable as enable_dedup, enabled as dedup_enabled
+from shapes import compact_path_shapes
+from incidents import IncidentTracker
+from schedule_diff import diff_schedules, latest_schedule_file, read_schedule
+from workqueue import WorkQueue, worker_name
+from flatten_pool import (
+    Output, make_pool, route_sched_outputs, path_details_outputs
+)
+from compression import (
+    SUFFIXES, codec_for, open_text, firehose_records, record_batches
+)
+from coerce import (
+    coerce_rows, typed, enable as enable_coercion, enabled as coercion_enabled
 )
-AWS_FIREHOSE_CLIENT = get_aws_session().client('firehose')
 
 
 def _send_to_firehose(json_data: str, data_name: str, stream_name: str, verbose=False):
-    if len(json_data) > 1024000:
-        # send json_data in chunks of 1000000 bytes or less
-        start = 0
-        end = 1000000
-        chunk_batch = list()
-        while True:
-            chunk_batch.append({'Data': json_data[start:end]})
-            start = end
-            end += 1000000
-            if end >= len(json_data):
-                end = len(json_data) + 1
-                chunk_batch.append({'Data': json_data[start:end] + '\n'})
-                firehose_batch(
-                    client=AWS_FIREHOSE_CLIENT, data_name=data_name,
-                    stream_name=stream_name, records=chunk_batch, verbose=verbose
-                )
-                break
-    else:
-        record = {'Data': json_data + '\n'}
-        firehose_put(
-            client=AWS_FIREHOSE_CLIENT, data_name=data_name,
-            stream_name=stream_name, record=record, verbose=verbose
+    _send_lines([json_data.encode() + b'\n'], data_name, stream_name, verbose)
+
+
+def _send_lines(lines, data_name: str, stream_name: str, verbose=False) -> None:
+    """Send JSON lines to firehose, aggregated into as few records as fit
+    and compressed per the data type's firehose codec."""
+    for records in record_batches(firehose_records(lines, data_name)):
+        firehose_batch(
+            client=get_firehose_client(), data_name=data_name,
+            stream_name=stream_name, records=records, verbose=verbose
         )
 
 
-def _save_csv(data, api_type: str, path_level=2, custom: str = ''):
-    if custom:
-        custom = ''.join(e for e in custom if e.isalnum())  # rm spec chars
-        file_name = '_'.join([
-            api_type, custom, datetime.now().strftime('%m-%d-%Y_%H-%M-%S')
-        ]) + '.csv'
-    else:
-        file_name = '_'.join([
-            api_type, datetime.now().strftime('%m-%d-%Y_%H-%M-%S')
-        ]) + '.csv'
+def _csv_path(api_type: str, path_level=2, custom: str = '', date: str = '') -> str:
+    codec, _ = codec_for(api_type)
+    file_name = csv_file_prefix(api_type, custom) + datetime.now().strftime(
+        '%m-%d-%Y_%H-%M-%S'
+    ) + '.csv' + SUFFIXES[codec]
+    # historical data is partitioned by its date rather than fetch time
     path = mkdir_timestamp(
-        data_type=api_type, level=path_level
+        data_type=api_type, level=path_level,
+        timestamp=datetime.strptime(date, '%Y-%m-%d') if date else None
     )
-    path = os.path.join(path, file_name)
-    with open(path, mode='w', newline='') as csv:
+    return os.path.join(path, file_name)
+
+
+def _save_csv(data, api_type: str, path_level=2, custom: str = '', date: str = ''):
+    codec, level = codec_for(api_type)
+    path = _csv_path(api_type, path_level, custom, date)
+    file_name = os.path.basename(path)
+    with span('save', data_name=api_type, path=path) as s, \
+            SINK_LATENCY.time(sink='csv', data_name=api_type), \
+            open_text(path, 'w', codec, level) as csv:
         writer = DictWriter(
             csv, fieldnames=DATA_FIELDNAMES_MAP[api_type]
         )
         writer.writeheader()
-        writer.writerows(data)
+        # data may be a generator, zip with a counter to count rows written
+        counter = count()
+        writer.writerows(row for row, _ in zip(data, counter))
+        rows = next(counter)
+        s.set(rows=rows)
         print('\t[{}]: saved!'.format(file_name))
+    ROWS.inc(rows, data_name=api_type)
+
+
+def _save_output(
+        output: Output, api_type: str, path_level=2, custom: str = '', date: str = ''
+):
+    """Write csv file contents serialized by a flatten_pool worker."""
+    path = _csv_path(api_type, path_level, custom, date)
+    with span('save', data_name=api_type, path=path, rows=output.rows), \
+            SINK_LATENCY.time(sink='csv', data_name=api_type), \
+            open(path, mode='wb') as f:
+        f.write(output.data)
+        print('\t[{}]: saved!'.format(os.path.basename(path)))
+    ROWS.inc(output.rows, data_name=api_type)
+
 
+# pool results waiting to be saved, per process, before fetching more
+PENDING_PER_PROCESS = 2
 
-def fetch_bus_positions(verbose=False) -> None:
+
+def _drain(pending: deque, limit: int, save) -> None:
+    """Save results of the oldest pending pool futures until at most limit
+    are left, bounding the responses held in memory."""
+    while len(pending) > limit:
+        route_id, future = pending.popleft()
+        save(route_id, future.result())
+
+
+def fetch_bus_positions(
+        to_firehose=True, verbose=False, to_csv=False
+) -> PositionBatch:
     """Extract bus_position data and load to S3 via firehose.
 
     Args:
+        to_firehose (bool): send data to aws_firehose.
         verbose (bool): if True, print firehose response element.
+        to_csv (bool): save local as csv, partitioned by hour.
+
+    Returns:
+        PositionBatch holding the fetched bus positions.
     """
     data_name = 'bus_positions'
-    resp = get_bus_position()
-
-    # iterate BusPositions elements and stream to firehose
-    # TODO: add to_csv option
-    records = list()
-    for bus_pos in resp.json()['BusPositions']:
-        records.append({'Data': json.dumps(bus_pos) + '\n'})
-        if len(records) == 400:
-            firehose_batch(
-                client=AWS_FIREHOSE_CLIENT, data_name=data_name,
-                stream_name=POS_STREAM_NAME, records=records, verbose=verbose
-            )
-            records = list()  # reset records for next batch
-    else:
-        firehose_batch(
-            client=AWS_FIREHOSE_CLIENT, data_name=data_name,
-            stream_name=POS_STREAM_NAME, records=records, verbose=verbose
+    with span('fetch', data_name=data_name) as s:
+        resp = get_bus_position()
+        s.set(status=resp.status_code, bytes=len(resp.content))
+    with span('decode', data_name=data_name) as s:
+        records = decode(resp)['BusPositions']
+        if coercion_enabled():
+            records = coerce_rows(data_name, records)
+            batch = PositionBatch.from_typed(records)
+        else:
+            batch = PositionBatch.from_records(records)
+        s.set(rows=len(batch))
+    # sinks get the BusPositions elements as fetched, or their coerced rows
+    # formatted back to the at-rest strings, rather than records rebuilt from
+    # the batch; listeners get the batch's typed columns
+    with fresh(data_name, records) as new_records:
+        if to_csv:
+            _save_csv(data=new_records, api_type=data_name, path_level=4)
+        if to_firehose:
+            # encode BusPositions elements as JSON lines and stream to firehose
+            with span('firehose', data_name=data_name, rows=len(new_records)):
+                lines = [dumps(bus_pos) + b'\n' for bus_pos in new_records]
+                _send_lines(lines, data_name, POS_STREAM_NAME, verbose=verbose)
+            ROWS.inc(len(new_records), data_name=data_name)
+    return batch
+
+
+def watch_bus_positions(
+        interval=10, iterations=0, listeners=(), to_firehose=True, verbose=False,
+        to_csv=False
+) -> None:
+    """Poll bus positions and hand each PositionBatch to listeners.
+
+    Args:
+        interval (int): seconds between polls; WMATA refreshes positions
+            approximately every 7 to 10 seconds.
+        iterations (int): number of polls, runs forever if 0.
+        listeners (list): callables receiving each PositionBatch, e.g.
+            position_store.PositionStore.
+        to_firehose (bool): send data to aws_firehose.
+        verbose (bool): if True, print firehose response element.
+        to_csv (bool): save each poll local as csv.
+    """
+    i = 0
+    while not iterations or i < iterations:
+        started = monotonic()
+        batch = fetch_bus_positions(
+            to_firehose=to_firehose, verbose=verbose, to_csv=to_csv
         )
+        for listener in listeners:
+            try:
+                listener(batch)
+            except Exception as e:  # keep polling if a consumer fails
+                print(f'[bus_positions] listener {listener} failed: {e}')
+        i += 1
+        if not iterations or i < iterations:
+            sleep(max(0.0, interval - (monotonic() - started)))
 
 
 def fetch_routes(
-        to_csv=True, to_firehose=False, get_sched=True, get_path=True, verbose=False
+        to_csv=True, to_firehose=False, get_sched=True, get_path=True,
+        verbose=False, queue=None, date='', diff=False, pool=None,
+        full_shapes=False
 ) -> None:
     """Fetch routes data.
 
@@ -112,59 +211,158 @@ def fetch_routes(
         get_sched (bool): fetch bus stop schedules.
         get_path (bool): fetch path details for each route.
         verbose (bool): if True, print firehose response element.
+        queue (WorkQueue): Optional; enqueue schedule and path details
+            fetches for workers instead of fetching them.
+        date (str): Date in YYYY-MM-DD format of schedules and path
+            details. Defaults to today's date unless specified.
+        diff (bool): also emit schedule changes since the previous fetch.
+        pool (ProcessPoolExecutor): Optional; flatten schedules and path
+            details in worker processes.
+        full_shapes (bool): save path shapes as path_details_shapes rows,
+            see fetch_path_details.
     """
     data_name = 'routes'
     resp = get_routes()
+    resp_json = decode(resp)
+    route_ids = get_route_ids(resp_json)
     if to_csv:
-        _save_csv(data=resp.json()['Routes'], api_type=data_name)
+        _save_csv(data=typed(data_name, resp_json['Routes']), api_type=data_name)
 
     if to_firehose:  # TODO: see bus_positions to complete
-        data = add_name_timestamp(resp_data=resp.json(), data_name=data_name)
+        data = add_name_timestamp(resp_data=dict(resp_json), data_name=data_name)
         raise NotImplementedError
 
     if get_sched:
-        route_ids = get_route_ids(resp.json())
         fetch_route_sched(
-            route_ids=route_ids, to_csv=to_csv,
-            to_firehose=to_firehose, verbose=verbose
+            route_ids=route_ids, date=date, to_csv=to_csv,
+            to_firehose=to_firehose, verbose=verbose, queue=queue, diff=diff,
+            pool=pool
         )
 
     if get_path:
-        route_ids = get_route_ids(resp.json())
         fetch_path_details(
-            route_ids=route_ids, to_csv=to_csv,
-            to_firehose=to_firehose, verbose=verbose
+            route_ids=route_ids, date=date, to_csv=to_csv,
+            to_firehose=to_firehose, verbose=verbose, queue=queue, pool=pool,
+            full_shapes=full_shapes
         )
 
 
 def fetch_route_sched(
-        route_ids: list, to_csv=True, to_firehose=False, verbose=False
+        route_ids: list, date='', to_csv=True, to_firehose=False,
+        verbose=False, queue=None, diff=False, pool=None
 ) -> None:
     """Fetch route schedules data.
 
         Args:
             route_ids (list): route ids to fetch.
+            date (str): Date in YYYY-MM-DD format for which to retrieve
+                schedules. Defaults to today's date unless specified.
             to_csv (bool): save local as csv.
             to_firehose (bool): send data to aws_firehose.
             verbose (bool): if True, print firehose response element.
+            queue (WorkQueue): Optional; enqueue route ids for workers
+                instead of fetching them.
+            diff (bool): compare with the previously saved schedule of
+                each route and save the changes as route_sched_changes csv
+                and, if to_firehose, send them instead of the schedule.
+            pool (ProcessPoolExecutor): Optional; decode, flatten and
+                serialize responses in flatten_pool worker processes while
+                fetching the next routes.
         """
     data_name = 'route_scheds'
-    for i, route_id in enumerate(route_ids):
-        resp = get_schedule(route_id)
-        print(f'Route id: {route_id}, size: {len(resp.content)}')
-        data = flatten_route_sched_data(resp_json=resp.json())
-        if to_csv:
-            _save_csv(
-                data=data, api_type=data_name, path_level=3, custom=route_id
-            )
+    if queue is not None:
+        added = queue.enqueue(data_name, route_ids, date)
+        print(f'[{data_name}] queued {added} of {len(route_ids)} routes')
+        return
+
+    def save_changes(route_id: str, changes: list) -> None:
+        print(f'Route id: {route_id}, changes: {len(changes)}')
+        with fresh('route_sched_changes', changes) as changes:
+            if to_csv:
+                _save_csv(
+                    data=changes, api_type='route_sched_changes',
+                    path_level=3, custom=route_id, date=date
+                )
+            if to_firehose and changes:
+                _send_sched_changes(
+                    [dumps(change) + b'\n' for change in changes], route_id,
+                    verbose=verbose
+                )
 
-        if to_firehose:
+    def save(route_id: str, outputs: dict) -> None:
+        for api_type, output in outputs.items():
+            if api_type == 'route_sched_changes' and dedup_enabled():
+                save_changes(route_id, [
+                    loads(line) for line in output.lines.splitlines()
+                ])
+                continue
+            if api_type == 'route_sched_changes':
+                print(f'Route id: {route_id}, changes: {output.rows}')
+                if to_firehose and output.rows:
+                    _send_sched_changes(
+                        output.lines.splitlines(keepends=True), route_id,
+                        verbose=verbose
+                    )
+            if to_csv:
+                _save_output(
+                    output, api_type, path_level=3, custom=route_id, date=date
+                )
+        if to_firehose and not diff:
             raise NotImplementedError
-        sleep(1/10)  # Per API specs 10 calls/second limit
+
+    pending = deque()  # (route id, future) submitted to pool
+    for i, route_id in enumerate(route_ids):
+        with span('route', data_name=data_name, route_id=route_id):
+            with span('fetch', route_id=route_id) as s:
+                resp = get_schedule(route_id, date)
+                s.set(status=resp.status_code, bytes=len(resp.content))
+            print(f'Route id: {route_id}, size: {len(resp.content)}')
+            if pool is not None:
+                pending.append((route_id, pool.submit(
+                    route_sched_outputs, resp.content, route_id, date, diff,
+                    coercion_enabled()
+                )))
+                _drain(pending, PENDING_PER_PROCESS * (os.cpu_count() or 1), save)
+                continue
+            with span('decode', route_id=route_id):
+                resp_json = decode(resp)
+            with span('flatten', route_id=route_id) as s, \
+                    FLATTEN_LATENCY.time(data_name=data_name):
+                data = typed(data_name, flatten_route_sched_data(resp_json=resp_json))
+                s.set(rows=len(data))
+            if diff:  # before saving, so the latest csv is the previous one
+                with span('diff', route_id=route_id) as s:
+                    previous = latest_schedule_file(
+                        csv_file_prefix(data_name, route_id), date
+                    )
+                    changes = diff_schedules(
+                        read_schedule(previous) if previous else [], data
+                    )
+                    s.set(changes=len(changes))
+                save_changes(route_id, changes)
+            if to_csv:
+                _save_csv(
+                    data=data, api_type=data_name, path_level=3,
+                    custom=route_id, date=date
+                )
+
+            if to_firehose and not diff:
+                raise NotImplementedError
+    _drain(pending, 0, save)
+
+
+def _send_sched_changes(lines: list, route_id: str, verbose=False) -> None:
+    data_name = 'route_sched_changes'
+    with span('firehose', data_name=data_name, route_id=route_id):
+        _send_lines(
+            lines, data_name, ROUTES_SCHED_CHANGES_STREAM_NAME, verbose=verbose
+        )
+    ROWS.inc(len(lines), data_name=data_name)
 
 
 def fetch_stops(
-        to_csv=True, to_firehose=False, get_sched=False, verbose=False
+        to_csv=True, to_firehose=False, get_sched=False, verbose=False,
+        queue=None, date=''
 ) -> None:
     """Fetch stops data.
 
@@ -173,53 +371,69 @@ def fetch_stops(
         to_firehose (bool): send data to aws_firehose.
         get_sched (bool): fetch bus stop schedule.
         verbose (bool): if True, print firehose response element.
+        queue (WorkQueue): Optional; passed on to fetch_stop_scheds.
+        date (str): Date in YYYY-MM-DD format of stop schedules. Defaults
+            to today's date unless specified.
     """
     data_name = 'stops'
     resp = get_stops()
     if to_csv:
-        _save_csv(data=resp.json()['Stops'], api_type=data_name)
+        if get_sched or to_firehose:
+            stops = decode(resp)['Stops']
+        else:  # only csv needed, stream rows instead of decoding it whole
+            stops = iter_array(resp, 'Stops')
+        _save_csv(data=typed(data_name, stops), api_type=data_name)
 
     if to_firehose:  # TODO: see bus_positions to complete
-        data = add_name_timestamp(resp_data=resp.json(), data_name=data_name)
+        data = add_name_timestamp(resp_data=dict(decode(resp)), data_name=data_name)
         raise NotImplementedError
 
     if get_sched:
-        stop_ids = get_stop_ids(resp.json())
+        stop_ids = get_stop_ids(decode(resp))
         fetch_stop_scheds(
-            stop_ids=stop_ids, to_csv=to_csv,
-            to_firehose=to_firehose, verbose=verbose
+            stop_ids=stop_ids, date=date, to_csv=to_csv,
+            to_firehose=to_firehose, verbose=verbose, queue=queue
         )
 
 
 # TODO: Not fully implemented
 def fetch_stop_scheds(
-        stop_ids: list, to_csv=True, to_firehose=False, verbose=False
+        stop_ids: list, date='', to_csv=True, to_firehose=False,
+        verbose=False, queue=None
 ) -> None:
     """Fetch stop schedules data.
 
         Args:
             stop_ids (list): stop ids to fetch.
+            date (str): Date in YYYY-MM-DD format for which to retrieve
+                schedules. Defaults to today's date unless specified.
             to_csv (bool): save local as csv.
             to_firehose (bool): send data to aws_firehose.
             verbose (bool): if True, print firehose response element.
+            queue (WorkQueue): Optional; nothing is queued, workers can't
+                fetch stop schedules until they are implemented.
         """
     data_name = 'stop_schedules'
+    if queue is not None:
+        print(f'[{data_name}] not queued, stop schedules aren\'t implemented yet')
+        return
+
     for i, stop_id in enumerate(stop_ids):
-        resp = get_stop_schedule(stop_id)
+        resp = get_stop_schedule(stop_id, date)
         print(f'Stop id: {stop_id}, size: {len(resp.content)}')
         if to_csv:
             raise NotImplementedError
 
         if to_firehose:  # TODO: see bus_positions to complete
             sched_data = add_name_timestamp(
-                resp_data=resp.json(), data_name=data_name
+                resp_data=dict(decode(resp)), data_name=data_name
             )
             raise NotImplementedError
-        sleep(1/10)  # Per API specs 10 calls/second limit
 
 
 def fetch_path_details(
-        route_ids: list, date='', to_csv=True, to_firehose=False, verbose=False
+        route_ids: list, date='', to_csv=True, to_firehose=False,
+        verbose=False, queue=None, full_shapes=False, pool=None
 ) -> None:
     """Fetch path details data for specified routes.
 
@@ -230,37 +444,285 @@ def fetch_path_details(
             to_csv (bool): save local as csv.
             to_firehose (bool): send data to aws_firehose.
             verbose (bool): if True, print firehose response element.
+            queue (WorkQueue): Optional; enqueue route ids for workers
+                instead of fetching them.
+            full_shapes (bool): save every shape point as a
+                path_details_shapes row instead of storing each shape once
+                as an encoded polyline referenced by a shape_map row.
+            pool (ProcessPoolExecutor): Optional; decode, flatten and
+                serialize responses in flatten_pool worker processes while
+                fetching the next routes.
         """
-    for i, route_id in enumerate(route_ids):
-        resp = get_path_details(route_id, date)
-        print(f'Route id: {route_id}, size: {len(resp.content)}')
-        flat_data = flatten_path_details_data(resp_json=resp.json())
-        for data_name, data in flat_data.items():
+    if queue is not None:
+        added = queue.enqueue('path_details', route_ids, date)
+        print(f'[path_details] queued {added} of {len(route_ids)} routes')
+        return
+
+    def save(route_id: str, outputs: dict) -> None:
+        for api_type, output in outputs.items():
             if to_csv:
-                _save_csv(
-                    data=data, api_type=data_name, path_level=3, custom=route_id
+                _save_output(
+                    output, api_type, path_level=3, custom=route_id, date=date
                 )
-
             if to_firehose:
                 raise NotImplementedError
-        sleep(1/10)  # Per API specs 10 calls/second limit
 
+    pending = deque()  # (route id, future) submitted to pool
+    for i, route_id in enumerate(route_ids):
+        with span('route', data_name='path_details', route_id=route_id):
+            with span('fetch', route_id=route_id) as s:
+                resp = get_path_details(route_id, date)
+                s.set(status=resp.status_code, bytes=len(resp.content))
+            print(f'Route id: {route_id}, size: {len(resp.content)}')
+            if pool is not None:
+                pending.append((route_id, pool.submit(
+                    path_details_outputs, resp.content, full_shapes,
+                    coercion_enabled()
+                )))
+                _drain(pending, PENDING_PER_PROCESS * (os.cpu_count() or 1), save)
+                continue
+            with span('decode', route_id=route_id):
+                resp_json = decode(resp)
+            with span('flatten', route_id=route_id), \
+                    FLATTEN_LATENCY.time(data_name='path_details'):
+                flat_data = flatten_path_details_data(
+                    resp_json=resp_json, shapes=full_shapes
+                )
+            if not full_shapes:
+                with span('shapes', route_id=route_id):
+                    flat_data['shape_map'] = compact_path_shapes(resp_json)
+            for data_name, data in flat_data.items():
+                data = typed(data_name, data)
+                if to_csv:
+                    _save_csv(
+                        data=data, api_type=data_name, path_level=3,
+                        custom=route_id, date=date
+                    )
+
+                if to_firehose:
+                    raise NotImplementedError
+    _drain(pending, 0, save)
+
+
+def fetch_incidents(
+        to_csv=True, to_firehose=False, verbose=False, tracker=None
+) -> list:
+    """Fetch bus incidents.
 
-def extract(data, sched, nocsv, date, firehose, verbose, path):
-    if data == 'positions':
-        fetch_bus_positions(verbose)
+    Args:
+        to_csv (bool): save local as csv.
+        to_firehose (bool): send data to aws_firehose.
+        verbose (bool): if True, print firehose response element.
+        tracker (IncidentTracker): Optional; only save and send incidents
+            that are new, updated or cleared since the tracker's last poll,
+            as incident_changes, instead of the full incidents list.
+
+    Returns:
+        The incidents saved, or their changes if tracker is given.
+    """
+    with span('fetch', data_name='incidents') as s:
+        resp = get_incidents()
+        s.set(status=resp.status_code, bytes=len(resp.content))
+    if tracker is None:
+        data_name = 'incidents'
+        data = typed(data_name, decode(resp)['BusIncidents'])
+    else:
+        data_name = 'incident_changes'
+        with span('diff', data_name=data_name) as s:
+            data = tracker.update(resp)
+            s.set(changes=len(data))
+        if not data:  # nothing changed since the last poll
+            return data
+        data = typed(data_name, data)
+    print(f'[{data_name}] {len(data)} incidents')
+
+    with fresh(data_name, data) as new_data:
+        if to_csv:
+            _save_csv(data=new_data, api_type=data_name, path_level=3)
+
+        if to_firehose:
+            lines = [dumps(incident) + b'\n' for incident in new_data]
+            with span('firehose', data_name=data_name, rows=len(lines)):
+                _send_lines(lines, data_name, INCIDENTS_STREAM_NAME, verbose=verbose)
+            ROWS.inc(len(lines), data_name=data_name)
+    return data
+
+
+def watch_incidents(
+        interval=60, iterations=0, state_file=INCIDENTS_STATE_FILE,
+        to_csv=True, to_firehose=False, verbose=False
+) -> None:
+    """Poll bus incidents, saving only new, updated and cleared ones.
+
+    Args:
+        interval (int): seconds between polls.
+        iterations (int): number of polls, runs forever if 0.
+        state_file (str): file keeping incident state between runs.
+        to_csv (bool): save local as csv.
+        to_firehose (bool): send data to aws_firehose.
+        verbose (bool): if True, print firehose response element.
+    """
+    tracker = IncidentTracker(state_file)
+    i = 0
+    while not iterations or i < iterations:
+        started = monotonic()
+        fetch_incidents(
+            to_csv=to_csv, to_firehose=to_firehose, verbose=verbose,
+            tracker=tracker
+        )
+        i += 1
+        if not iterations or i < iterations:
+            sleep(max(0.0, interval - (monotonic() - started)))
+
+
+# work queue task kind -> fetch function taking a single item id
+TASK_FETCHERS = {
+    'route_scheds': lambda item_id, date, **kw: fetch_route_sched([item_id], date, **kw),
+    'path_details': lambda item_id, date, **kw: fetch_path_details([item_id], date, **kw)
+}
+
+
+def run_worker(
+        queue: WorkQueue, owner: str = None, lease: float = 300, wait: float = 0,
+        to_csv=True, to_firehose=False, verbose=False
+) -> int:
+    """Claim and run queued fetches until the queue is empty.
+
+    Args:
+        queue (WorkQueue): queue shared with producers and other workers.
+        owner (str): Optional; worker name, defaults to host and pid.
+        lease (float): seconds a claimed task is reserved for this worker.
+        wait (float): if non-zero, poll for new tasks every wait seconds
+            instead of exiting once the queue is empty.
+        to_csv (bool): save local as csv.
+        to_firehose (bool): send data to aws_firehose.
+        verbose (bool): if True, print firehose response element.
+
+    Returns:
+        Number of tasks completed.
+    """
+    owner = owner or worker_name()
+    done = 0
+    while True:
+        task = queue.claim(owner, lease=lease, kinds=list(TASK_FETCHERS))
+        if task is None:
+            if not wait:
+                break
+            sleep(wait)
+            continue
+
+        try:
+            TASK_FETCHERS[task.kind](
+                task.item_id, task.date, to_csv=to_csv,
+                to_firehose=to_firehose, verbose=verbose
+            )
+        except Exception as e:
+            print(f'[worker {owner}] {task.kind} {task.item_id} failed: {e!r}')
+            queue.fail(task, owner, repr(e))
+            continue
+        if queue.complete(task, owner):
+            done += 1
+        else:
+            print(f'[worker {owner}] lease on {task.kind} {task.item_id} expired')
+    print(f'[worker {owner}] completed {done} tasks, queue: {queue.counts()}')
+    return done
+
+
+def extract(
+        data, sched, nocsv, date, firehose, verbose, path, interval, api_host,
+        metrics_file, metrics_port, trace, profile_file, queue, key_section,
+        rate_limit, diff, coerce, processes, fanout_port, dedup, bunching,
+        position_csv, full_shapes
+):
+    if api_host:
+        set_api_host(api_host)
+    if key_section:
+        set_api_key_section(key_section)
+    if rate_limit:
+        RATE_LIMITER.configure(rate=rate_limit)
+    if queue:
+        queue = WorkQueue(queue)
+    if metrics_port:
+        serve_metrics(metrics_port)
+    if trace:
+        enable_tracing(trace)
+    if coerce:
+        enable_coercion()
+    if dedup:
+        enable_dedup()
+    pool = make_pool(processes) if processes else None
+    try:
+        if profile_file:
+            with profile(profile_file):
+                _extract(
+                    data, sched, nocsv, date, firehose, verbose, path,
+                    interval, queue, diff, pool, fanout_port, bunching,
+                    position_csv, full_shapes
+                )
+        else:
+            _extract(
+                data, sched, nocsv, date, firehose, verbose, path,
+                interval, queue, diff, pool, fanout_port, bunching,
+                position_csv, full_shapes
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if metrics_file:
+            write_prometheus(metrics_file)
+        if trace:
+            disable_tracing()
+
+
+def _extract(
+        data, sched, nocsv, date, firehose, verbose, path, interval, queue,
+        diff=False, pool=None, fanout_port=None, bunching=False,
+        position_csv=False, full_shapes=False
+):
+    if data == 'position':
+        if interval:
+            listeners = [PositionRollup()]
+            if fanout_port:  # the fanout server also serves store history
+                fanout, store = PositionFanout(), PositionStore()
+                serve_fanout(fanout, fanout_port, store=store)
+                listeners += [store, fanout]
+            if bunching:
+                listeners.append(BunchingDetector())
+            watch_bus_positions(
+                interval=interval, listeners=listeners,
+                verbose=verbose, to_csv=position_csv
+            )
+        else:
+            fetch_bus_positions(
+                to_firehose=True, verbose=verbose, to_csv=position_csv
+            )
 
     if data == 'routes':
         fetch_routes(
             to_csv=nocsv, to_firehose=firehose,
             get_sched=sched, get_path=path,
-            verbose=verbose
+            verbose=verbose, queue=queue, date=date, diff=diff, pool=pool,
+            full_shapes=full_shapes
         )
 
     if data == 'stops':
         fetch_stops(
             to_csv=nocsv, to_firehose=firehose,
-            get_sched=sched, verbose=verbose
+            get_sched=sched, verbose=verbose, queue=queue, date=date
+        )
+
+    if data == 'incidents':
+        watch_incidents(
+            interval=interval, iterations=0 if interval else 1,
+            to_csv=nocsv, to_firehose=firehose, verbose=verbose
+        )
+
+    if data == 'worker':
+        if queue is None:
+            raise ValueError('worker requires --queue')
+        run_worker(
+            queue, wait=interval, to_csv=nocsv,
+            to_firehose=firehose, verbose=verbose
         )
 
 
@@ -269,8 +731,8 @@ if __name__ == '__main__':
         description='Fetch data from WMATA API.'
     )
     arg_parser.add_argument(
-        'data', choices=['position', 'routes', 'stops'],
-        help='The data to be fetched and saved.'
+        'data', choices=['position', 'routes', 'stops', 'incidents', 'worker'],
+        help='The data to be fetched and saved, or worker to run queued fetches.'
     )
     arg_parser.add_argument(
         '--sched', action='store_true',
@@ -280,6 +742,46 @@ if __name__ == '__main__':
         '--path', action='store_true',
         help='Get path details, if routes data fetched.'
     )
+    arg_parser.add_argument(
+        '--full-shapes', action='store_true',
+        help='Save every path shape point as path_details_shapes rows, if '
+             'path details fetched, instead of each shape once as a polyline.'
+    )
+    arg_parser.add_argument(
+        '--diff', action='store_true',
+        help='Save route schedule changes since the previous fetch.'
+    )
+    arg_parser.add_argument(
+        '--coerce', action='store_true',
+        help='Convert fetched values to native types once, quarantining '
+             'malformed rows to data/quarantine.'
+    )
+    arg_parser.add_argument(
+        '--dedup', action='store_true',
+        help='Drop positions, incidents and schedule changes already '
+             'delivered within the data type\'s dedup window.'
+    )
+    arg_parser.add_argument(
+        '--bunching', action='store_true',
+        help='Detect bunched and gapped buses on every poll, when polling '
+             'positions with --interval.'
+    )
+    arg_parser.add_argument(
+        '--fanout-port', type=int,
+        help='Stream live position deltas to subscribers, and serve recent '
+             'position history, on this port when polling positions with '
+             '--interval.'
+    )
+    arg_parser.add_argument(
+        '--processes', type=int, nargs='?', const=os.cpu_count(),
+        help='Decode and flatten route schedules and path details in '
+             'PROCESSES worker processes, all cores if no number is given.'
+    )
+    arg_parser.add_argument(
+        '--csv', action='store_true', dest='position_csv',
+        help='Also save positions to hourly csv files, if position data '
+             'fetched; positions are only sent to Firehose otherwise.'
+    )
     arg_parser.add_argument(
         '--nocsv', action='store_false',
         help='Don\'t save data to csv file.'
@@ -289,10 +791,48 @@ if __name__ == '__main__':
         default=datetime.today().strftime('%Y-%m-%d'),
         help='Date in YYYY-MM-DD format, for fetching historical schedules data.'
     )
+    arg_parser.add_argument(
+        '--interval', type=int, default=0,
+        help='Keep polling positions or incidents, or a worker\'s queue, '
+             'every INTERVAL seconds.'
+    )
+    arg_parser.add_argument(
+        '--queue',
+        help='Work queue database; routes enqueues schedule and path '
+             'fetches into it and worker runs them.'
+    )
+    arg_parser.add_argument(
+        '--key-section',
+        help='config.ini section holding this process\'s WMATA api keys.'
+    )
+    arg_parser.add_argument(
+        '--rate-limit', type=float,
+        help='WMATA API calls/second budget of this process.'
+    )
     arg_parser.add_argument(
         '--firehose', action='store_true',
         help='Send fetched data to AWS Firehose.'
     )
+    arg_parser.add_argument(
+        '--api-host',
+        help='Use another WMATA API host, e.g. http://127.0.0.1:8000 simulator.'
+    )
+    arg_parser.add_argument(
+        '--metrics-file',
+        help='Write Prometheus format metrics to file when done.'
+    )
+    arg_parser.add_argument(
+        '--metrics-port', type=int,
+        help='Serve Prometheus format metrics on localhost:PORT/metrics.'
+    )
+    arg_parser.add_argument(
+        '--trace',
+        help='Write tracing spans of each stage to file as JSON lines.'
+    )
+    arg_parser.add_argument(
+        '--profile', dest='profile_file',
+        help='Sample CPU stacks and write a hot spot summary to file.'
+    )
     arg_parser.add_argument(
         '-v', '--verbose', action='store_true',
         help='if True print firehose response.',
@@ -0,0 +1,269 @@
+"""
+fanout.py
+---------
+
+Live bus position fan-out to subscribers over Server-Sent Events.
+
+PositionFanout is a positions listener of extract.watch_bus_positions.
+Each poll it compares the positions with the previous poll and publishes
+only the vehicles with a new DateTime, and the vehicles no longer
+reported, to every subscriber. Each changed position is JSON encoded once
+and shared by all subscribers. Subscribers filter by RouteID list and/or a
+bounding box on the server. When a vehicle leaves a subscriber's filter, it
+is sent as removed.
+
+    python extract.py position --interval 10 --fanout-port 8090
+    curl -N 'localhost:8090/positions?routes=70,79'
+    curl -N 'localhost:8090/positions?bbox=38.88,-77.05,38.92,-76.99'
+
+Clients first receive a snapshot event with the matching vehicles, then a
+delta event per poll:
+
+    event: delta
+    data: {"time": "2021-08-10T10:20:42", "positions": [...], "removed": ["7001"]}
+
+A subscriber whose client can't keep up with max_queued events is
+disconnected, and a reconnect starts over with a snapshot.
+
+The server also answers history queries from a position_store.PositionStore
+fed by the same polls, e.g. the last 10 minutes of a vehicle or route:
+
+    curl 'localhost:8090/history?vehicle=7001&minutes=10'
+    curl 'localhost:8090/history?route=70&minutes=10'
+"""
+# built-in modules
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from math import isfinite
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from urllib.parse import urlparse, parse_qs
+
+# project modules
+from codec import dumps
+from position_store import PositionStore
+from positions import PositionBatch, MISSING_TIME
+from utils import from_epoch
+
+
+class Subscription:
+    """A subscriber's filters, pending events and the vehicles it was sent.
+
+    Args:
+        routes (list): Optional; RouteIDs to receive, defaults to all.
+        bbox (tuple): Optional; (min lat, min lon, max lat, max lon).
+        max_queued (int): events buffered before the subscriber is dropped.
+    """
+
+    def __init__(self, routes=None, bbox=None, max_queued: int = 100):
+        self.routes = set(routes) if routes else None
+        self.bbox = bbox
+        self.queue = Queue(max_queued)
+        self.visible = set()  # VehicleIDs the subscriber currently holds
+        self.closed = False
+
+    def matches(self, route: str, lat: float, lon: float) -> bool:
+        if self.routes is not None and route not in self.routes:
+            return False
+        if self.bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+        return True
+
+    def push(self, event: str, payload: bytes) -> bool:
+        """Queue an SSE message, returns False once the subscriber is dropped."""
+        try:
+            self.queue.put_nowait(
+                b'event: ' + event.encode() + b'\ndata: ' + payload + b'\n\n'
+            )
+        except Full:
+            self.closed = True
+        return not self.closed
+
+
+def _payload(time: str, positions: list, removed: list = None) -> bytes:
+    parts = [
+        b'{"time": ', dumps(time), b', "positions": [', b', '.join(positions), b']'
+    ]
+    if removed is not None:
+        parts += [b', "removed": ', dumps(removed)]
+    return b''.join(parts) + b'}'
+
+
+class PositionFanout:
+    """Publishes per-poll position deltas to filtered subscriptions."""
+
+    def __init__(self):
+        # VehicleID -> (DateTime epoch, RouteID, lat, lon, JSON bytes)
+        self.current = dict()
+        self.subscriptions = set()
+        self.time = ''  # DateTime of the newest position
+        self._lock = Lock()
+
+    def __call__(self, batch: PositionBatch) -> None:
+        self.publish(batch)
+
+    def publish(self, batch: PositionBatch) -> int:
+        """Send a poll's changes to subscribers, returns vehicles changed."""
+        columns = batch.columns
+        decode = batch.pool.decode
+        changed, seen = list(), set()
+        with self._lock:
+            times, lats, lons = columns['DateTime'], columns['Lat'], columns['Lon']
+            for i, (vehicle, t) in enumerate(zip(columns['VehicleID'], times)):
+                if t == MISSING_TIME:
+                    continue
+                vehicle = decode(vehicle)
+                seen.add(vehicle)
+                previous = self.current.get(vehicle)
+                if previous is not None and previous[0] == t:
+                    continue  # not updated since the last poll
+                row = batch.row(i)
+                entry = (t, row['RouteID'], lats[i], lons[i], dumps(row))
+                self.current[vehicle] = entry
+                changed.append((vehicle, entry))
+            gone = [vehicle for vehicle in self.current if vehicle not in seen]
+            for vehicle in gone:
+                del self.current[vehicle]
+            newest = max(times, default=MISSING_TIME)
+            if newest != MISSING_TIME:
+                self.time = from_epoch(newest)
+
+            for subscription in list(self.subscriptions):
+                positions, removed = list(), list()
+                for vehicle, (_, route, lat, lon, encoded) in changed:
+                    if subscription.matches(route, lat, lon):
+                        positions.append(encoded)
+                        subscription.visible.add(vehicle)
+                    elif vehicle in subscription.visible:  # left the filter
+                        removed.append(vehicle)
+                        subscription.visible.discard(vehicle)
+                for vehicle in gone:
+                    if vehicle in subscription.visible:
+                        removed.append(vehicle)
+                        subscription.visible.discard(vehicle)
+                if positions or removed:
+                    payload = _payload(self.time, positions, removed)
+                    if not subscription.push('delta', payload):
+                        self.subscriptions.discard(subscription)
+        return len(changed)
+
+    def subscribe(self, routes=None, bbox=None, max_queued: int = 100) -> Subscription:
+        """Return a subscription, queued a snapshot of the matching vehicles."""
+        subscription = Subscription(routes, bbox, max_queued)
+        with self._lock:
+            positions = list()
+            for vehicle, (_, route, lat, lon, encoded) in self.current.items():
+                if subscription.matches(route, lat, lon):
+                    positions.append(encoded)
+                    subscription.visible.add(vehicle)
+            subscription.push('snapshot', _payload(self.time, positions))
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self.subscriptions.discard(subscription)
+
+
+class FanoutServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+            self, address, fanout: PositionFanout, keepalive: float = 15,
+            store: PositionStore = None
+    ):
+        super().__init__(address, FanoutHandler)
+        self.fanout = fanout
+        self.keepalive = keepalive
+        self.store = store
+
+
+class FanoutHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/history':
+            self.history(params)
+            return
+        if url.path != '/positions':
+            self.send_error(404, f'Unknown path: {url.path}')
+            return
+        routes = [
+            route for value in params.get('routes', []) for route in value.split(',')
+            if route
+        ]
+        bbox = None
+        if 'bbox' in params:
+            try:
+                bbox = tuple(float(v) for v in params['bbox'][0].split(','))
+            except ValueError:
+                bbox = ()
+            if len(bbox) != 4:
+                self.send_error(400, 'bbox must be min_lat,min_lon,max_lat,max_lon')
+                return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        fanout = self.server.fanout
+        subscription = fanout.subscribe(routes, bbox)
+        try:
+            while not subscription.closed:
+                try:
+                    message = subscription.queue.get(timeout=self.server.keepalive)
+                except Empty:
+                    message = b': keepalive\n\n'
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away
+        finally:
+            fanout.unsubscribe(subscription)
+
+    def history(self, params: dict) -> None:
+        """Send the last minutes of positions of a vehicle or route as JSON."""
+        store = self.server.store
+        if store is None:
+            self.send_error(404, 'No position history is kept')
+            return
+        try:
+            minutes = float(params.get('minutes', ['10'])[0])
+        except ValueError:
+            self.send_error(400, 'minutes must be a number')
+            return
+        if not isfinite(minutes) or minutes < 0:  # float() accepts nan and inf
+            self.send_error(400, 'minutes must be a finite number >= 0')
+            return
+        if 'vehicle' in params:
+            rows = store.last_minutes(params['vehicle'][0], minutes)
+        elif 'route' in params:
+            rows = store.query_route(
+                params['route'][0], start=store.latest - int(minutes * 60)
+            )
+        else:
+            self.send_error(400, 'vehicle or route is required')
+            return
+
+        content = dumps({'positions': rows})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass  # one line per long lived connection isn't useful
+
+
+def serve(
+        fanout: PositionFanout, port: int, host: str = '127.0.0.1',
+        store: PositionStore = None
+) -> FanoutServer:
+    """Serve subscriptions on http://host:port/positions, and history of
+    store on /history, from a daemon thread."""
+    server = FanoutServer((host, port), fanout, store=store)
+    Thread(target=server.serve_forever, daemon=True).start()
+    print(f'[fanout] serving positions on http://{host}:{port}/positions')
+    return server
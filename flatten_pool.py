@@ -0,0 +1,97 @@
+"""
+flatten_pool.py
+---------------
+
+Decoding, flattening and csv serialization of route responses in worker
+processes.
+
+Flattening full-network jRouteSchedule and jRouteDetails responses is
+CPU-bound and holds the GIL, so one process only uses one core however
+many fetches run concurrently. With extract.py --processes, the raw
+response bytes of each route are handed to a ProcessPoolExecutor and the
+workers return, per data type, the row count and the csv file contents,
+already compressed with the data type's codec. Only bytes cross the
+process boundary, instead of pickled trees of row dicts, and the parent
+just writes them to files while it fetches the next routes.
+"""
+# built-in modules
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from csv import DictWriter
+
+# project modules
+from codec import loads, dumps_lines
+from coerce import coerce_rows
+from compression import codec_for, compress
+from schedule_diff import diff_schedules, latest_schedule_file, read_schedule
+from shapes import compact_path_shapes
+from utils import DATA_FIELDNAMES_MAP, csv_file_prefix
+from wmata import flatten_route_sched_data, flatten_path_details_data
+
+# rows (int), csv file bytes compressed per codec_for, JSON lines bytes or None
+Output = namedtuple('Output', ['rows', 'data', 'lines'])
+
+
+def make_pool(processes: int = None) -> ProcessPoolExecutor:
+    """Return a process pool, sized to the machine's cores by default."""
+    return ProcessPoolExecutor(max_workers=processes or os.cpu_count())
+
+
+def _output(api_type: str, rows, lines=False) -> Output:
+    """Serialize rows as the csv file _save_csv would write."""
+    buf = io.StringIO(newline='')
+    writer = DictWriter(buf, fieldnames=DATA_FIELDNAMES_MAP[api_type])
+    writer.writeheader()
+    rows = rows if isinstance(rows, list) else list(rows)
+    writer.writerows(rows)
+    codec, level = codec_for(api_type)
+    return Output(
+        len(rows), compress(buf.getvalue().encode('utf-8'), codec, level),
+        dumps_lines(rows) if lines else None
+    )
+
+
+def route_sched_outputs(
+        content: bytes, route_id: str, date: str = '', diff=False, coerce=False
+) -> dict:
+    """Return data type -> Output of a route schedule response.
+
+    Args:
+        content (bytes): raw jRouteSchedule response.
+        route_id (str): route of the schedule.
+        date (str): Optional; YYYY-MM-DD date of the schedule.
+        diff (bool): also return route_sched_changes since the latest saved
+            schedule of the route, with JSON lines for firehose.
+        coerce (bool): convert rows with coerce.coerce_rows first.
+    """
+    data = flatten_route_sched_data(resp_json=loads(content))
+    if coerce:
+        data = list(coerce_rows('route_scheds', data))
+    outputs = dict()
+    if diff:  # changes first, as the sequential fetch saves them
+        previous = latest_schedule_file(csv_file_prefix('route_scheds', route_id), date)
+        changes = diff_schedules(read_schedule(previous) if previous else [], data)
+        outputs['route_sched_changes'] = _output('route_sched_changes', changes, lines=True)
+    outputs['route_scheds'] = _output('route_scheds', data)
+    return outputs
+
+
+def path_details_outputs(content: bytes, full_shapes=False, coerce=False) -> dict:
+    """Return data type -> Output of a path details response.
+
+    Args:
+        content (bytes): raw jRouteDetails response.
+        full_shapes (bool): return path_details_shapes rows instead of
+            storing shapes and returning shape_map rows.
+        coerce (bool): convert rows with coerce.coerce_rows first.
+    """
+    resp_json = loads(content)
+    flat_data = flatten_path_details_data(resp_json=resp_json, shapes=full_shapes)
+    if not full_shapes:
+        flat_data['shape_map'] = compact_path_shapes(resp_json)
+    return {
+        api_type: _output(api_type, coerce_rows(api_type, data) if coerce else data)
+        for api_type, data in flat_data.items()
+    }
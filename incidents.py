@@ -0,0 +1,97 @@
+"""
+incidents.py
+------------
+
+Change detection for frequently polled bus incidents.
+
+IncidentTracker remembers a hash of the last BusIncidents response and of
+each incident by IncidentID. An identical response is skipped without being
+decoded; otherwise only new, updated and cleared incidents are returned, so
+polling every few seconds doesn't re-store the same incident list. State is
+optionally persisted to a JSON file so cron runs pick up where the last
+run stopped.
+"""
+# built-in modules
+import os
+import json
+import hashlib
+
+# project modules
+from codec import decode, dumps
+
+NEW = 'new'
+UPDATED = 'updated'
+CLEARED = 'cleared'
+
+
+def _digest(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+
+class IncidentTracker:
+    """Per-IncidentID state of the incidents seen so far.
+
+    Args:
+        state_file (str): Optional; JSON file the state is loaded from and
+            saved to after each change.
+    """
+
+    def __init__(self, state_file: str = None):
+        self.state_file = state_file
+        self.response_hash = None
+        self.incidents = dict()  # IncidentID -> (hash, incident)
+        if state_file and os.path.isfile(state_file):
+            with open(state_file) as f:
+                state = json.load(f)
+            self.response_hash = state['response_hash']
+            self.incidents = {
+                k: (v['hash'], v['incident']) for k, v in state['incidents'].items()
+            }
+
+    def save(self) -> None:
+        if not self.state_file:
+            return
+        state = {
+            'response_hash': self.response_hash,
+            'incidents': {
+                k: {'hash': h, 'incident': incident}
+                for k, (h, incident) in self.incidents.items()
+            }
+        }
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        tmp_path = self.state_file + '.tmp'
+        with open(tmp_path, mode='w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_file)
+
+    def update(self, resp) -> list:
+        """Return changed incidents of a BusIncidents response.
+
+        Returns:
+            list of incident dicts with a Change element of new, updated or
+            cleared; cleared incidents hold their last seen values. Empty if
+            the response is identical to the previous one.
+        """
+        response_hash = _digest(resp.content)
+        if response_hash == self.response_hash:
+            return []
+
+        changes = list()
+        seen = dict()
+        for incident in decode(resp)['BusIncidents']:
+            incident_id = incident['IncidentID']
+            incident_hash = _digest(dumps(incident))
+            seen[incident_id] = (incident_hash, incident)
+            previous = self.incidents.get(incident_id)
+            if previous is None:
+                changes.append(dict(incident, Change=NEW))
+            elif previous[0] != incident_hash:
+                changes.append(dict(incident, Change=UPDATED))
+        for incident_id, (_, incident) in self.incidents.items():
+            if incident_id not in seen:
+                changes.append(dict(incident, Change=CLEARED))
+
+        self.response_hash = response_hash
+        self.incidents = seen
+        self.save()
+        return changes
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
-cd ~/jk-apps/wmata/
-source venv/bin/activate
-python fetch_data.py incident
+cd ~/jk-apps/bus_wmata/
+source wmata_env/bin/activate
+python extract.py incidents
@@ -0,0 +1,231 @@
+"""
+metrics.py
+----------
+
+In-process counters and histograms exported in Prometheus text format.
+
+Metrics are registered once at module level and updated from the client and
+extract pipeline; write_prometheus() dumps them to a file for the node
+exporter textfile collector and serve() exposes them on /metrics.
+"""
+# built-in modules
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from time import perf_counter
+
+# request latencies range from ~50ms to multi-second schedule payloads
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def _format_labels(label_names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [
+        '{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in zip(label_names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = dict()
+        self.lock = Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(k, '')) for k in self.label_names)
+
+    def header(self) -> list:
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type_name}'
+        ]
+
+
+class Counter(Metric):
+    """Monotonically increasing value per label set."""
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        lines = self.header()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(
+                    f'{self.name}{_format_labels(self.label_names, key)} {value}'
+                )
+        return lines
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets per label set."""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:  # [bucket counts..., +Inf count], sum
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block in seconds."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self.values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def render(self) -> list:
+        lines = self.header()
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                bounds = [str(b) for b in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.label_names, key)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        lines = list()
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, label_names=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, label_names))
+
+
+def histogram(
+        name: str, documentation: str, label_names=(), buckets=DEFAULT_BUCKETS
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, label_names, buckets))
+
+
+def write_prometheus(path: str) -> None:
+    """Atomically write all metrics to path in Prometheus text format."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='w') as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        content = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def serve(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Expose metrics on http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# metrics shared by the wmata client and extract pipeline
+REQUEST_LATENCY = histogram(
+    'wmata_request_duration_seconds', 'WMATA API request latency.', ['endpoint']
+)
+REQUESTS = counter(
+    'wmata_requests_total',
+    'WMATA API responses by status code, error if the request raised.',
+    ['endpoint', 'status']
+)
+RESPONSE_BYTES = counter(
+    'wmata_response_bytes_total', 'WMATA API response body bytes.', ['endpoint']
+)
+REQUESTS_COALESCED = counter(
+    'wmata_requests_coalesced_total',
+    'Client calls served by an identical in-flight request.', ['endpoint']
+)
+RATE_LIMIT_WAIT = counter(
+    'extract_rate_limit_wait_seconds_total',
+    'Seconds spent waiting to respect the API rate limit.', ['priority']
+)
+FLATTEN_LATENCY = histogram(
+    'extract_flatten_duration_seconds', 'Response flattening time.',
+    ['data_name']
+)
+SINK_LATENCY = histogram(
+    'extract_sink_duration_seconds', 'Time spent writing to a sink.',
+    ['sink', 'data_name']
+)
+ROWS = counter(
+    'extract_rows_total', 'Rows handed to sinks.', ['data_name']
+)
+DUPLICATES = counter(
+    'extract_duplicates_dropped_total',
+    'Rows dropped before sinks as already delivered.', ['data_name']
+)
+JOB_DURATION = histogram(
+    'scheduler_job_duration_seconds', 'Scheduled job run time.', ['job'],
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+JOB_RUNS = counter(
+    'scheduler_job_runs_total', 'Scheduled job runs by outcome.', ['job', 'status']
+)
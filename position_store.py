@@ -0,0 +1,277 @@
+"""
+position_store.py
+-----------------
+
+In-process store of recent bus positions.
+
+Each VehicleID gets a fixed-size ring buffer of typed arrays ordered by
+DateTime, so "where was vehicle X in the last N minutes" is a binary search
+over memory. A secondary index maps RouteID to the vehicles seen on it.
+RouteIDs and TripIDs are codes of the store's own StringPool, which is
+compacted every max_age seconds so strings of evicted positions are
+dropped.
+"""
+# built-in modules
+from array import array
+from math import isfinite, isnan
+from threading import RLock
+
+# project modules
+from positions import PositionBatch, StringPool, MISSING_TIME
+from utils import to_epoch, from_epoch
+
+
+class VehicleTrack:
+    """Fixed capacity ring buffer of positions for a single vehicle.
+
+    Args:
+        capacity (int): max number of positions kept, oldest are overwritten.
+    """
+    __slots__ = (
+        'capacity', 'start', 'size', 'times', 'lats', 'lons',
+        'deviations', 'routes', 'trips', 'directions'
+    )
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.start = 0  # physical index of the oldest position
+        self.size = 0
+        self.times = array('q', [0]) * capacity
+        self.lats = array('d', [0.0]) * capacity
+        self.lons = array('d', [0.0]) * capacity
+        self.deviations = array('d', [0.0]) * capacity
+        self.routes = array('I', [0]) * capacity
+        self.trips = array('I', [0]) * capacity
+        self.directions = array('b', [0]) * capacity
+
+    def __len__(self):
+        return self.size
+
+    def _index(self, k: int) -> int:
+        """Physical index for logical position k, 0 being the oldest."""
+        return (self.start + k) % self.capacity
+
+    def last_time(self) -> int:
+        return self.times[self._index(self.size - 1)] if self.size else MISSING_TIME
+
+    def append(self, time, lat, lon, deviation, route, trip, direction) -> bool:
+        """Add position, returns False if not newer than the last one."""
+        if self.size and time <= self.last_time():
+            return False
+        if self.size < self.capacity:
+            i = self._index(self.size)
+            self.size += 1
+        else:  # overwrite oldest
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[i] = time
+        self.lats[i] = lat
+        self.lons[i] = lon
+        self.deviations[i] = deviation
+        self.routes[i] = route
+        self.trips[i] = trip
+        self.directions[i] = direction
+        return True
+
+    def bisect(self, time: int) -> int:
+        """Return first logical index with timestamp >= time."""
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._index(mid)] < time:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def has_route(self, route: int) -> bool:
+        """Return True if any position is on route, checking oldest first."""
+        return any(self.routes[self._index(k)] == route for k in range(self.size))
+
+    def drop_before(self, time: int) -> set:
+        """Evict positions older than time, returns the routes they were on."""
+        k = self.bisect(time)
+        routes = {self.routes[self._index(j)] for j in range(k)}
+        self.start = self._index(k) if k < self.size else 0
+        self.size -= k
+        return routes
+
+    def range(self, start: int, end: int):
+        """Yield physical indexes of positions with start <= DateTime <= end."""
+        k = self.bisect(start)
+        while k < self.size:
+            i = self._index(k)
+            if self.times[i] > end:
+                break
+            yield i
+            k += 1
+
+
+class PositionStore:
+    """Recent position history per vehicle with a RouteID index.
+
+    Args:
+        capacity (int): positions kept per vehicle; at one poll every
+            10 seconds the default holds roughly an hour.
+        max_age (int): seconds of history kept, relative to the newest
+            position added to the store.
+    """
+
+    def __init__(self, capacity: int = 360, max_age: int = 3600):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.pool = StringPool()
+        self.compacted = MISSING_TIME  # latest when the pool was compacted
+        self.tracks = dict()  # VehicleID -> VehicleTrack
+        self.route_index = dict()  # RouteID -> set of VehicleIDs
+        self.latest = MISSING_TIME
+        self._lock = RLock()
+
+    def __len__(self):
+        return sum(len(track) for track in self.tracks.values())
+
+    def __call__(self, batch: PositionBatch) -> None:
+        """Allows the store to be registered as a positions listener."""
+        self.add_batch(batch)
+
+    def add_batch(self, batch: PositionBatch) -> int:
+        """Add fetched positions, returns number of new positions stored."""
+        cols = batch.columns
+        decode = batch.pool.decode
+        encode = self.pool.encode
+        same_pool = batch.pool is self.pool
+        added = 0
+        with self._lock:
+            for i in range(len(batch)):
+                time = cols['DateTime'][i]
+                if time == MISSING_TIME:
+                    continue
+                vehicle = decode(cols['VehicleID'][i])
+                route, trip = cols['RouteID'][i], cols['TripID'][i]
+                if not same_pool:
+                    route, trip = encode(decode(route)), encode(decode(trip))
+
+                track = self.tracks.get(vehicle)
+                if track is None:
+                    track = self.tracks[vehicle] = VehicleTrack(self.capacity)
+                overwritten = None
+                if track.size == track.capacity:  # route of the oldest, overwritten
+                    overwritten = track.routes[track.start]
+                if track.append(
+                    time, cols['Lat'][i], cols['Lon'][i],
+                    cols['Deviation'][i], route, trip, cols['DirectionNum'][i]
+                ):
+                    added += 1
+                    self.route_index.setdefault(
+                        self.pool.decode(route), set()
+                    ).add(vehicle)
+                    if overwritten is not None and overwritten != route:
+                        self._unindex(vehicle, track, (overwritten,))
+                    if time > self.latest:
+                        self.latest = time
+            self.evict()
+        return added
+
+    def evict(self) -> None:
+        """Drop positions older than max_age and vehicles with no history."""
+        cutoff = self.latest - self.max_age
+        with self._lock:
+            for vehicle in list(self.tracks):
+                track = self.tracks[vehicle]
+                self._unindex(vehicle, track, track.drop_before(cutoff))
+                if not track.size:
+                    del self.tracks[vehicle]
+            for route in [r for r, v in self.route_index.items() if not v]:
+                del self.route_index[route]
+            if self.latest - self.compacted >= self.max_age:
+                self.compact()
+
+    def _unindex(self, vehicle: str, track: VehicleTrack, routes) -> None:
+        """Remove vehicle from the index of routes it has no positions on left."""
+        for route in routes:
+            if not track.has_route(route):
+                vehicles = self.route_index.get(self.pool.decode(route))
+                if vehicles is not None:
+                    vehicles.discard(vehicle)
+
+    def compact(self) -> None:
+        """Re-encode stored routes and trips into a new pool, dropping the
+        strings only evicted positions used."""
+        with self._lock:
+            old, pool = self.pool, StringPool()
+            for track in self.tracks.values():
+                for k in range(track.size):
+                    i = track._index(k)
+                    track.routes[i] = pool.encode(old.decode(track.routes[i]))
+                    track.trips[i] = pool.encode(old.decode(track.trips[i]))
+            self.pool = pool
+            self.compacted = self.latest
+
+    def _row(self, vehicle: str, track: VehicleTrack, i: int) -> dict:
+        decode = self.pool.decode
+        return {
+            'VehicleID': vehicle,
+            'DateTime': from_epoch(track.times[i]),
+            'Lat': track.lats[i],
+            'Lon': track.lons[i],
+            'Deviation': None if isnan(track.deviations[i]) else track.deviations[i],
+            'RouteID': decode(track.routes[i]),
+            'TripID': decode(track.trips[i]),
+            'DirectionNum': track.directions[i]
+        }
+
+    def query(self, vehicle_id: str, start=None, end=None) -> list:
+        """Return positions of a vehicle between start and end, inclusive.
+
+        Args:
+            vehicle_id (str): bus VehicleID.
+            start: Optional; epoch seconds or WMATA ISO timestamp.
+            end: Optional; epoch seconds or WMATA ISO timestamp.
+        """
+        start, end = self._bounds(start, end)
+        with self._lock:
+            track = self.tracks.get(vehicle_id)
+            if track is None:
+                return list()
+            return [
+                self._row(vehicle_id, track, i)
+                for i in track.range(start, end)
+            ]
+
+    def query_route(self, route_id: str, start=None, end=None) -> list:
+        """Return positions recorded on route_id between start and end."""
+        start, end = self._bounds(start, end)
+        rows = list()
+        with self._lock:
+            # the pool is swapped by compact() under the lock
+            code = self.pool.lookup(route_id)
+            for vehicle in sorted(self.route_index.get(route_id, ())):
+                track = self.tracks[vehicle]
+                rows.extend(
+                    self._row(vehicle, track, i)
+                    for i in track.range(start, end)
+                    if track.routes[i] == code
+                )
+        return rows
+
+    def last_minutes(self, vehicle_id: str, minutes: float) -> list:
+        """Return positions of a vehicle for the last N minutes of the store."""
+        if not isfinite(minutes) or minutes < 0:
+            raise ValueError(f'minutes must be a finite number >= 0, not {minutes}')
+        return self.query(vehicle_id, start=self.latest - int(minutes * 60))
+
+    def route_vehicles(self, route_id: str) -> list:
+        """Return VehicleIDs with recent positions on route_id."""
+        with self._lock:
+            return sorted(self.route_index.get(route_id, ()))
+
+    @staticmethod
+    def _bounds(start, end) -> tuple:
+        if isinstance(start, str):
+            start = to_epoch(start)
+        if isinstance(end, str):
+            end = to_epoch(end)
+        return (
+            MISSING_TIME if start is None else start,
+            2 ** 63 - 1 if end is None else end
+        )
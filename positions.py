@@ -0,0 +1,181 @@
+"""
+positions.py
+------------
+
+Compact in-memory representation of bus position records.
+
+A PositionBatch stores BUS_POS_FIELD_NAMES data column-wise in typed arrays
+instead of one dict per record. Repeated strings (RouteID, DirectionText,
+TripHeadsign, ...) are stored once in the batch's StringPool and referenced
+by integer codes, timestamps as epoch seconds and coordinates as float64.
+Each batch has its own pool unless one is passed, so a long running poller
+doesn't accumulate every TripID it ever saw.
+"""
+# built-in modules
+from array import array
+from math import isnan
+
+# project modules
+from utils import BUS_POS_FIELD_NAMES, to_epoch, from_epoch
+
+# column groups, by storage type
+CATEGORY_FIELDS = [
+    'BlockNumber', 'DirectionText', 'RouteID',
+    'TripHeadsign', 'TripID', 'VehicleID'
+]
+FLOAT_FIELDS = ['Deviation', 'Lat', 'Lon']
+INT_FIELDS = ['DirectionNum']
+TIME_FIELDS = ['DateTime', 'TripEndTime', 'TripStartTime']
+
+MISSING_INT = -1
+MISSING_TIME = -(2 ** 63)
+
+
+class StringPool:
+    """Bidirectional str <-> int code table; code 0 is reserved for None."""
+
+    def __init__(self):
+        self._codes = {None: 0}
+        self._values = [None]
+
+    def __len__(self):
+        return len(self._values)
+
+    def encode(self, value) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._values)
+            self._codes[value] = code
+            self._values.append(value)
+        return code
+
+    def decode(self, code: int):
+        return self._values[code]
+
+    def lookup(self, value):
+        """Return code for value, or None if value was never encoded."""
+        return self._codes.get(value)
+
+
+class PositionBatch:
+    """Struct-of-arrays container for bus position records.
+
+    Args:
+        pool (StringPool): Optional; string table for categorical columns,
+            defaults to a new pool of the batch.
+    """
+    __slots__ = ('pool', 'columns')
+
+    def __init__(self, pool: StringPool = None):
+        self.pool = pool if pool is not None else StringPool()
+        self.columns = dict()
+        for field in CATEGORY_FIELDS:
+            self.columns[field] = array('I')
+        for field in FLOAT_FIELDS:
+            self.columns[field] = array('d')
+        for field in INT_FIELDS:
+            self.columns[field] = array('b')
+        for field in TIME_FIELDS:
+            self.columns[field] = array('q')
+
+    @classmethod
+    def from_records(cls, records: list, pool: StringPool = None):
+        """Return batch built from list of BusPositions dicts."""
+        batch = cls(pool=pool)
+        batch.extend(records)
+        return batch
+
+    @classmethod
+    def from_typed(cls, typed, pool: StringPool = None):
+        """Return batch built from a coerce.TypedBatch of bus positions,
+        reusing its already converted columns."""
+        batch = cls(pool=pool)
+        encode = batch.pool.encode
+        for field in CATEGORY_FIELDS:
+            batch.columns[field].extend(
+                encode(str(value) if value is not None else None)
+                for value in typed.columns[field]
+            )
+        for field in FLOAT_FIELDS + INT_FIELDS + TIME_FIELDS:
+            batch.columns[field].fromlist(typed.columns[field].tolist())
+        return batch
+
+    def __len__(self):
+        return len(self.columns['VehicleID'])
+
+    def __getitem__(self, i: int) -> dict:
+        return self.row(i)
+
+    def __iter__(self):
+        return self.rows()
+
+    def append(self, record: dict) -> None:
+        """Add a single BusPositions dict to the batch."""
+        columns = self.columns
+        encode = self.pool.encode
+        for field in CATEGORY_FIELDS:
+            value = record.get(field)
+            columns[field].append(encode(str(value) if value is not None else None))
+        for field in FLOAT_FIELDS:
+            value = record.get(field)
+            columns[field].append(float(value) if value is not None else float('nan'))
+        for field in INT_FIELDS:
+            value = record.get(field)
+            columns[field].append(int(value) if value not in (None, '') else MISSING_INT)
+        for field in TIME_FIELDS:
+            value = record.get(field)
+            columns[field].append(to_epoch(value) if value else MISSING_TIME)
+
+    def extend(self, records) -> None:
+        """Add BusPositions dicts, or another PositionBatch, to the batch."""
+        if isinstance(records, PositionBatch) and records.pool is self.pool:
+            for field, column in self.columns.items():
+                column.extend(records.columns[field])
+            return
+        for record in records:
+            self.append(record)
+
+    def take(self, indexes) -> 'PositionBatch':
+        """Return a batch of the records at indexes, sharing the pool."""
+        indexes = list(indexes)
+        batch = PositionBatch(pool=self.pool)
+        for field, column in self.columns.items():
+            batch.columns[field] = array(column.typecode, [column[i] for i in indexes])
+        return batch
+
+    def row(self, i: int) -> dict:
+        """Return record i as a BusPositions dict in BUS_POS_FIELD_NAMES order."""
+        columns = self.columns
+        decode = self.pool.decode
+        values = dict()
+        for field in CATEGORY_FIELDS:
+            values[field] = decode(columns[field][i])
+        for field in FLOAT_FIELDS:
+            value = columns[field][i]
+            values[field] = None if isnan(value) else value
+        for field in INT_FIELDS:
+            value = columns[field][i]
+            values[field] = None if value == MISSING_INT else value
+        for field in TIME_FIELDS:
+            value = columns[field][i]
+            values[field] = None if value == MISSING_TIME else from_epoch(value)
+        return {field: values[field] for field in BUS_POS_FIELD_NAMES}
+
+    def rows(self):
+        """Yield records as BusPositions dicts."""
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def column(self, field: str) -> list:
+        """Return decoded values of a single column."""
+        values = self.columns[field]
+        if field in CATEGORY_FIELDS:
+            decode = self.pool.decode
+            return [decode(code) for code in values]
+        return values.tolist()
+
+    def nbytes(self) -> int:
+        """Return bytes held by the column arrays, excluding the string pool."""
+        return sum(
+            column.itemsize * len(column) for column in self.columns.values()
+        )
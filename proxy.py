@@ -0,0 +1,215 @@
+"""
+proxy.py
+--------
+
+Local read-through caching proxy for the WMATA bus endpoints.
+
+Serves the same paths and JSON payloads as API_END_POINTS from a shared
+cache, so any number of internal consumers result in at most one upstream
+call per resource and freshness window. Concurrent requests for the same
+resource wait on a single upstream call.
+
+    python proxy.py --port 8080 --ttl bus_position=7
+    curl localhost:8080/Bus.svc/json/jBusPositions?RouteID=70
+"""
+# built-in modules
+import argparse
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlparse, parse_qsl
+
+# project modules
+from wmata import (
+    API_END_POINTS, get_bus_position, get_path_details, get_routes,
+    get_schedule, get_stop_schedule, get_stops, get_incidents
+)
+
+# endpoint name -> (client function, query param -> function kwarg)
+PROXY_END_POINTS = {
+    'bus_position': (get_bus_position, {
+        'RouteID': 'route_id', 'Lat': 'lat', 'Lon': 'lon', 'Radius': 'radius'
+    }),
+    'path_details': (get_path_details, {'RouteID': 'route_id', 'Date': 'date'}),
+    'routes': (get_routes, {}),
+    'route_scheds ': (get_schedule, {
+        'RouteID': 'route_id', 'Date': 'date',
+        'IncludingVariations': 'including_variations'
+    }),
+    'stop_scheds ': (get_stop_schedule, {'StopID': 'stop_id', 'Date': 'date'}),
+    'stops': (get_stops, {'Lat': 'lat', 'Lon': 'lon', 'Radius': 'radius'}),
+    'incidents': (get_incidents, {'Route': 'route_id'})
+}
+# seconds a cached response is served before refreshing from upstream
+DEFAULT_TTLS = {
+    'bus_position': 7,
+    'path_details': 86400,
+    'routes': 86400,
+    'route_scheds ': 3600,
+    'stop_scheds ': 3600,
+    'stops': 86400,
+    'incidents': 30
+}
+
+
+class ResponseCache:
+    """Thread-safe response cache with per-key upstream call coalescing.
+
+    Args:
+        max_entries (int): entries kept; expired entries, then the oldest
+            ones, are evicted once exceeded.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        # key -> (expires, status, content, content_type), oldest first
+        self.entries = dict()
+        self.key_locks = dict()  # key -> [lock, threads using it]
+        self.lock = Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'upstream': 0, 'errors': 0}
+
+    def _count(self, *stats) -> None:
+        with self.lock:
+            for name in stats:
+                self.stats[name] += 1
+
+    @contextmanager
+    def _key_lock(self, key):
+        """Hold the key's lock, kept only while threads use it."""
+        with self.lock:
+            key_lock = self.key_locks.get(key)
+            if key_lock is None:
+                key_lock = self.key_locks[key] = [Lock(), 0]
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                yield
+        finally:
+            with self.lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self.key_locks[key]
+
+    def _fresh(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > monotonic():
+            return entry
+        return None
+
+    def get(self, key, ttl: float, fetch) -> tuple:
+        """Return (status, content, content_type), calling fetch() on a miss.
+
+        Only one thread per key calls fetch(); the others block on the key
+        lock and are then served the freshly cached entry.
+        """
+        entry = self._fresh(key)
+        if entry is not None:
+            self._count('hits')
+            return entry[1:]
+
+        with self._key_lock(key):
+            entry = self._fresh(key)  # filled while waiting on the lock
+            if entry is not None:
+                self._count('hits')
+                return entry[1:]
+
+            self._count('misses', 'upstream')
+            resp = fetch()
+            content_type = resp.headers.get('Content-Type', 'application/json')
+            if resp.status_code != 200:  # don't cache upstream errors
+                self._count('errors')
+                return resp.status_code, resp.content, content_type
+
+            entry = (monotonic() + ttl, resp.status_code, resp.content, content_type)
+            with self.lock:
+                self.entries.pop(key, None)  # re-inserted as the newest
+                self.entries[key] = entry
+                if len(self.entries) > self.max_entries:
+                    self.purge()
+            return entry[1:]
+
+    def purge(self) -> None:
+        """Remove expired entries, then the oldest down to max_entries.
+
+        Called with the cache lock held.
+        """
+        now = monotonic()
+        for key in [k for k, e in self.entries.items() if e[0] <= now]:
+            del self.entries[key]
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+
+
+class ProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, ttls: dict = None, cache: ResponseCache = None):
+        super().__init__(address, ProxyHandler)
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or dict())
+        self.cache = cache or ResponseCache()
+        self.routes = {
+            urlparse(API_END_POINTS[name]).path: name
+            for name in PROXY_END_POINTS
+        }
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        name = self.server.routes.get(url.path)
+        if name is None:
+            self.send_error(404, f'Unknown endpoint: {url.path}')
+            return
+
+        func, param_map = PROXY_END_POINTS[name]
+        params = {  # api_key params are ignored, upstream uses config keys
+            param_map[k]: v for k, v in parse_qsl(url.query)
+            if k in param_map
+        }
+        key = (name, tuple(sorted(params.items())))
+        try:
+            status, content, content_type = self.server.cache.get(
+                key, self.server.ttls[name], lambda: func(**params)
+            )
+        except Exception as e:
+            self.send_error(502, f'Upstream request failed: {e}')
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def serve(host='127.0.0.1', port=8080, ttls: dict = None) -> None:
+    server = ProxyServer((host, port), ttls=ttls)
+    print(f'[proxy] serving WMATA endpoints on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    finally:
+        print(f'[proxy] cache stats: {server.cache.stats}')
+        server.server_close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Caching proxy for WMATA API bus endpoints.'
+    )
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8080)
+    arg_parser.add_argument(
+        '--ttl', action='append', default=list(),
+        help='Override freshness as endpoint=seconds, e.g. bus_position=7.'
+    )
+    args = arg_parser.parse_args()
+    ttl_overrides = dict()
+    for ttl in args.ttl:
+        endpoint, seconds = ttl.split('=')
+        # API_END_POINTS keys for schedules carry a trailing space
+        endpoint = endpoint if endpoint in DEFAULT_TTLS else endpoint + ' '
+        ttl_overrides[endpoint] = float(seconds)
+    serve(host=args.host, port=args.port, ttls=ttl_overrides)
@@ -0,0 +1,249 @@
+"""
+query.py
+--------
+
+Ad-hoc queries over the csv datasets saved under data/.
+
+Only the bytes a query needs are read:
+    - partitions are pruned by the YYYY/MM/DD/HH directories created by
+      mkdir_timestamp, using the query's time range
+    - files of datasets saved per route are pruned by RouteID from their
+      file names, and any file not containing a filtered value at all is
+      skipped after a scan of its memory mapped bytes
+    - rows are filtered on their raw csv fields before the requested columns
+      are projected, so no dicts are built for rows that are dropped
+
+    python query.py bus_positions --start 2021-08-10T07:00 --end 2021-08-10T09:00 \\
+        --where RouteID=70 --columns VehicleID DateTime Lat Lon
+
+The stored datasets are row oriented csv files, so projection saves parsing
+and output but not I/O. Compressed files are decompressed as a stream
+instead of being memory mapped.
+"""
+# built-in modules
+import os
+import sys
+import csv
+import mmap
+import argparse
+from datetime import datetime, timedelta
+
+# project modules
+from compression import NONE, codec_of, is_csv, open_text
+from utils import DATA_PATH_MAP, csv_file_prefix
+
+# column compared with a query's time range by dataset
+TIME_COLUMNS = {
+    'bus_positions': 'DateTime',
+    'position_rollups': 'Minute',
+    'vehicle_tracks': 'DateTime',
+    'bunching_events': 'DateTime',
+    'route_scheds': 'Time',
+    'route_sched_changes': 'Time',
+    'incidents': 'DateUpdated',
+    'incident_changes': 'DateUpdated'
+}
+# datasets saved as one file per route, named by csv_file_prefix
+ROUTE_FILE_TYPES = {
+    'route_scheds', 'route_sched_changes', 'path_details_stops',
+    'path_details_shapes', 'shape_map'
+}
+# rows can be saved in the partition after their timestamp, e.g. positions
+# fetched just after the hour
+PARTITION_SLACK = timedelta(minutes=5)
+
+
+def _partition_range(parts: list) -> tuple:
+    """Return [start, end) datetimes covered by YYYY/MM/DD/HH path parts."""
+    values = [int(p) for p in parts] + [1, 1, 0][len(parts) - 1:]
+    start = datetime(*values[:4])
+    if len(parts) == 1:
+        end = start.replace(year=start.year + 1)
+    elif len(parts) == 2:
+        end = (start + timedelta(days=32)).replace(day=1)
+    elif len(parts) == 3:
+        end = start + timedelta(days=1)
+    else:
+        end = start + timedelta(hours=1)
+    return start, end
+
+
+def partition_files(
+        data_type: str, start: datetime = None, end: datetime = None,
+        root: str = None
+) -> list:
+    """Return csv files of data_type in partitions overlapping [start, end).
+
+    Args:
+        data_type (str): type of api data, e.g. bus_positions.
+        start (datetime): Optional; first time of the query.
+        end (datetime): Optional; end of the query, exclusive.
+        root (str): Optional; dataset directory, defaults to DATA_PATH_MAP.
+    """
+    files = list()
+
+    def walk(path: str, parts: list):
+        for name in sorted(os.listdir(path)):
+            child = os.path.join(path, name)
+            if os.path.isdir(child):
+                if not name.isdigit() or len(parts) >= 4:
+                    continue
+                part_start, part_end = _partition_range(parts + [name])
+                if start and part_end + PARTITION_SLACK <= start:
+                    continue
+                if end and part_start - PARTITION_SLACK >= end:
+                    continue
+                walk(child, parts + [name])
+            elif is_csv(name):
+                files.append(child)
+
+    root = root or DATA_PATH_MAP[data_type]
+    if os.path.isdir(root):
+        walk(root, [])
+    return files
+
+
+def _contains_any(path: str, values: list) -> bool:
+    """Return True if the file's bytes contain any of values."""
+    if codec_of(path) != NONE:
+        return True  # compressed bytes can't be searched
+    with open(path, mode='rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return any(mm.find(value.encode()) != -1 for value in values)
+
+
+def _read_lines(path: str):
+    """Yield decoded lines of a memory mapped, or decompressed, csv file."""
+    if codec_of(path) != NONE:
+        with open_text(path) as f:
+            yield from f
+        return
+    with open(path, mode='rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                yield line.decode('utf-8')
+
+
+def _iso(value) -> str:
+    if value is None or isinstance(value, str) and not value:
+        return ''
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat()
+
+
+def query(
+        data_type: str, start=None, end=None, where: dict = None,
+        columns: list = None, time_column: str = None, root: str = None
+):
+    """Yield rows of a stored dataset matching the filters.
+
+    Args:
+        data_type (str): type of api data, e.g. bus_positions.
+        start: Optional; datetime or ISO string, rows from this time.
+        end: Optional; datetime or ISO string, rows before this time.
+        where (dict): Optional; column -> value or collection of values,
+            rows must match all columns.
+        columns (list): Optional; columns to return, defaults to all.
+        time_column (str): Optional; column compared with start and end,
+            defaults to TIME_COLUMNS of data_type.
+        root (str): Optional; dataset directory, defaults to DATA_PATH_MAP.
+
+    Returns:
+        Generator of tuples of the requested columns' csv values.
+    """
+    start, end = _iso(start), _iso(end)
+    where = {
+        k: {v} if isinstance(v, str) else set(map(str, v))
+        for k, v in (where or dict()).items()
+    }
+    time_column = time_column or TIME_COLUMNS.get(data_type)
+    if (start or end) and not time_column:
+        raise ValueError(f'{data_type} has no time column to filter on')
+
+    files = partition_files(
+        data_type,
+        datetime.fromisoformat(start) if start else None,
+        datetime.fromisoformat(end) if end else None,
+        root
+    )
+    if data_type in ROUTE_FILE_TYPES and 'RouteID' in where:
+        prefixes = tuple(csv_file_prefix(data_type, r) for r in where['RouteID'])
+        files = [f for f in files if os.path.basename(f).startswith(prefixes)]
+
+    for path in files:
+        # skip files that can't hold a match without parsing them, values
+        # with quotes are escaped in csv so can't be searched for verbatim
+        if any(
+            not _contains_any(path, values) for values in where.values()
+            if not any('"' in v for v in values)
+        ):
+            continue
+        reader = csv.reader(_read_lines(path))
+        header = next(reader, None)
+        if header is None:
+            continue
+        index = {name: i for i, name in enumerate(header)}
+        try:
+            filters = [(index[k], values) for k, values in where.items()]
+            projection = (
+                [index[c] for c in columns] if columns else range(len(header))
+            )
+            time_index = index[time_column] if start or end else None
+        except KeyError as e:
+            raise ValueError(f'{path} has no column {e}') from None
+
+        for row in reader:
+            if any(row[i] not in values for i, values in filters):
+                continue
+            if time_index is not None:
+                value = row[time_index]
+                if start and value < start or end and value >= end:
+                    continue
+            yield tuple(row[i] for i in projection)
+
+
+def main(
+        data_type, start=None, end=None, where=None, columns=None,
+        time_column=None, limit=0
+) -> None:
+    filters = dict()
+    for condition in where or []:
+        column, value = condition.split('=', 1)
+        filters.setdefault(column, set()).add(value)
+
+    writer = csv.writer(sys.stdout)
+    if columns:
+        writer.writerow(columns)
+    for n, row in enumerate(query(
+        data_type, start, end, filters, columns, time_column
+    ), 1):
+        writer.writerow(row)
+        if n == limit:
+            break
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Query csv data saved under data/.'
+    )
+    arg_parser.add_argument('data_type', choices=sorted(DATA_PATH_MAP))
+    arg_parser.add_argument(
+        '--start', help='Rows from this ISO time, e.g. 2021-08-10T07:00.'
+    )
+    arg_parser.add_argument('--end', help='Rows before this ISO time.')
+    arg_parser.add_argument(
+        '--where', nargs='*', metavar='COLUMN=VALUE',
+        help='Keep rows where COLUMN equals VALUE; values of the same column '
+             'are alternatives.'
+    )
+    arg_parser.add_argument('--columns', nargs='*', help='Columns to output.')
+    arg_parser.add_argument(
+        '--time-column', help='Column compared with --start and --end.'
+    )
+    arg_parser.add_argument('--limit', type=int, default=0)
+    main(**vars(arg_parser.parse_args()))
@@ -0,0 +1,99 @@
+"""
+ratelimit.py
+------------
+
+Process wide WMATA API rate budget shared by all jobs.
+
+Requests take a token from a bucket refilled at the API limit (10 calls/s by
+default). Batch requests leave a reserve of tokens untouched and yield to
+waiting real-time requests, so bus positions polls are not delayed by
+schedule or stops fetches running in the same process.
+"""
+# built-in modules
+from contextlib import contextmanager
+from threading import Condition, local
+from time import monotonic
+
+# project modules
+from metrics import RATE_LIMIT_WAIT
+
+REALTIME = 'realtime'
+BATCH = 'batch'
+
+_context = local()
+
+
+def current_priority() -> str:
+    return getattr(_context, 'priority', BATCH)
+
+
+@contextmanager
+def priority(level: str):
+    """Run requests made by this thread in the with block at level."""
+    previous = current_priority()
+    _context.priority = level
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+class RateLimiter:
+    """Token bucket with a reserve for real-time requests.
+
+    Args:
+        rate (float): tokens added per second.
+        burst (float): Optional; bucket size, defaults to rate.
+        reserve (float): tokens batch requests leave for real-time ones.
+    """
+
+    def __init__(self, rate: float = 10, burst: float = None, reserve: float = 2):
+        self.configure(rate, burst, reserve)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.waiting_realtime = 0
+        self.cond = Condition()
+
+    def configure(self, rate: float, burst: float = None, reserve: float = 2):
+        self.rate = float(rate)
+        # room for one request at least, even below a request per second
+        self.burst = max(1.0, float(burst or rate))
+        self.reserve = max(0.0, min(float(reserve), self.burst - 1))
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, level: str = None) -> float:
+        """Block until a request may be made, returns seconds waited."""
+        level = level or current_priority()
+        realtime = level == REALTIME
+        need = 1 if realtime else 1 + self.reserve
+        start = monotonic()
+        with self.cond:
+            if realtime:
+                self.waiting_realtime += 1
+            try:
+                while True:
+                    self._refill()
+                    if not realtime and self.waiting_realtime:
+                        # notified once the real-time requests have gone
+                        self.cond.wait()
+                    elif self.tokens >= need:
+                        self.tokens -= 1
+                        break
+                    else:
+                        # sleep until the token needed is due
+                        self.cond.wait((need - self.tokens) / self.rate)
+            finally:
+                if realtime:
+                    self.waiting_realtime -= 1
+                    self.cond.notify_all()
+        waited = monotonic() - start
+        RATE_LIMIT_WAIT.inc(waited, priority=level)
+        return waited
+
+
+# Per API specs 10 calls/second limit
+RATE_LIMITER = RateLimiter(rate=10)
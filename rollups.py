@@ -0,0 +1,285 @@
+"""
+rollups.py
+----------
+
+Precomputed bus position rollups, so dashboards read small tables instead
+of scanning raw positions.
+
+PositionRollup is fed PositionBatches, either as a listener of
+extract.watch_bus_positions or from saved bus_positions partitions, and
+incrementally maintains:
+    - position_rollups: per minute and route the number of vehicles and
+      distinct positions, mean/median/90th percentile Deviation and the
+      coverage, i.e. share of the minute's polls that reported the route
+    - vehicle_tracks: each vehicle's first position per track interval
+
+Minutes are written once no more positions are expected for them, to hourly
+csv files alongside the raw data:
+
+    data/position_rollups/YYYY/MM/DD/HH/position_rollups_MM-DD-YYYY_HH.csv
+    data/vehicle_tracks/YYYY/MM/DD/HH/vehicle_tracks_MM-DD-YYYY_HH.csv
+
+An hour is marked complete with a COMPLETE file in its position_rollups
+partition once it was rolled up from its first to its last minute. Run as a
+script to roll up closed hours of saved positions that aren't complete,
+e.g. from cron when positions are saved by extract.py position --csv. This
+also redoes hours a live listener only rolled up partly, because it started,
+stopped or crashed within them.
+"""
+# built-in modules
+import os
+import csv
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from math import isnan
+
+# project modules
+from compression import SUFFIXES, codec_for, open_text
+from positions import PositionBatch, MISSING_TIME
+from query import partition_files, PARTITION_SLACK
+from utils import (
+    DATA_FIELDNAMES_MAP, EPOCH, csv_file_prefix, from_epoch, mkdir_timestamp,
+    timestamp_dir
+)
+
+COMPLETE_MARKER = 'COMPLETE'
+
+
+def complete_marker(hour: datetime) -> str:
+    """Return the file marking an hour's rollups complete."""
+    return os.path.join(
+        timestamp_dir('position_rollups', level=4, timestamp=hour), COMPLETE_MARKER
+    )
+
+
+def _percentile(values: list, q: float):
+    """Nearest rank percentile of sorted values."""
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def append_csv(data_type: str, rows: list, timestamp: datetime) -> None:
+    """Append rows to the hourly csv file of data_type holding timestamp."""
+    codec, level = codec_for(data_type)
+    path = os.path.join(
+        mkdir_timestamp(data_type, level=4, timestamp=timestamp),
+        csv_file_prefix(data_type) + timestamp.strftime('%m-%d-%Y_%H') + '.csv'
+        + SUFFIXES[codec]
+    )
+    new_file = not os.path.exists(path)
+    with open_text(path, 'a', codec, level) as f:
+        writer = csv.DictWriter(f, fieldnames=DATA_FIELDNAMES_MAP[data_type])
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+class _Minute:
+    __slots__ = ('seen', 'routes')
+
+    def __init__(self):
+        self.seen = set()  # (VehicleID, DateTime) already counted
+        self.routes = dict()  # RouteID -> [vehicles, deviations, positions]
+
+
+class PositionRollup:
+    """Incremental per-minute route aggregates and downsampled tracks.
+
+    Args:
+        lag (int): seconds after the newest position before a minute is
+            written, later positions of written minutes are dropped.
+        track_interval (int): seconds between points of vehicle tracks.
+        window (tuple): Optional; (start, end) epoch seconds, positions
+            outside are ignored.
+    """
+
+    def __init__(self, lag: int = 120, track_interval: int = 60, window=None):
+        self.lag = lag
+        self.track_interval = track_interval
+        self.window = window
+        self.minutes = dict()  # minute epoch -> _Minute
+        self.tracks = dict()  # interval epoch -> VehicleID -> point
+        self.polls = Counter()  # minute epoch -> polls
+        self.route_polls = defaultdict(Counter)  # minute epoch -> RouteID -> polls
+        self.watermark = MISSING_TIME  # minutes before this were written
+        # epoch from which every poll was seen, hours starting before it are
+        # only partly rolled up
+        self.since = window[0] if window else None
+        self.hours = set()  # hour epochs written to and not marked complete
+
+    def __call__(self, batch: PositionBatch) -> None:
+        self.add_batch(batch)
+
+    def add_batch(self, batch: PositionBatch, flush=True) -> None:
+        """Aggregate a poll's positions, writing minutes that are complete."""
+        columns = batch.columns
+        times = columns['DateTime']
+        newest = max(times, default=MISSING_TIME)
+        if newest == MISSING_TIME:
+            return
+        if self.since is None:
+            self.since = newest
+
+        decode = batch.pool.decode
+        start, end = self.window or (MISSING_TIME, -MISSING_TIME)
+        poll_routes = set()
+        for vehicle, route, trip, t, deviation, lat, lon in zip(
+            columns['VehicleID'], columns['RouteID'], columns['TripID'], times,
+            columns['Deviation'], columns['Lat'], columns['Lon']
+        ):
+            if t == MISSING_TIME or t < self.watermark or not start <= t < end:
+                continue
+            route, vehicle = decode(route), decode(vehicle)
+            poll_routes.add(route)
+            minute = self.minutes.get(t - t % 60)
+            if minute is None:
+                minute = self.minutes[t - t % 60] = _Minute()
+            if (vehicle, t) in minute.seen:  # unchanged since the last poll
+                continue
+            minute.seen.add((vehicle, t))
+
+            stats = minute.routes.get(route)
+            if stats is None:
+                stats = minute.routes[route] = [set(), [], 0]
+            stats[0].add(vehicle)
+            if not isnan(deviation):
+                stats[1].append(deviation)
+            stats[2] += 1
+
+            points = self.tracks.setdefault(t - t % self.track_interval, dict())
+            point = points.get(vehicle)
+            if point is None or t < point[0]:
+                points[vehicle] = (t, route, decode(trip), lat, lon, deviation)
+
+        poll_minute = newest - newest % 60
+        if poll_minute >= self.watermark:
+            self.polls[poll_minute] += 1
+            self.route_polls[poll_minute].update(poll_routes)
+        if flush:
+            self.flush(before=newest - self.lag)
+
+    def flush(self, before: int = None) -> int:
+        """Write minutes and track intervals ending before epoch before.
+
+        Args:
+            before (int): Optional; epoch seconds, defaults to everything.
+
+        Returns:
+            Number of rollup rows written.
+        """
+        before = -MISSING_TIME if before is None else before
+        rollups = defaultdict(list)  # hour -> rows
+        for minute_time in sorted(t for t in self.minutes if t + 60 <= before):
+            minute = self.minutes.pop(minute_time)
+            polls = self.polls.pop(minute_time, 0)
+            route_polls = self.route_polls.pop(minute_time, Counter())
+            for route, (vehicles, deviations, positions) in sorted(minute.routes.items()):
+                row = {
+                    'Minute': from_epoch(minute_time),
+                    'RouteID': route,
+                    'Vehicles': len(vehicles),
+                    'Positions': positions,
+                    'Coverage': round(route_polls[route] / polls, 3) if polls else ''
+                }
+                if deviations:
+                    deviations.sort()
+                    row['DeviationMean'] = round(sum(deviations) / len(deviations), 3)
+                    row['DeviationP50'] = _percentile(deviations, 0.5)
+                    row['DeviationP90'] = _percentile(deviations, 0.9)
+                rollups[minute_time - minute_time % 3600].append(row)
+        for poll_minute in [t for t in self.polls if t + 60 <= before]:
+            del self.polls[poll_minute]
+            self.route_polls.pop(poll_minute, None)
+
+        tracks = defaultdict(list)
+        for interval in sorted(t for t in self.tracks if t + self.track_interval <= before):
+            for vehicle, (t, route, trip, lat, lon, deviation) in sorted(
+                self.tracks.pop(interval).items(), key=lambda item: item[1][0]
+            ):
+                tracks[t - t % 3600].append({
+                    'VehicleID': vehicle, 'DateTime': from_epoch(t),
+                    'RouteID': route, 'TripID': trip, 'Lat': lat, 'Lon': lon,
+                    'Deviation': '' if isnan(deviation) else deviation
+                })
+
+        for data_type, hours in [('position_rollups', rollups), ('vehicle_tracks', tracks)]:
+            for hour, rows in sorted(hours.items()):
+                append_csv(data_type, rows, EPOCH + timedelta(seconds=hour))
+                self.hours.add(hour)
+        self.watermark = max(self.watermark, before - before % 60)
+
+        for hour in sorted(h for h in self.hours if h + 3600 <= self.watermark):
+            self.hours.discard(hour)
+            if self.since is not None and self.since <= hour:
+                marker = complete_marker(EPOCH + timedelta(seconds=hour))
+                os.makedirs(os.path.dirname(marker), exist_ok=True)
+                with open(marker, 'w'):
+                    pass
+        return sum(len(rows) for rows in rollups.values())
+
+
+def _read_positions(path: str) -> PositionBatch:
+    with open_text(path) as f:
+        # csv writes None as an empty string
+        return PositionBatch.from_records(
+            {k: v or None for k, v in row.items()} for row in csv.DictReader(f)
+        )
+
+
+def rollup_partitions(start: datetime = None, end: datetime = None, now: datetime = None) -> list:
+    """Roll up closed hours of saved bus positions not marked complete.
+
+    Positions fetched just after an hour are saved in the next hour's
+    partition, so an hour is rolled up PARTITION_SLACK after it ends. Rows
+    of an hour a live listener only rolled up partly are replaced.
+
+    Args:
+        start (datetime): Optional; first hour to consider.
+        end (datetime): Optional; end of hours to consider.
+        now (datetime): Optional; current time.
+
+    Returns:
+        list of hours rolled up.
+    """
+    now = now or datetime.now()
+    files = defaultdict(list)  # hour -> poll files
+    for path in partition_files('bus_positions', start, end and end + timedelta(hours=1)):
+        hour = datetime.strptime(
+            '/'.join(os.path.dirname(path).split(os.sep)[-4:]), '%Y/%m/%d/%H'
+        )
+        files[hour].append(path)
+
+    done = list()
+    for hour in sorted(files):
+        if start and hour < start or end and hour >= end:
+            continue
+        if hour + timedelta(hours=1) + PARTITION_SLACK > now:
+            continue
+        if os.path.isfile(complete_marker(hour)):
+            continue  # rolled up by a previous run or a live listener
+        for data_type in ('position_rollups', 'vehicle_tracks'):
+            path = timestamp_dir(data_type, level=4, timestamp=hour)
+            for name in os.listdir(path) if os.path.isdir(path) else []:
+                os.remove(os.path.join(path, name))  # partial rows
+        epoch = int((hour - EPOCH).total_seconds())
+        rollup = PositionRollup(window=(epoch, epoch + 3600))
+        for path in sorted(files[hour]) + sorted(files.get(hour + timedelta(hours=1), [])):
+            rollup.add_batch(_read_positions(path), flush=False)
+        rows = rollup.flush()
+        print(f'[rollups] {hour:%Y-%m-%d %H}:00 {rows} rows')
+        done.append(hour)
+    return done
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Roll up saved bus positions by minute, route and vehicle.'
+    )
+    arg_parser.add_argument(
+        '--start', type=datetime.fromisoformat,
+        help='First hour to roll up, e.g. 2021-08-10T07:00.'
+    )
+    arg_parser.add_argument(
+        '--end', type=datetime.fromisoformat, help='End of hours to roll up.'
+    )
+    rollup_partitions(**vars(arg_parser.parse_args()))
@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+cd ~/jk-apps/bus_wmata/
+source wmata_env/bin/activate
+python rollups.py
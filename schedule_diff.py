@@ -0,0 +1,140 @@
+"""
+schedule_diff.py
+----------------
+
+Day-over-day route schedule changes as a change-data-capture stream.
+
+The flattened schedule of a route is compared with the previously saved
+route_scheds csv of the route, keyed by TripID/StopID/StopSeq. Inserted,
+removed and modified rows are emitted as a changelog whose Op column is
+insert, remove or modify; modify rows hold the new values and list the
+changed fields in Changed, remove rows hold the old values.
+
+Times carry the calendar date of the schedule, so they are compared as
+days and time of day since the schedule's service date, the earliest
+trip StartTime date; the same timetable fetched for consecutive dates has
+no changes, while a trip moved past midnight still does.
+"""
+# built-in modules
+import os
+import csv
+from datetime import date
+
+# project modules
+from compression import open_text
+from utils import DATA_PATH_MAP, BUS_SCHED_FIELD_NAMES
+
+SCHED_KEY_FIELDS = ('TripID', 'StopID', 'StopSeq')
+SCHED_TIME_FIELDS = ('StartTime', 'EndTime', 'Time')
+INSERT = 'insert'
+REMOVE = 'remove'
+MODIFY = 'modify'
+
+
+def _normalize(row: dict) -> dict:
+    # compare API values the way they are written to and read from csv
+    return {
+        k: '' if row.get(k) is None else str(row[k])
+        for k in BUS_SCHED_FIELD_NAMES
+    }
+
+
+def _service_date(rows: list):
+    """Return date of the earliest trip start of normalized rows, or None."""
+    dates = [row['StartTime'][:10] for row in rows if row['StartTime']]
+    try:
+        return date.fromisoformat(min(dates)) if dates else None
+    except ValueError:
+        return None
+
+
+def _comparable(row: dict, service_date) -> dict:
+    """Return row with times as days since service_date and time of day."""
+    if service_date is None:
+        return row
+    row = row.copy()
+    for k in SCHED_TIME_FIELDS:
+        value = row[k]
+        try:
+            days = (date.fromisoformat(value[:10]) - service_date).days
+        except ValueError:  # empty or not a timestamp, compared as it is
+            continue
+        row[k] = f'{days}d{value[11:]}'
+    return row
+
+
+def _key(row: dict) -> tuple:
+    return tuple(row[k] for k in SCHED_KEY_FIELDS)
+
+
+def diff_schedules(previous, current) -> list:
+    """Return changelog rows turning the previous schedule into current.
+
+    Args:
+        previous: iterable of schedule rows, e.g. read back from csv.
+        current: iterable of flattened schedule rows.
+
+    Returns:
+        list of rows with Op and Changed columns added, removes first and
+        then inserts and modifications in current order.
+    """
+    previous = list(map(_normalize, previous))
+    current = list(map(_normalize, current))
+    old_date, new_date = _service_date(previous), _service_date(current)
+    old_rows = {_key(r): r for r in previous}
+    changes = list()
+    current_keys = set()
+    for row in current:
+        key = _key(row)
+        current_keys.add(key)
+        old = old_rows.get(key)
+        if old is None:
+            changes.append(dict(row, Op=INSERT, Changed=''))
+            continue
+        old_cmp, new_cmp = _comparable(old, old_date), _comparable(row, new_date)
+        if old_cmp != new_cmp:
+            changed = [k for k in BUS_SCHED_FIELD_NAMES if old_cmp[k] != new_cmp[k]]
+            changes.append(dict(row, Op=MODIFY, Changed=' '.join(changed)))
+    removes = [
+        dict(old, Op=REMOVE, Changed='')
+        for key, old in old_rows.items() if key not in current_keys
+    ]
+    return removes + changes
+
+
+def latest_schedule_file(file_prefix: str, date: str = '') -> str:
+    """Return path of the most recent saved schedule csv, None if there is none.
+
+    Day partitions are searched newest first, stopping at the first one
+    holding a csv of the route.
+
+    Args:
+        file_prefix (str): csv file name prefix of the route.
+        date (str): Optional; YYYY-MM-DD, ignore partitions after this date.
+    """
+    root = DATA_PATH_MAP['route_scheds']
+    limit = date.split('-') if date else None
+    for year in _listdir_desc(root):
+        for month in _listdir_desc(os.path.join(root, year)):
+            for day in _listdir_desc(os.path.join(root, year, month)):
+                if limit and [year, month, day] > limit:
+                    continue
+                day_dir = os.path.join(root, year, month, day)
+                names = [n for n in os.listdir(day_dir) if n.startswith(file_prefix)]
+                if names:
+                    # file names end in MM-DD-YYYY_HH-MM-SS.csv fetch time
+                    n = len(file_prefix)
+                    latest = max(names, key=lambda name: (
+                        name[n + 6:n + 10], name[n:n + 5], name[n + 11:]
+                    ))
+                    return os.path.join(day_dir, latest)
+    return None
+
+
+def _listdir_desc(path: str) -> list:
+    return sorted(os.listdir(path), reverse=True) if os.path.isdir(path) else []
+
+
+def read_schedule(path: str) -> list:
+    with open_text(path) as f:
+        return list(csv.DictReader(f))
@@ -0,0 +1,165 @@
+"""
+scheduler.py
+------------
+
+Long-lived process running the positions, routes, stops and incidents jobs,
+replacing the separate cron scripts.
+
+Each job runs in its own thread so a long routes/schedules fetch doesn't
+delay positions polls, a job is skipped if its previous run is still going,
+and all jobs share ratelimit.RATE_LIMITER with positions requests at real-time
+priority. Cadences are read from the optional [scheduler] section of
+config.ini:
+
+    [scheduler]
+    positions_interval = 10
+    routes_at = 03:00
+    stops_at = 04:00
+    incidents_interval = 60
+    rate_limit = 10
+    reserve = 2
+"""
+# built-in modules
+import argparse
+from threading import Lock, Thread
+from time import sleep, monotonic
+
+# libraries
+import schedule
+
+# project modules
+from extract import (
+    fetch_bus_positions, fetch_routes, fetch_stops, fetch_incidents
+)
+from incidents import IncidentTracker
+from metrics import JOB_DURATION, JOB_RUNS, serve as serve_metrics
+from ratelimit import RATE_LIMITER, REALTIME, BATCH, priority
+from utils import INCIDENTS_STATE_FILE, config_defaults
+
+SCHEDULER_DEFAULTS = {
+    'positions_interval': '10',
+    'routes_at': '03:00',
+    'stops_at': '04:00',
+    'incidents_interval': '60',
+    'rate_limit': '10',
+    'reserve': '2'
+}
+
+
+class Job:
+    """Function run by the scheduler that never overlaps with itself.
+
+    Args:
+        name (str): job name used in logs and metrics.
+        func: callable run by the job.
+        level (str): rate limiter priority of the job's requests.
+    """
+
+    def __init__(self, name: str, func, level: str = BATCH):
+        self.name = name
+        self.func = func
+        self.level = level
+        self.lock = Lock()
+        self.last_duration = None
+
+    def __call__(self) -> None:
+        """Start a run in a background thread unless one is in progress."""
+        if not self.lock.acquire(blocking=False):
+            JOB_RUNS.inc(job=self.name, status='skipped')
+            print(f'[{self.name}] previous run still in progress, skipped')
+            return
+        Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def _run(self) -> None:
+        start = monotonic()
+        status = 'ok'
+        try:
+            with priority(self.level):
+                self.func()
+        except Exception as e:
+            status = 'failed'
+            print(f'[{self.name}] failed: {e!r}')
+        finally:
+            self.last_duration = monotonic() - start
+            self.lock.release()
+        JOB_DURATION.observe(self.last_duration, job=self.name)
+        JOB_RUNS.inc(job=self.name, status=status)
+        print(f'[{self.name}] {status} in {self.last_duration:.2f}s')
+
+
+def build_jobs(listeners=(), position_csv=False) -> dict:
+    """Return job name -> Job for the default jobs.
+
+    Args:
+        listeners (list): callables receiving each PositionBatch.
+        position_csv (bool): also save each positions poll as a local csv.
+    """
+    def positions():
+        batch = fetch_bus_positions(to_firehose=True, to_csv=position_csv)
+        for listener in listeners:
+            listener(batch)
+
+    tracker = IncidentTracker(INCIDENTS_STATE_FILE)
+    return {
+        'positions': Job('positions', positions, level=REALTIME),
+        'routes': Job('routes', lambda: fetch_routes(
+            to_csv=True, get_sched=True, get_path=True
+        )),
+        'stops': Job('stops', lambda: fetch_stops(to_csv=True)),
+        'incidents': Job('incidents', lambda: fetch_incidents(
+            to_csv=True, tracker=tracker
+        ))
+    }
+
+
+def build_scheduler(jobs: dict, opts: dict) -> schedule.Scheduler:
+    """Return scheduler running jobs at the cadences in opts."""
+    scheduler = schedule.Scheduler()
+    if 'positions' in jobs:
+        scheduler.every(int(opts['positions_interval'])).seconds.do(jobs['positions'])
+    if 'routes' in jobs:
+        scheduler.every().day.at(opts['routes_at']).do(jobs['routes'])
+    if 'stops' in jobs:
+        scheduler.every().day.at(opts['stops_at']).do(jobs['stops'])
+    if 'incidents' in jobs:
+        scheduler.every(int(opts['incidents_interval'])).seconds.do(jobs['incidents'])
+    return scheduler
+
+
+def run(only: list = None, metrics_port: int = None, position_csv=False) -> None:
+    opts = config_defaults('scheduler', SCHEDULER_DEFAULTS)
+    RATE_LIMITER.configure(
+        rate=float(opts['rate_limit']), reserve=float(opts['reserve'])
+    )
+    if metrics_port:
+        serve_metrics(metrics_port)
+
+    jobs = build_jobs(position_csv=position_csv)
+    if only:
+        jobs = {name: job for name, job in jobs.items() if name in only}
+    scheduler = build_scheduler(jobs, opts)
+    print(f'[scheduler] running {", ".join(jobs)}')
+    while True:
+        scheduler.run_pending()
+        sleep(min(max(scheduler.idle_seconds or 1, 0), 1))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Run WMATA extract jobs on their schedules.'
+    )
+    arg_parser.add_argument(
+        '--job', action='append', dest='only',
+        choices=['positions', 'routes', 'stops', 'incidents'],
+        help='Only run the given job, may be repeated.'
+    )
+    arg_parser.add_argument(
+        '--metrics-port', type=int,
+        help='Serve Prometheus format metrics on localhost:PORT/metrics.'
+    )
+    arg_parser.add_argument(
+        '--csv', action='store_true', dest='position_csv',
+        help='Also save positions to hourly csv files; positions are only sent '
+             'to Firehose otherwise.'
+    )
+    run(**vars(arg_parser.parse_args()))
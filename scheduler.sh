@@ -0,0 +1,5 @@
+#!/usr/bin/env bash
+cd ~/jk-apps/bus_wmata/
+source wmata_env/bin/activate
+# long-lived process running positions, routes, stops and incidents jobs
+python scheduler.py --metrics-port 9108
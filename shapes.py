@@ -0,0 +1,220 @@
+"""
+shapes.py
+---------
+
+Deduplicated, compressed storage of route path shapes.
+
+Path details repeat every shape point as a full row and the same shapes are
+fetched every day. Instead each direction's shape is stored once as an
+encoded polyline (zigzag deltas written as base64-like varints, the Google
+polyline format) in a file named by its content hash, and a small per-day
+shape_map csv maps RouteID/DirectionNum to the shape ID:
+
+    data/shapes/<shape id>.polyline
+    data/shape_map/YYYY/MM/DD/shape_map_<route id>_<timestamp>.csv
+
+Coordinates use 6 decimal places, the precision of the WMATA API, so
+decoding returns the original points.
+"""
+# built-in modules
+import os
+import csv
+import hashlib
+import tempfile
+from functools import lru_cache
+from math import cos, hypot, radians
+
+# project modules
+from compression import open_text
+from utils import SAVE_PATH_SHAPES, DATA_PATH_MAP
+
+PRECISION = 6
+
+
+def _encode_value(value: int, out: list) -> None:
+    value = ~(value << 1) if value < 0 else value << 1  # zigzag
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points: list, precision: int = PRECISION) -> str:
+    """Return encoded polyline of (lat, lon) points."""
+    factor = 10 ** precision
+    out = list()
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        lat, lon = round(lat * factor), round(lon * factor)
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lon - prev_lon, out)
+        prev_lat, prev_lon = lat, lon
+    return ''.join(out)
+
+
+def decode_polyline(encoded: str, precision: int = PRECISION) -> list:
+    """Inverse of encode_polyline, returns list of (lat, lon) tuples."""
+    factor = 10 ** precision
+    points = list()
+    coords = [0, 0]
+    index = 0
+    while index < len(encoded):
+        for i in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            coords[i] += ~(result >> 1) if result & 1 else result >> 1
+        points.append((coords[0] / factor, coords[1] / factor))
+    return points
+
+
+def shape_id(encoded: str) -> str:
+    """Return content hash identifying an encoded shape."""
+    return hashlib.sha1(encoded.encode('ascii')).hexdigest()[:16]
+
+
+def shape_path(shape: str, root: str = SAVE_PATH_SHAPES) -> str:
+    return os.path.join(root, shape + '.polyline')
+
+
+def save_shape(encoded: str, root: str = SAVE_PATH_SHAPES) -> str:
+    """Store encoded shape unless already present, returns its shape ID."""
+    shape = shape_id(encoded)
+    path = shape_path(shape, root)
+    if not os.path.exists(path):
+        os.makedirs(root, exist_ok=True)
+        # a temp file per writer, threads of one process included
+        fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, mode='w') as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)  # concurrent writers store identical content
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return shape
+
+
+@lru_cache(maxsize=1024)
+def load_shape(shape: str, root: str = SAVE_PATH_SHAPES) -> tuple:
+    """Return the (lat, lon) points of a stored shape."""
+    with open(shape_path(shape, root)) as f:
+        return tuple(decode_polyline(f.read()))
+
+
+def compact_path_shapes(resp_json: dict, root: str = SAVE_PATH_SHAPES) -> list:
+    """Store path details shapes, returning a shape_map row per direction.
+
+    Args:
+        resp_json (dict): decoded path details response, not modified.
+        root (str): shapes directory.
+    """
+    rows = list()
+    for direction, trip_elem in resp_json.items():
+        if direction in ('Name', 'RouteID') or not trip_elem:
+            continue
+        shape_points = sorted(trip_elem['Shape'], key=lambda p: p['SeqNum'])
+        encoded = encode_polyline((p['Lat'], p['Lon']) for p in shape_points)
+        rows.append({
+            'RouteID': resp_json['RouteID'],
+            'DirectionNum': trip_elem['DirectionNum'],
+            'DirectionText': trip_elem['DirectionText'],
+            'TripHeadsign': trip_elem['TripHeadsign'],
+            'ShapeID': save_shape(encoded, root),
+            'Points': len(shape_points)
+        })
+    return rows
+
+
+def load_route_shapes(date: str = '', root: str = SAVE_PATH_SHAPES) -> dict:
+    """Return (RouteID, DirectionNum) -> shape points for a day.
+
+    Args:
+        date (str): Optional; YYYY-MM-DD, defaults to the latest day with a
+            shape map. If a day has no shape map the latest earlier one is used.
+        root (str): shapes directory.
+    """
+    map_root = DATA_PATH_MAP['shape_map']
+    day_dirs = sorted(
+        os.path.join(map_root, y, m, d)
+        for y in _listdir(map_root)
+        for m in _listdir(os.path.join(map_root, y))
+        for d in _listdir(os.path.join(map_root, y, m))
+    )
+    if date:
+        limit = os.path.join(map_root, *date.split('-'))
+        day_dirs = [d for d in day_dirs if d <= limit]
+    if not day_dirs:
+        return dict()
+
+    shapes = dict()
+    # file names end in the fetch time, the latest fetch of a route wins
+    for name in sorted(os.listdir(day_dirs[-1]), key=lambda n: n.rsplit('_', 2)[-2:]):
+        with open_text(os.path.join(day_dirs[-1], name)) as f:
+            for row in csv.DictReader(f):
+                key = (row['RouteID'], int(row['DirectionNum']))
+                shapes[key] = load_shape(row['ShapeID'], root)
+    return shapes
+
+
+def _listdir(path: str) -> list:
+    return os.listdir(path) if os.path.isdir(path) else []
+
+
+# meters per degree of latitude; longitude degrees are scaled by cos(lat)
+METERS_PER_DEGREE = 111195.0
+
+
+class RouteLine:
+    """Polyline with distances along it, for projecting vehicle positions.
+
+    Points are converted to local planar meters around the first point,
+    accurate enough at the scale of a bus route.
+
+    Args:
+        points (list): (lat, lon) tuples in route order.
+    """
+
+    def __init__(self, points):
+        points = list(points)
+        if not points:
+            raise ValueError('route line needs at least one point')
+        self.lat0 = points[0][0]
+        self.kx = METERS_PER_DEGREE * cos(radians(self.lat0))
+        self.xy = [self._xy(lat, lon) for lat, lon in points]
+        self.distances = [0.0]  # distance along the line of each point
+        for (x1, y1), (x2, y2) in zip(self.xy, self.xy[1:]):
+            self.distances.append(self.distances[-1] + hypot(x2 - x1, y2 - y1))
+
+    @property
+    def length(self) -> float:
+        return self.distances[-1]
+
+    def _xy(self, lat: float, lon: float) -> tuple:
+        return lon * self.kx, lat * METERS_PER_DEGREE
+
+    def project(self, lat: float, lon: float, start: int = 0, end: int = None) -> tuple:
+        """Return (distance along line, offset from line, segment index) of the
+        nearest point on segments start to end of the line."""
+        px, py = self._xy(lat, lon)
+        if len(self.xy) == 1:
+            x, y = self.xy[0]
+            return 0.0, hypot(px - x, py - y), 0
+        best = None
+        end = len(self.xy) - 1 if end is None else min(end, len(self.xy) - 1)
+        for i in range(max(start, 0), end):
+            (x1, y1), (x2, y2) = self.xy[i], self.xy[i + 1]
+            dx, dy = x2 - x1, y2 - y1
+            seg_len2 = dx * dx + dy * dy
+            t = ((px - x1) * dx + (py - y1) * dy) / seg_len2 if seg_len2 else 0.0
+            t = max(0.0, min(1.0, t))
+            offset = hypot(px - x1 - t * dx, py - y1 - t * dy)
+            if best is None or offset < best[1]:
+                distance = self.distances[i] + t * (self.distances[i + 1] - self.distances[i])
+                best = (distance, offset, i)
+        return best
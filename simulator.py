@@ -0,0 +1,240 @@
+"""
+simulator.py
+------------
+
+Offline WMATA API simulator for load testing without network access.
+
+In replay mode, responses recorded under a fixtures directory are served for
+every API_END_POINTS path, with optional latency, 429/5xx injection and a
+requests/second limit. In record mode, requests are forwarded upstream and
+the responses saved as fixtures.
+
+Fixtures are stored as <fixtures>/<endpoint>/<params>.json, e.g.
+fixtures/jRouteSchedule/RouteID=70.json; a request without a recording for
+its params is served the endpoint's default.json, or any recording of it.
+
+    python simulator.py --fixtures fixtures --record
+    python simulator.py --fixtures fixtures --latency 50 --error-rate 0.01
+    python extract.py routes --sched --api-host http://127.0.0.1:8000
+"""
+# built-in modules
+import os
+import argparse
+import random
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from time import sleep, monotonic
+from urllib.parse import urlparse, parse_qsl, quote
+
+# libraries
+import requests
+
+# project modules
+from wmata import API_END_POINTS
+
+UPSTREAM_HOST = 'https://api.wmata.com'
+DEFAULT_FIXTURE = 'default.json'
+RATE_LIMIT_BODY = b'{"statusCode": 429, "message": "Rate limit is exceeded."}'
+SERVER_ERROR_BODY = b'{"statusCode": 500, "message": "Simulated server error."}'
+
+
+def fixture_name(query: str) -> str:
+    """Return fixture file name for a request query string."""
+    params = sorted(
+        (k, v) for k, v in parse_qsl(query) if k.lower() != 'api_key'
+    )
+    if not params:
+        return DEFAULT_FIXTURE
+    return quote('&'.join(f'{k}={v}' for k, v in params), safe='=&') + '.json'
+
+
+class TokenBucket:
+    """Allow up to rate requests/second with bursts of up to burst requests."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class SimulatorServer(ThreadingHTTPServer):
+    """Replays or records WMATA responses.
+
+    Args:
+        address (tuple): (host, port) to bind, port 0 picks a free port.
+        fixtures (str): fixtures directory.
+        record (bool): forward requests upstream and save the responses.
+        latency (float): milliseconds added to every response.
+        jitter (float): max random milliseconds added on top of latency.
+        error_rate (float): fraction of requests answered with a 500.
+        throttle_rate (float): fraction of requests answered with a 429.
+        rate_limit (float): requests/second allowed before answering 429,
+            WMATA's default tier allows 10.
+    """
+    daemon_threads = True
+
+    def __init__(
+            self, address, fixtures: str, record=False, latency=0.0,
+            jitter=0.0, error_rate=0.0, throttle_rate=0.0, rate_limit=0.0
+    ):
+        super().__init__(address, SimulatorHandler)
+        self.fixtures = fixtures
+        self.record = record
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.bucket = TokenBucket(rate_limit) if rate_limit else None
+        self.paths = {
+            urlparse(url).path: os.path.basename(urlparse(url).path)
+            for url in API_END_POINTS.values()
+        }
+        self.stats = Counter()
+        self.stats_lock = Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, stat: str) -> None:
+        with self.stats_lock:
+            self.stats[stat] += 1
+
+    def load(self, endpoint: str, query: str):
+        """Return recorded response bytes, or None if nothing was recorded."""
+        endpoint_dir = os.path.join(self.fixtures, endpoint)
+        for name in [fixture_name(query), DEFAULT_FIXTURE]:
+            path = os.path.join(endpoint_dir, name)
+            if os.path.isfile(path):
+                with open(path, mode='rb') as f:
+                    return f.read()
+        if os.path.isdir(endpoint_dir):
+            for name in sorted(os.listdir(endpoint_dir)):
+                with open(os.path.join(endpoint_dir, name), mode='rb') as f:
+                    return f.read()
+        return None
+
+    def save(self, endpoint: str, query: str, content: bytes) -> None:
+        endpoint_dir = os.path.join(self.fixtures, endpoint)
+        os.makedirs(endpoint_dir, exist_ok=True)
+        with open(os.path.join(endpoint_dir, fixture_name(query)), mode='wb') as f:
+            f.write(content)
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):  # keep load test output readable
+        pass
+
+    def _send(self, status: int, content: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        endpoint = server.paths.get(url.path)
+        if endpoint is None:
+            server.count('not_found')
+            self.send_error(404, f'Unknown endpoint: {url.path}')
+            return
+
+        if server.latency or server.jitter:
+            sleep((server.latency + random.uniform(0, server.jitter)) / 1000)
+        if server.bucket is not None and not server.bucket.allow():
+            server.count('rate_limited')
+            self._send(429, RATE_LIMIT_BODY)
+            return
+        if server.throttle_rate and random.random() < server.throttle_rate:
+            server.count('throttled')
+            self._send(429, RATE_LIMIT_BODY)
+            return
+        if server.error_rate and random.random() < server.error_rate:
+            server.count('errors')
+            self._send(500, SERVER_ERROR_BODY)
+            return
+
+        if server.record:
+            resp = requests.get(
+                url=UPSTREAM_HOST + self.path,
+                headers={'api_key': self.headers.get('api_key', '')}
+            )
+            if resp.status_code == requests.codes.ok:
+                server.save(endpoint, url.query, resp.content)
+                server.count('recorded')
+            self._send(resp.status_code, resp.content)
+            return
+
+        content = server.load(endpoint, url.query)
+        if content is None and endpoint == 'Validate':
+            content = b''  # any key is valid
+        if content is None:
+            server.count('missing')
+            self.send_error(404, f'No fixture recorded for {endpoint}')
+            return
+        server.count('served')
+        self._send(200, content)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Offline WMATA API simulator.'
+    )
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8000)
+    arg_parser.add_argument(
+        '--fixtures', default='fixtures',
+        help='Directory of recorded responses.'
+    )
+    arg_parser.add_argument(
+        '--record', action='store_true',
+        help='Forward requests to api.wmata.com and save the responses.'
+    )
+    arg_parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='Milliseconds added to every response.'
+    )
+    arg_parser.add_argument(
+        '--jitter', type=float, default=0.0,
+        help='Max random milliseconds added on top of latency.'
+    )
+    arg_parser.add_argument(
+        '--error-rate', type=float, default=0.0,
+        help='Fraction of requests answered with a 500.'
+    )
+    arg_parser.add_argument(
+        '--throttle-rate', type=float, default=0.0,
+        help='Fraction of requests answered with a 429.'
+    )
+    arg_parser.add_argument(
+        '--rate-limit', type=float, default=0.0,
+        help='Requests/second allowed before answering 429.'
+    )
+    args = vars(arg_parser.parse_args())
+    address = (args.pop('host'), args.pop('port'))
+    simulator = SimulatorServer(address, **args)
+    print(f'[simulator] serving {simulator.fixtures} on {simulator.url}')
+    try:
+        simulator.serve_forever()
+    finally:
+        print(f'[simulator] stats: {dict(simulator.stats)}')
+        simulator.server_close()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+# project modules
+from backfill import WorkUnit, date_range, filter_routes, partition_exists, plan_backfill
+
+
+def _touch(data_type: str, route_id: str, date: str) -> None:
+    path = os.path.join('data', data_type, *date.split('-'))
+    os.makedirs(path, exist_ok=True)
+    name = f'{data_type}_{route_id}_08-10-2021_03-00-00.csv'
+    with open(os.path.join(path, name), 'w'):
+        pass
+
+
+class BackfillTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)  # partitions are looked up relative to data/
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_date_range(self):
+        self.assertEqual(
+            date_range('2021-07-30', '2021-08-02'),
+            ['2021-07-30', '2021-07-31', '2021-08-01', '2021-08-02']
+        )
+        self.assertEqual(date_range('2021-08-10', '2021-08-10'), ['2021-08-10'])
+        self.assertEqual(date_range('2021-08-10', '2021-08-09'), [])
+
+    def test_filter_routes(self):
+        route_ids = ['70', '79', 'S2', 'S9', '7A']
+        self.assertEqual(filter_routes(route_ids, None), route_ids)
+        self.assertEqual(filter_routes(route_ids, ['7*']), ['70', '79', '7A'])
+        self.assertEqual(filter_routes(route_ids, ['S2', '79']), ['79', 'S2'])
+        self.assertEqual(filter_routes(route_ids, ['s*']), [])  # case sensitive
+
+    def test_plan_skips_saved_partitions(self):
+        _touch('route_scheds', '70', '2021-08-10')
+        units = plan_backfill('2021-08-10', '2021-08-11', ['70', '79'], ['route_scheds'])
+        self.assertEqual(units, [
+            WorkUnit('route_scheds', '79', '2021-08-10'),
+            WorkUnit('route_scheds', '70', '2021-08-11'),
+            WorkUnit('route_scheds', '79', '2021-08-11')
+        ])
+        self.assertEqual(len(plan_backfill(
+            '2021-08-10', '2021-08-11', ['70', '79'], ['route_scheds'],
+            skip_existing=False
+        )), 4)
+
+    def test_path_details_partitions(self):
+        unit = WorkUnit('path_details', '70', '2021-08-10')
+        _touch('path_details_stops', '70', '2021-08-10')
+        self.assertFalse(partition_exists(unit))  # shape_map is missing
+        _touch('shape_map', '70', '2021-08-10')
+        self.assertTrue(partition_exists(unit))
+        self.assertFalse(partition_exists(unit._replace(route_id='79')))
+        self.assertFalse(partition_exists(unit._replace(kind='route_scheds')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+# project modules
+from bunching import BunchingDetector
+from positions import PositionBatch
+from shapes import METERS_PER_DEGREE
+
+LAT, LON = 38.9, -77.0
+# a 10 km shape heading north with a point every 100 m
+SHAPE = [(LAT + i * 100 / METERS_PER_DEGREE, LON) for i in range(101)]
+
+
+def _batch(time: str, meters: dict) -> PositionBatch:
+    return PositionBatch.from_records([
+        {
+            'VehicleID': vehicle, 'RouteID': '70', 'DirectionNum': 0,
+            'DateTime': f'2021-08-10T10:{time}', 'Lon': LON,
+            'Lat': LAT + distance / METERS_PER_DEGREE
+        }
+        for vehicle, distance in meters.items()
+    ])
+
+
+class BunchingTestCase(unittest.TestCase):
+
+    def test_bunching_and_gaps(self):
+        detector = BunchingDetector(shapes={('70', 0): SHAPE}, to_csv=False)
+        events = detector.detect(_batch('00:00', {
+            '1': 1000, '2': 1100, '3': 2500, '4': 4000, '5': 8500, '6': 9950
+        }))
+        self.assertEqual(
+            sorted(
+                (e['Event'], e['VehicleID'], e['LeadVehicleID'], e['Spacing'])
+                for e in events
+            ),
+            [('bunching', '1', '2', 100.0), ('gap', '4', '5', 4500.0)]
+        )  # vehicle 6 is within the terminal buffer
+
+        # the gap still holds and isn't repeated, the bunching ended
+        events = detector.detect(_batch('00:30', {
+            '1': 1050, '2': 1650, '3': 2600, '4': 4100, '5': 9700
+        }))
+        self.assertEqual(
+            sorted((e['Event'], e['VehicleID']) for e in events), [('bunching_end', '1')]
+        )
+        self.assertEqual(detector.segments['2'], (('70', 0), 16))
+
+    def test_off_route_and_unknown_shapes(self):
+        detector = BunchingDetector(shapes={('70', 0): SHAPE}, to_csv=False)
+        batch = PositionBatch.from_records([
+            {'VehicleID': '1', 'RouteID': '70', 'DirectionNum': 0, 'Lat': LAT + 0.02,
+             'Lon': LON + 0.01, 'DateTime': '2021-08-10T10:00:00'},
+            {'VehicleID': '2', 'RouteID': '70', 'DirectionNum': 0, 'Lat': LAT + 0.0201,
+             'Lon': LON + 0.01, 'DateTime': '2021-08-10T10:00:00'},
+            {'VehicleID': '3', 'RouteID': '79', 'DirectionNum': 0, 'Lat': LAT + 0.02,
+             'Lon': LON, 'DateTime': '2021-08-10T10:00:00'}
+        ])
+        self.assertEqual(detector.detect(batch), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
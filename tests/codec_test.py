@@ -0,0 +1,43 @@
+import json
+import unittest
+
+# project modules
+import codec
+
+STOPS = {'Stops': [
+    {'StopID': str(1000000 + i), 'Name': f'STOP "{i}"', 'Lat': 38.8, 'Lon': -77.1,
+     'Routes': ['70', '79']} for i in range(50)
+]}
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def test_iter_array(self):
+        data = json.dumps(STOPS, indent=2).encode()
+        self.assertEqual(list(codec.iter_array(data, 'Stops')), STOPS['Stops'])
+
+        # same result when fed in small chunks splitting tokens
+        chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+        self.assertEqual(list(codec.iter_array(chunks, 'Stops')), STOPS['Stops'])
+
+    def test_iter_array_empty_and_missing(self):
+        self.assertEqual(list(codec.iter_array(b'{"Stops": []}', 'Stops')), [])
+        with self.assertRaises(json.JSONDecodeError):
+            list(codec.iter_array(b'{"Routes": []}', 'Stops'))
+        with self.assertRaises(json.JSONDecodeError):
+            list(codec.iter_array(b'{"Stops": [{"StopID": "1"}, {"Sto', 'Stops'))
+
+    def test_decode_once(self):
+        class Resp:
+            content = json.dumps(STOPS).encode()
+
+        resp = Resp()
+        self.assertIs(codec.decode(resp), codec.decode(resp))
+
+    def test_dumps_lines(self):
+        lines = codec.dumps_lines(STOPS['Stops'][:2]).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], STOPS['Stops'][:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+# project modules
+import coerce
+from positions import PositionBatch, MISSING_INT, MISSING_TIME
+
+
+class CoerceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sched = [
+            {
+                'Name': '70', 'DirectionNum': '0', 'StopSeq': 1, 'StopID': '1001',
+                'StartTime': '2021-08-10T05:00:00', 'EndTime': '2021-08-10T06:10:00',
+                'Time': '2021-08-10T05:00:00', 'TripID': '1', 'RouteID': '70'
+            },
+            {
+                'Name': '70', 'DirectionNum': '0', 'StopSeq': 2, 'StopID': '1002',
+                'StartTime': '2021-08-10T05:00:00', 'EndTime': '',
+                'Time': 'not a time', 'TripID': '1', 'RouteID': '70'
+            },
+            {
+                'Name': '70', 'DirectionNum': None, 'StopSeq': 3, 'StopID': '1003',
+                'StartTime': '2021-08-10T05:00:00', 'EndTime': None,
+                'Time': '2021-08-10T05:02:00', 'TripID': '1', 'RouteID': '70'
+            }
+        ]
+
+    def test_coerce_and_quarantine(self):
+        with tempfile.TemporaryDirectory() as root:
+            batch = coerce.coerce_rows('route_scheds', self.sched, root)
+            self.assertEqual(len(batch), 2)
+            self.assertEqual(batch.column('StopSeq').tolist(), [1, 3])
+            self.assertEqual(batch.column('DirectionNum').tolist(), [0, MISSING_INT])
+            self.assertEqual(batch.column('EndTime')[1], MISSING_TIME)
+            self.assertEqual(batch.column('Time')[1] - batch.column('Time')[0], 120)
+
+            quarantined = [
+                os.path.join(dir_path, name)
+                for dir_path, _, names in os.walk(root) for name in names
+            ]
+            self.assertEqual(len(quarantined), 1)
+            with open(quarantined[0]) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(lines[0]['row'], self.sched[1])
+            self.assertTrue(lines[0]['error'].startswith('Time: '))
+
+        rows = list(batch)
+        self.assertEqual(rows[0]['DirectionNum'], 0)
+        self.assertEqual(rows[0]['Time'], '2021-08-10T05:00:00')
+        self.assertIsNone(rows[1]['DirectionNum'])
+        self.assertIsNone(rows[1]['EndTime'])
+        self.assertEqual(list(rows[0]), coerce.DATA_FIELDNAMES_MAP['route_scheds'])
+
+    def test_position_batch_from_typed(self):
+        records = [{
+            'BlockNumber': '7000', 'DateTime': '2021-08-10T10:20:42',
+            'Deviation': 1, 'DirectionNum': 1, 'DirectionText': 'NORTH',
+            'Lat': 38.9, 'Lon': -77.0, 'RouteID': '70', 'TripEndTime': None,
+            'TripHeadsign': 'SILVER SPRING', 'TripID': '20000',
+            'TripStartTime': '2021-08-10T10:00:00', 'VehicleID': '3000'
+        }]
+        typed = coerce.coerce_rows('bus_positions', records)
+        # timestamps were parsed by coerce_rows, not again for the batch
+        with mock.patch('positions.to_epoch', side_effect=AssertionError):
+            batch = PositionBatch.from_typed(typed)
+        self.assertEqual(batch.columns['DateTime'].tolist(), typed.column('DateTime').tolist())
+        self.assertEqual(list(batch.rows()), list(PositionBatch.from_records(records).rows()))
+
+    def test_typed_disabled(self):
+        self.assertIs(coerce.typed('route_scheds', self.sched), self.sched)
+
+
+if __name__ == '__main__':
+    unittest.main()
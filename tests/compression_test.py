@@ -0,0 +1,60 @@
+import os
+import csv
+import gzip
+import tempfile
+import unittest
+
+# project modules
+import compression
+
+
+class CompressionTestCase(unittest.TestCase):
+
+    def test_parse_setting(self):
+        self.assertEqual(compression.parse_setting('gzip:9'), ('gzip', 9))
+        self.assertEqual(compression.parse_setting('gzip'), ('gzip', 6))
+        self.assertEqual(compression.parse_setting('none'), ('none', None))
+        with self.assertRaises(ValueError):
+            compression.parse_setting('brotli')
+
+    def test_open_text_append(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'rows.csv.gz')
+            for i in range(3):  # every append adds a gzip member
+                with compression.open_text(path, 'a', 'gzip', 1) as f:
+                    csv.writer(f).writerow([i, 'a,b'])
+            with compression.open_text(path) as f:
+                self.assertEqual(
+                    list(csv.reader(f)), [['0', 'a,b'], ['1', 'a,b'], ['2', 'a,b']]
+                )
+
+    def test_firehose_records(self):
+        compression.codec_for.cache_clear()
+        original = compression.config_defaults
+        compression.config_defaults = lambda section, defaults: dict(
+            defaults, firehose_default='gzip'
+        )
+        try:
+            lines = [b'{"VehicleID": "%d"}\n' % i for i in range(100000)]
+            records = compression.firehose_records(lines, 'bus_positions')
+        finally:
+            compression.config_defaults = original
+            compression.codec_for.cache_clear()
+        self.assertEqual(len(records), 3)
+        # concatenated records decompress as one stream, as stored in S3
+        data = b''.join(record['Data'] for record in records)
+        self.assertEqual(gzip.decompress(data), b''.join(lines))
+
+    def test_record_batches(self):
+        small = [{'Data': b'x' * 1000}] * 600
+        self.assertEqual(
+            [len(batch) for batch in compression.record_batches(small)], [500, 100]
+        )
+        large = [{'Data': b'x' * 1000 * 1000}] * 10
+        self.assertEqual(
+            [len(batch) for batch in compression.record_batches(large)], [4, 4, 2]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import tempfile
+import unittest
+
+# project modules
+import dedup
+from positions import PositionBatch
+
+
+class Clock:
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class DedupTestCase(unittest.TestCase):
+
+    def test_record_keys(self):
+        row = {'VehicleID': '7001', 'DateTime': '2021-08-10T10:20:42', 'Lat': 38.9}
+        key = dedup.record_key('bus_positions', row)
+        self.assertEqual(key, dedup.record_key('bus_positions', dict(row, Lat=39.0)))
+        self.assertNotEqual(
+            key, dedup.record_key('bus_positions', dict(row, DateTime='2021-08-10T10:20:52'))
+        )
+        self.assertEqual(dedup.position_keys(PositionBatch.from_records([row])), [key])
+        # types without key fields are keyed by all fields
+        stop = {'StopID': '1', 'Name': 'A', 'Lat': 38.9, 'Lon': -77.0, 'Routes': '70'}
+        self.assertNotEqual(
+            dedup.record_key('stops', stop), dedup.record_key('stops', dict(stop, Name='B'))
+        )
+
+    def test_position_without_time(self):
+        rows = [
+            {'VehicleID': '7001', 'DateTime': None, 'Lat': 38.9},
+            {'VehicleID': '7001', 'DateTime': '2021-08-10T10:20:42', 'Lat': 38.9}
+        ]
+        keys = dedup.position_keys(PositionBatch.from_records(rows))
+        self.assertEqual(keys, [dedup.record_key('bus_positions', row) for row in rows])
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_window_and_persistence(self):
+        clock = Clock(1_000_000)
+        with tempfile.TemporaryDirectory() as root:
+            index = dedup.DedupIndex('incidents', window=600, root=root, clock=clock)
+            self.assertEqual(index.new([1, 2, 2, 3]), [0, 1, 3])
+            index.add([1, 2, 3])
+            self.assertEqual(index.new([3, 4]), [1])
+
+            # a restarted process loads delivered keys from disk
+            restarted = dedup.DedupIndex('incidents', window=600, root=root, clock=clock)
+            self.assertEqual(len(restarted), 3)
+            self.assertEqual(restarted.new([1, 4]), [1])
+
+            clock.now += 600 + dedup.BUCKET_SECONDS
+            self.assertEqual(restarted.new([1, 4]), [0, 1])
+            self.assertEqual(len(restarted), 0)
+            expired = dedup.DedupIndex('incidents', window=600, root=root, clock=clock)
+            self.assertEqual(len(expired), 0)
+
+    def test_fresh(self):
+        rows = [
+            {'IncidentID': 'A1', 'DateUpdated': '2021-08-10T10:00:00'},
+            {'IncidentID': 'A2', 'DateUpdated': '2021-08-10T10:00:00'}
+        ]
+        with tempfile.TemporaryDirectory() as root:
+            dedup.enable(root)
+            try:
+                with self.assertRaises(OSError):
+                    with dedup.fresh('incidents', rows):
+                        raise OSError('sink failed')
+                with dedup.fresh('incidents', rows) as new_rows:
+                    self.assertEqual(new_rows, rows)  # nothing was committed
+                with dedup.fresh('incidents', rows + [dict(rows[0], DateUpdated='x')]) as new_rows:
+                    self.assertEqual(new_rows, [dict(rows[0], DateUpdated='x')])
+            finally:
+                dedup._root = None
+                dedup._indexes.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
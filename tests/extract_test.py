@@ -0,0 +1,51 @@
+import json
+import unittest
+from unittest import mock
+
+# project modules
+import extract
+from codec import dumps
+
+# BusPositions elements in the order and types WMATA sends them
+BUS_POSITIONS = [
+    {
+        'VehicleID': '3101', 'Lat': 38.912345, 'Lon': -77.021, 'Deviation': 3,
+        'DateTime': '2021-08-10T10:20:42', 'TripID': '12345', 'RouteID': '70',
+        'DirectionNum': 0, 'DirectionText': 'NORTH',
+        'TripHeadsign': 'SILVER SPRING', 'TripStartTime': '2021-08-10T10:00:00',
+        'TripEndTime': '2021-08-10T11:05:00', 'BlockNumber': '7001'
+    },
+    {
+        'VehicleID': '3102', 'Lat': 38.9, 'Lon': -77.0, 'Deviation': -1.5,
+        'DateTime': None, 'TripID': '12346', 'RouteID': '79',
+        'DirectionNum': 1, 'DirectionText': 'SOUTH', 'TripHeadsign': 'ARCHIVES',
+        'TripStartTime': '2021-08-10T10:10:00', 'TripEndTime': '2021-08-10T11:00:00',
+        'BlockNumber': '7902'
+    }
+]
+
+
+class Resp:
+    status_code = 200
+    content = json.dumps({'BusPositions': BUS_POSITIONS}).encode()
+
+
+class FetchBusPositionsTestCase(unittest.TestCase):
+
+    def test_firehose_lines_unchanged(self):
+        sent = list()
+        with mock.patch('extract.get_bus_position', return_value=Resp()), \
+                mock.patch('extract._send_lines', lambda lines, *args, **kw: sent.extend(lines)):
+            batch = extract.fetch_bus_positions(to_firehose=True)
+
+        self.assertEqual(len(batch), 2)
+        # the fetched elements are encoded as they are, not rebuilt from batch
+        self.assertEqual(sent, [dumps(bus_pos) + b'\n' for bus_pos in BUS_POSITIONS])
+        records = [json.loads(line) for line in sent]
+        self.assertEqual(records, BUS_POSITIONS)
+        self.assertEqual(list(records[0]), list(BUS_POSITIONS[0]))
+        self.assertIsInstance(records[0]['Deviation'], int)
+
+
+if __name__ == '__main__':
+    unittest.main()
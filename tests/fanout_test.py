@@ -0,0 +1,101 @@
+import json
+import unittest
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+# project modules
+from fanout import FanoutServer, PositionFanout
+from position_store import PositionStore
+from positions import PositionBatch
+
+
+def _position(vehicle: str, route: str, time: str, lat: float) -> dict:
+    return {
+        'VehicleID': vehicle, 'RouteID': route, 'DateTime': f'2021-08-10T10:{time}',
+        'Lat': lat, 'Lon': -77.0, 'DirectionNum': 0
+    }
+
+
+def _events(subscription) -> list:
+    events = list()
+    while not subscription.queue.empty():
+        event, data = subscription.queue.get_nowait().decode().strip().split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+class FanoutTestCase(unittest.TestCase):
+
+    def test_deltas_and_filters(self):
+        fanout = PositionFanout()
+        fanout.publish(PositionBatch.from_records([
+            _position('1', '70', '00:00', 38.90), _position('2', '79', '00:00', 38.90)
+        ]))
+        route = fanout.subscribe(routes=['70'])
+        area = fanout.subscribe(bbox=(38.85, -77.1, 38.95, -76.9))
+        self.assertEqual(
+            [[p['VehicleID'] for p in data['positions']] for _, data in _events(route)],
+            [['1']]
+        )
+        self.assertEqual(_events(area)[0][0], 'snapshot')
+
+        # vehicle 1 unchanged, 2 moves out of the area, 3 appears on route 70
+        fanout.publish(PositionBatch.from_records([
+            _position('1', '70', '00:00', 38.90), _position('2', '79', '00:10', 39.00),
+            _position('3', '70', '00:10', 38.91)
+        ]))
+        (event, data), = _events(route)
+        self.assertEqual(event, 'delta')
+        self.assertEqual([p['VehicleID'] for p in data['positions']], ['3'])
+        self.assertEqual(data['removed'], [])
+        (_, data), = _events(area)
+        self.assertEqual([p['VehicleID'] for p in data['positions']], ['3'])
+        self.assertEqual(data['removed'], ['2'])
+
+        # vehicle 1 is no longer reported
+        fanout.publish(PositionBatch.from_records([_position('3', '70', '00:10', 38.91)]))
+        (_, data), = _events(route)
+        self.assertEqual((data['positions'], data['removed']), ([], ['1']))
+
+    def test_slow_subscriber_dropped(self):
+        fanout = PositionFanout()
+        subscription = fanout.subscribe(max_queued=2)
+        for second in range(3):
+            fanout.publish(PositionBatch.from_records([
+                _position('1', '70', f'00:0{second}', 38.9)
+            ]))
+        self.assertTrue(subscription.closed)
+        self.assertNotIn(subscription, fanout.subscriptions)
+
+    def test_history(self):
+        store = PositionStore()
+        for time in ['00:00', '05:00', '15:00']:
+            store(PositionBatch.from_records([
+                _position('1', '70', time, 38.9), _position('2', '79', time, 38.9)
+            ]))
+        server = FanoutServer(('127.0.0.1', 0), PositionFanout(), store=store)
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}/history?'.format(server.server_address[1])
+        try:
+            with urlopen(url + 'vehicle=1&minutes=10', timeout=5) as resp:
+                positions = json.loads(resp.read())['positions']
+            self.assertEqual(
+                [p['DateTime'] for p in positions],
+                ['2021-08-10T10:05:00', '2021-08-10T10:15:00']
+            )
+            with urlopen(url + 'route=79&minutes=1', timeout=5) as resp:
+                positions = json.loads(resp.read())['positions']
+            self.assertEqual([(p['VehicleID'], p['Deviation']) for p in positions], [('2', None)])
+            for query in ['minutes=10', 'vehicle=1&minutes=nan',
+                          'route=79&minutes=inf', 'vehicle=1&minutes=-5']:
+                with self.assertRaises(HTTPError) as e:
+                    urlopen(url + query, timeout=5)
+                self.assertEqual(e.exception.code, 400)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import csv
+import gzip
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+# project modules
+import extract
+from codec import dumps, loads
+from compression import NONE
+from flatten_pool import route_sched_outputs, path_details_outputs
+from schedule_diff import diff_schedules, read_schedule
+from shapes import compact_path_shapes
+from utils import BUS_SCHED_FIELD_NAMES
+from wmata import flatten_route_sched_data, flatten_path_details_data
+
+
+def _trip(trip_id: str, times: list) -> dict:
+    return {
+        'RouteID': '70', 'DirectionNum': '0', 'TripDirectionText': 'NORTH',
+        'TripHeadsign': 'SILVER SPRING', 'StartTime': '2021-08-10T05:00:00',
+        'EndTime': '2021-08-10T06:00:00', 'TripID': trip_id,
+        'StopTimes': [
+            {'StopID': str(1000 + seq), 'StopName': f'STOP {seq}',
+             'StopSeq': seq, 'Time': time}
+            for seq, time in enumerate(times, 1)
+        ]
+    }
+
+
+ROUTE_SCHED = {
+    'Name': '70 - ARCHIVES',
+    'Direction0': [
+        _trip('1', ['2021-08-10T05:00:00', '2021-08-10T05:07:00']),
+        _trip('3', ['2021-08-10T07:00:00'])
+    ],
+    'Direction1': None
+}
+# schedule saved by the previous fetch, trip 1 changed and 2 removed since
+PREVIOUS_SCHED = {
+    'Name': '70 - ARCHIVES',
+    'Direction0': [
+        _trip('1', ['2021-08-10T05:00:00', '2021-08-10T05:05:00']),
+        _trip('2', ['2021-08-10T06:00:00'])
+    ]
+}
+PREVIOUS_SCHED_FILE = os.path.join(
+    'data', 'route_scheds', '2021', '08', '10', 'route_scheds_70_08-09-2021_03-00-00.csv'
+)
+PATH_DETAILS = {
+    'RouteID': '70', 'Name': '70 - ARCHIVES',
+    'Direction0': {
+        'DirectionNum': '0', 'DirectionText': 'NORTH', 'TripHeadsign': 'SILVER SPRING',
+        'Stops': [
+            {'StopID': '1001', 'Name': 'STOP 1', 'Lat': 38.89, 'Lon': -77.08,
+             'Routes': ['70', '79']},
+            {'StopID': '1002', 'Name': 'STOP 2', 'Lat': 38.9, 'Lon': -77.07,
+             'Routes': ['70']}
+        ],
+        'Shape': [
+            {'Lat': 38.89 + i / 1000, 'Lon': -77.08, 'SeqNum': i} for i in range(1, 6)
+        ]
+    },
+    'Direction1': None
+}
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    return gzip.decompress(data) if codec == 'gzip' else data
+
+
+class FlattenPoolTestCase(unittest.TestCase):
+    """Worker outputs match what the sequential fetch saves."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)  # datasets are saved relative to data/
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def _saved(self, data, api_type: str, codec: str) -> bytes:
+        """Return decompressed contents of the file _save_csv writes."""
+        path = f'{api_type}.csv'
+        with mock.patch('extract._csv_path', return_value=path):
+            extract._save_csv(data=data, api_type=api_type)
+        with open(path, mode='rb') as f:
+            return _decompress(f.read(), codec)
+
+    def _save_previous_schedule(self) -> None:
+        os.makedirs(os.path.dirname(PREVIOUS_SCHED_FILE))
+        with open(PREVIOUS_SCHED_FILE, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=BUS_SCHED_FIELD_NAMES)
+            writer.writeheader()
+            writer.writerows(flatten_route_sched_data(PREVIOUS_SCHED))
+
+    def _assert_outputs(self, outputs: dict, expected: dict, codec: str) -> None:
+        self.assertEqual(list(outputs), list(expected))
+        for api_type, data in expected.items():
+            output = outputs[api_type]
+            self.assertEqual(output.rows, len(data))
+            self.assertEqual(
+                _decompress(output.data, codec), self._saved(data, api_type, codec)
+            )
+
+    def test_route_sched_outputs(self):
+        self._save_previous_schedule()
+        content = json.dumps(ROUTE_SCHED).encode()
+        for codec in (NONE, 'gzip'):
+            with self.subTest(codec=codec), \
+                    mock.patch('flatten_pool.codec_for', return_value=(codec, 6)), \
+                    mock.patch('extract.codec_for', return_value=(codec, 6)):
+                outputs = route_sched_outputs(content, '70', '2021-08-10', diff=True)
+
+                data = flatten_route_sched_data(loads(content))
+                changes = diff_schedules(read_schedule(PREVIOUS_SCHED_FILE), data)
+                self.assertEqual(len(changes), 3)  # removed, modified, inserted
+                self._assert_outputs(
+                    outputs, {'route_sched_changes': changes, 'route_scheds': data}, codec
+                )
+                self.assertEqual(
+                    outputs['route_sched_changes'].lines,
+                    b''.join(dumps(change) + b'\n' for change in changes)
+                )
+                self.assertIsNone(outputs['route_scheds'].lines)
+
+    def test_path_details_outputs(self):
+        content = json.dumps(PATH_DETAILS).encode()
+        for codec in (NONE, 'gzip'):
+            with self.subTest(codec=codec), \
+                    mock.patch('flatten_pool.codec_for', return_value=(codec, 6)), \
+                    mock.patch('extract.codec_for', return_value=(codec, 6)):
+                resp_json = loads(content)
+                flat_data = flatten_path_details_data(resp_json, shapes=False)
+                flat_data['shape_map'] = compact_path_shapes(resp_json)
+                self._assert_outputs(path_details_outputs(content), flat_data, codec)
+
+                flat_data = flatten_path_details_data(resp_json)
+                self.assertEqual(len(flat_data['path_details_shapes']), 5)
+                self._assert_outputs(
+                    path_details_outputs(content, full_shapes=True), flat_data, codec
+                )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import json
+import unittest
+from tempfile import TemporaryDirectory
+
+# project modules
+from incidents import IncidentTracker, NEW, UPDATED, CLEARED
+
+DETOUR = {
+    'DateUpdated': '2021-08-10T10:00:00', 'Description': 'Buses detoured.',
+    'IncidentID': 'A1', 'IncidentType': 'Alert', 'RoutesAffected': ['70']
+}
+DELAY = {
+    'DateUpdated': '2021-08-10T10:05:00', 'Description': 'Expect delays.',
+    'IncidentID': 'B2', 'IncidentType': 'Delay', 'RoutesAffected': ['79']
+}
+
+
+class Resp:
+
+    def __init__(self, *incidents):
+        self.content = json.dumps({'BusIncidents': list(incidents)}).encode()
+
+
+class IncidentTrackerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.state_file = os.path.join(self.tmp.name, 'data', 'incidents_state.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_changes_across_polls(self):
+        tracker = IncidentTracker()
+        self.assertEqual(tracker.update(Resp(DETOUR)), [dict(DETOUR, Change=NEW)])
+
+        # an identical response is skipped, even though it's a new response
+        self.assertEqual(tracker.update(Resp(DETOUR)), [])
+
+        updated = dict(DETOUR, DateUpdated='2021-08-10T10:30:00')
+        self.assertEqual(
+            tracker.update(Resp(updated, DELAY)),
+            [dict(updated, Change=UPDATED), dict(DELAY, Change=NEW)]
+        )
+
+        # cleared incidents hold their last seen values
+        self.assertEqual(tracker.update(Resp(DELAY)), [dict(updated, Change=CLEARED)])
+        self.assertEqual(tracker.update(Resp()), [dict(DELAY, Change=CLEARED)])
+        self.assertEqual(tracker.incidents, {})
+
+    def test_state_file(self):
+        tracker = IncidentTracker(self.state_file)
+        tracker.update(Resp(DETOUR, DELAY))
+        self.assertTrue(os.path.isfile(self.state_file))
+
+        # e.g. the next cron run
+        reloaded = IncidentTracker(self.state_file)
+        self.assertEqual(reloaded.response_hash, tracker.response_hash)
+        self.assertEqual(reloaded.update(Resp(DETOUR, DELAY)), [])
+        self.assertEqual(reloaded.update(Resp(DELAY)), [dict(DETOUR, Change=CLEARED)])
+
+        reloaded_again = IncidentTracker(self.state_file)
+        self.assertEqual(list(reloaded_again.incidents), ['B2'])
+        self.assertEqual(
+            reloaded_again.update(Resp(DETOUR, DELAY)), [dict(DETOUR, Change=NEW)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
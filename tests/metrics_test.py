@@ -0,0 +1,29 @@
+import unittest
+
+# project modules
+from metrics import Counter, Histogram
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_counter(self):
+        c = Counter('test_total', 'Test counter.', ['endpoint'])
+        c.inc(endpoint='routes')
+        c.inc(2, endpoint='routes')
+        self.assertEqual(c.get(endpoint='routes'), 3)
+        self.assertIn('test_total{endpoint="routes"} 3.0', c.render())
+
+    def test_histogram(self):
+        h = Histogram('test_seconds', 'Test histogram.', ['endpoint'], (0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 5.0]:
+            h.observe(value, endpoint='stops')
+        lines = h.render()
+        self.assertIn('test_seconds_bucket{endpoint="stops",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{endpoint="stops",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{endpoint="stops",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{endpoint="stops"} 4', lines)
+        self.assertEqual(h.count(endpoint='stops'), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+# project modules
+from positions import PositionBatch
+from position_store import PositionStore
+from utils import from_epoch, to_epoch
+
+START = to_epoch('2021-08-10T10:00:00')
+
+
+def positions(vehicle_id, route_id, times, trip_id='1'):
+    return PositionBatch.from_records([
+        {
+            'VehicleID': vehicle_id, 'RouteID': route_id, 'TripID': trip_id,
+            'DateTime': from_epoch(t), 'Lat': 38.9, 'Lon': -77.0,
+            'Deviation': 0.0, 'DirectionNum': 0
+        } for t in times
+    ])
+
+
+class PositionStoreTestCase(unittest.TestCase):
+
+    def test_time_range(self):
+        store = PositionStore(capacity=100, max_age=3600)
+        store.add_batch(positions('3101', '70', range(START, START + 600, 10)))
+        rows = store.query(
+            '3101', start='2021-08-10T10:01:00', end='2021-08-10T10:02:00'
+        )
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['DateTime'], '2021-08-10T10:01:00')
+        self.assertEqual(len(store.last_minutes('3101', 1)), 7)
+        with self.assertRaises(ValueError):
+            store.last_minutes('3101', float('nan'))
+
+    def test_ring_eviction(self):
+        store = PositionStore(capacity=10, max_age=3600)
+        store.add_batch(positions('3101', '70', range(START, START + 250, 10)))
+        rows = store.query('3101')
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]['DateTime'], from_epoch(START + 150))
+
+        # duplicate polls are ignored
+        self.assertEqual(store.add_batch(positions('3101', '70', [START + 240])), 0)
+
+    def test_age_eviction_and_route_index(self):
+        store = PositionStore(capacity=10, max_age=60)
+        store.add_batch(positions('3101', '70', [START]))
+        store.add_batch(positions('3102', '70', [START + 30]))
+        store.add_batch(positions('3103', '10A', [START + 30]))
+        self.assertEqual(store.route_vehicles('70'), ['3101', '3102'])
+        self.assertEqual(len(store.query_route('70')), 2)
+
+        store.add_batch(positions('3103', '10A', [START + 61]))
+        self.assertEqual(store.route_vehicles('70'), ['3102'])
+        self.assertEqual(store.query('3101'), [])
+
+    def test_route_change(self):
+        store = PositionStore(capacity=10, max_age=60)
+        store.add_batch(positions('3101', '70', [START]))
+        store.add_batch(positions('3101', '79', [START + 30]))
+        # still listed under 70 while it has positions on 70
+        self.assertEqual(store.route_vehicles('70'), ['3101'])
+        self.assertEqual(len(store.query_route('70')), 1)
+
+        store.add_batch(positions('3101', '79', [START + 61]))
+        self.assertEqual(store.route_vehicles('70'), [])
+        self.assertNotIn('70', store.route_index)
+        self.assertEqual(len(store.query_route('79')), 2)
+
+        # positions overwritten by a full track
+        store = PositionStore(capacity=2, max_age=3600)
+        store.add_batch(positions('3101', '70', [START]))
+        store.add_batch(positions('3101', '79', [START + 10, START + 20]))
+        self.assertEqual(store.route_vehicles('70'), [])
+        self.assertEqual(store.route_vehicles('79'), ['3101'])
+
+    def test_pool_compaction(self):
+        store = PositionStore(capacity=10, max_age=60)
+        for i in range(30):  # a new trip every poll
+            store.add_batch(positions('3101', '70', [START + i * 10], trip_id=str(i)))
+        # None, the RouteID and trips of at most two max_age windows
+        self.assertLessEqual(len(store.pool), 2 + 12)
+        self.assertEqual(
+            [row['TripID'] for row in store.query('3101')],
+            ['23', '24', '25', '26', '27', '28', '29']
+        )
+        self.assertEqual(store.route_vehicles('70'), ['3101'])
+        self.assertEqual(len(store.query_route('70')), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
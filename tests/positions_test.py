@@ -0,0 +1,46 @@
+import unittest
+
+# project modules
+from positions import PositionBatch, StringPool
+from utils import BUS_POS_FIELD_NAMES
+
+BUS_POS = {
+    'BlockNumber': '7001', 'DateTime': '2021-08-10T10:20:42',
+    'Deviation': 3.0, 'DirectionNum': 0, 'DirectionText': 'NORTH',
+    'Lat': 38.9, 'Lon': -77.02, 'RouteID': '70',
+    'TripEndTime': '2021-08-10T11:05:00', 'TripHeadsign': 'SILVER SPRING',
+    'TripID': '12345', 'TripStartTime': '2021-08-10T10:00:00',
+    'VehicleID': '3101'
+}
+
+
+class PositionBatchTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        batch = PositionBatch.from_records([BUS_POS], pool=StringPool())
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(batch[0], BUS_POS)
+        self.assertEqual(list(batch[0].keys()), BUS_POS_FIELD_NAMES)
+
+    def test_missing_values(self):
+        batch = PositionBatch.from_records(
+            [{'VehicleID': '3101'}], pool=StringPool()
+        )
+        row = batch[0]
+        self.assertEqual(row['VehicleID'], '3101')
+        for field in ['RouteID', 'Lat', 'DirectionNum', 'DateTime']:
+            self.assertIsNone(row[field], msg=f'{field} not None: {row}')
+
+    def test_strings_shared(self):
+        pool = StringPool()
+        batch = PositionBatch.from_records([BUS_POS] * 100, pool=pool)
+        other = PositionBatch.from_records([BUS_POS] * 100, pool=pool)
+        batch.extend(other)
+        self.assertEqual(len(batch), 200)
+        # None plus one entry per distinct categorical value
+        self.assertEqual(len(pool), 7)
+        self.assertEqual(batch.column('RouteID'), ['70'] * 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
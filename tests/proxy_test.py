@@ -0,0 +1,96 @@
+import unittest
+from threading import Event, Thread
+from time import monotonic, sleep
+from unittest import mock
+
+# project modules
+import proxy
+
+
+class Resp:
+
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json'}
+
+
+class Clock:
+
+    def __init__(self, now: float = 1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def test_coalesce(self):
+        cache = proxy.ResponseCache()
+        release = Event()
+        calls = list()
+        results = list()
+
+        def fetch():
+            calls.append(1)
+            release.wait(timeout=5)
+            return Resp(b'{"Routes": []}')
+
+        key = ('routes', ())
+        threads = [
+            Thread(target=lambda: results.append(cache.get(key, 60, fetch)))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        deadline = monotonic() + 5  # until every thread waits on the key
+        while cache.key_locks.get(key, [None, 0])[1] < 5:
+            self.assertLess(monotonic(), deadline, 'threads never queued on the key')
+            sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join(timeout=5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [(200, b'{"Routes": []}', 'application/json')] * 5)
+        self.assertEqual(cache.stats, {'hits': 4, 'misses': 1, 'upstream': 1, 'errors': 0})
+        self.assertEqual(cache.key_locks, {})
+
+    def test_ttl_and_errors(self):
+        cache = proxy.ResponseCache()
+        responses = [Resp(b'error', 500), Resp(b'1'), Resp(b'2')]
+
+        def fetch():
+            return responses.pop(0)
+
+        with mock.patch('proxy.monotonic', Clock()) as clock:
+            self.assertEqual(cache.get('key', 7, fetch)[:2], (500, b'error'))
+            self.assertEqual(cache.get('key', 7, fetch)[:2], (200, b'1'))
+            clock.now += 6
+            self.assertEqual(cache.get('key', 7, fetch)[:2], (200, b'1'))
+            clock.now += 1
+            self.assertEqual(cache.get('key', 7, fetch)[:2], (200, b'2'))
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 3, 'upstream': 3, 'errors': 1})
+
+    def test_eviction(self):
+        cache = proxy.ResponseCache(max_entries=3)
+        with mock.patch('proxy.monotonic', Clock()) as clock:
+            for i in range(5):  # all still fresh
+                cache.get(i, 60, lambda: Resp(b'{}'))
+            self.assertEqual(list(cache.entries), [2, 3, 4])
+
+            cache.get(2, 60, lambda: Resp(b'{}'))  # a hit doesn't reorder
+            clock.now += 30
+            cache.get(5, 10, lambda: Resp(b'{}'))
+            self.assertEqual(list(cache.entries), [3, 4, 5])
+
+            # expired entries go first
+            clock.now += 20
+            cache.get(6, 60, lambda: Resp(b'{}'))
+            self.assertEqual(list(cache.entries), [3, 4, 6])
+        self.assertEqual(cache.key_locks, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
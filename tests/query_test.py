@@ -0,0 +1,57 @@
+import os
+import csv
+import tempfile
+import unittest
+
+# project modules
+import query
+from utils import BUS_POS_FIELD_NAMES
+
+
+class QueryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        for hour in range(6, 11):
+            path = os.path.join(self.root, '2021', '08', '10', f'{hour:02d}')
+            os.makedirs(path)
+            with open(os.path.join(path, 'bus_positions_1.csv'), 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=BUS_POS_FIELD_NAMES)
+                writer.writeheader()
+                for minute in range(0, 60, 15):
+                    for route_id, vehicle_id in [('70', '7001'), ('S2', '8001')]:
+                        writer.writerow({
+                            'RouteID': route_id, 'VehicleID': vehicle_id,
+                            'DateTime': f'2021-08-10T{hour:02d}:{minute:02d}:00',
+                            'Lat': 38.9, 'Lon': -77.0
+                        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_partition_pruning(self):
+        files = query.partition_files(
+            'bus_positions', query.datetime(2021, 8, 10, 7),
+            query.datetime(2021, 8, 10, 9), self.root
+        )
+        self.assertEqual(
+            [f.split(os.sep)[-2] for f in files], ['06', '07', '08', '09']
+        )
+
+    def test_query(self):
+        rows = list(query.query(
+            'bus_positions', start='2021-08-10T07:00', end='2021-08-10T09:00',
+            where={'RouteID': '70'}, columns=['VehicleID', 'DateTime'],
+            root=self.root
+        ))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[0], ('7001', '2021-08-10T07:00:00'))
+        self.assertEqual(rows[-1], ('7001', '2021-08-10T08:45:00'))
+        self.assertEqual(list(query.query(
+            'bus_positions', where={'RouteID': ['X9']}, root=self.root
+        )), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
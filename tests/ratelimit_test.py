@@ -0,0 +1,108 @@
+import unittest
+from threading import Condition, Event, Thread
+from time import sleep
+from unittest import mock
+
+# project modules
+from ratelimit import RateLimiter, REALTIME, BATCH, current_priority, priority
+
+
+class Clock:
+
+    def __init__(self, now: float = 1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CountingCondition(Condition):
+
+    def __init__(self):
+        super().__init__()
+        self.waits = 0
+
+    def wait(self, timeout=None):
+        self.waits += 1
+        return super().wait(timeout)
+
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def test_reserve(self):
+        with mock.patch('ratelimit.monotonic', Clock()):
+            limiter = RateLimiter(rate=10, reserve=2)
+            for _ in range(8):
+                self.assertEqual(limiter.acquire(BATCH), 0)
+            # a batch request would now wait, the reserve is for real-time ones
+            self.assertEqual(limiter.tokens, 2)
+            self.assertEqual(limiter.acquire(REALTIME), 0)
+            self.assertEqual(limiter.acquire(REALTIME), 0)
+            self.assertEqual(limiter.tokens, 0)
+
+    def test_rate_below_one(self):
+        with mock.patch('ratelimit.monotonic', Clock()) as clock:
+            limiter = RateLimiter(rate=0.5)
+            self.assertEqual((limiter.burst, limiter.reserve), (1, 0))
+            self.assertEqual(limiter.acquire(BATCH), 0)
+            self.assertEqual(limiter.tokens, 0)
+            clock.now += 2  # a token every 2s
+            self.assertEqual(limiter.acquire(REALTIME), 0)
+            self.assertEqual(limiter.tokens, 0)
+
+    def test_batch_waits_for_realtime(self):
+        limiter = RateLimiter(rate=10, reserve=0)
+        limiter.cond = CountingCondition()
+        limiter.waiting_realtime = 1  # e.g. a positions poll waiting on a token
+        done = Event()
+
+        def request():
+            limiter.acquire(BATCH)
+            done.set()
+
+        thread = Thread(target=request, daemon=True)
+        thread.start()
+
+        # the bucket is full, but the batch request waits without polling
+        self.assertFalse(done.wait(timeout=0.1))
+        self.assertEqual(limiter.cond.waits, 1)
+
+        with limiter.cond:
+            limiter.waiting_realtime -= 1
+            limiter.cond.notify_all()
+        self.assertTrue(done.wait(timeout=5))
+        thread.join(timeout=5)
+
+    def test_realtime_first(self):
+        limiter = RateLimiter(rate=5, burst=1, reserve=0)
+        limiter.tokens = 0  # next token due in 0.2s
+        order = list()
+
+        def request(level):
+            limiter.acquire(level)
+            order.append(level)
+
+        threads = [
+            Thread(target=request, args=(level,), daemon=True) for level in (BATCH, REALTIME)
+        ]
+        for t in threads:
+            t.start()
+            sleep(0.01)
+        for t in threads:
+            t.join(timeout=5)
+        self.assertEqual(order, [REALTIME, BATCH])
+
+    def test_priority(self):
+        levels = list()
+        self.assertEqual(current_priority(), BATCH)
+        with priority(REALTIME):
+            self.assertEqual(current_priority(), REALTIME)
+            thread = Thread(target=lambda: levels.append(current_priority()))
+            thread.start()
+            thread.join(timeout=5)
+        self.assertEqual(current_priority(), BATCH)
+        self.assertEqual(levels, [BATCH])  # per thread
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import csv
+import tempfile
+import unittest
+from datetime import datetime
+
+# project modules
+import rollups
+from compression import open_text
+from positions import PositionBatch
+from query import partition_files
+from utils import BUS_POS_FIELD_NAMES
+
+
+def _poll(time: str, vehicles: list) -> list:
+    """Return a poll's positions of (VehicleID, RouteID, Deviation)."""
+    return [
+        {'VehicleID': vehicle, 'RouteID': route, 'Deviation': deviation,
+         'DateTime': f'2021-08-10T{time}', 'Lat': 38.9, 'Lon': -77.0}
+        for vehicle, route, deviation in vehicles
+    ]
+
+
+def _read(data_type: str) -> list:
+    rows = list()
+    for path in partition_files(data_type):
+        with open_text(path) as f:
+            rows.extend(csv.DictReader(f))
+    return rows
+
+
+class RollupsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)  # datasets are saved relative to data/
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def _save_positions(self, hour: int, minutes: range) -> None:
+        path = os.path.join('data', 'bus_positions', '2021', '08', '10', f'{hour:02d}')
+        os.makedirs(path, exist_ok=True)
+        for minute in minutes:
+            name = f'bus_positions_08-10-2021_{hour:02d}-{minute:02d}-00.csv'
+            with open(os.path.join(path, name), 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=BUS_POS_FIELD_NAMES)
+                writer.writeheader()
+                writer.writerows(_poll(f'{hour:02d}:{minute:02d}:00', [
+                    ('7001', '70', 1.0), ('7002', '70', 3.0)
+                ]))
+
+    def test_minute_flush(self):
+        rollup = rollups.PositionRollup(lag=120)
+        rollup(PositionBatch.from_records(_poll('10:00:05', [
+            ('7001', '70', 1.0), ('7002', '70', 2.0), ('7003', '70', 9.0),
+            ('8001', '79', None)
+        ])))
+        rollup(PositionBatch.from_records(_poll('10:00:35', [
+            ('7001', '70', 4.0), ('7002', '70', 2.0)
+        ]) + _poll('10:00:05', [('7003', '70', 9.0)])))  # 7003 not updated
+        self.assertEqual(_read('position_rollups'), [])  # within the lag
+
+        rollup(PositionBatch.from_records(_poll('10:03:05', [('7001', '70', 0.0)])))
+        rows = _read('position_rollups')
+        self.assertEqual([(r['Minute'], r['RouteID']) for r in rows], [
+            ('2021-08-10T10:00:00', '70'), ('2021-08-10T10:00:00', '79')
+        ])
+        route_70, route_79 = rows
+        self.assertEqual((route_70['Vehicles'], route_70['Positions']), ('3', '5'))
+        self.assertEqual(route_70['DeviationMean'], '3.6')
+        self.assertEqual(route_70['DeviationP50'], '2.0')
+        self.assertEqual(route_70['DeviationP90'], '9.0')
+        self.assertEqual(route_70['Coverage'], '1.0')
+        # 79 was in one of the minute's two polls, and has no deviations
+        self.assertEqual(route_79['Coverage'], '0.5')
+        self.assertEqual(route_79['DeviationMean'], '')
+
+        tracks = _read('vehicle_tracks')
+        self.assertEqual(
+            [(t['VehicleID'], t['DateTime']) for t in tracks if t['VehicleID'] == '7001'],
+            [('7001', '2021-08-10T10:00:05')]  # first point of the interval
+        )
+        self.assertFalse(os.path.exists(rollups.complete_marker(datetime(2021, 8, 10, 10))))
+
+    def test_complete_hours(self):
+        # a listener polling from before 10:00 until after 11:00
+        rollup = rollups.PositionRollup(lag=120)
+        for time in ['09:59:00', '10:20:00', '10:40:00', '11:03:00']:
+            rollup(PositionBatch.from_records(_poll(time, [('7001', '70', 1.0)])))
+        self.assertTrue(os.path.isfile(rollups.complete_marker(datetime(2021, 8, 10, 10))))
+        # it started within 09:00, so that hour isn't complete
+        self.assertFalse(os.path.isfile(rollups.complete_marker(datetime(2021, 8, 10, 9))))
+
+        self._save_positions(10, range(0, 60, 10))
+        done = rollups.rollup_partitions(now=datetime(2021, 8, 10, 12))
+        self.assertEqual(done, [])  # the listener's rows are kept
+        self.assertEqual(len(_read('position_rollups')), 3)  # 11:03 within the lag
+
+    def test_partial_hour_redone(self):
+        self._save_positions(10, range(0, 60, 10))
+        self._save_positions(11, range(0, 10, 10))
+
+        # a listener started at 10:30, so rolled up half of 10:00
+        rollup = rollups.PositionRollup(lag=120)
+        for minute in range(30, 60, 10):
+            rollup(PositionBatch.from_records(_poll(f'10:{minute}:00', [
+                ('7001', '70', 1.0), ('7002', '70', 3.0)
+            ])))
+        rollup.flush()
+        self.assertEqual(len(_read('position_rollups')), 3)
+
+        # the hour isn't closed until PARTITION_SLACK after it ends
+        self.assertEqual(rollups.rollup_partitions(now=datetime(2021, 8, 10, 11, 1)), [])
+        self.assertEqual(
+            rollups.rollup_partitions(now=datetime(2021, 8, 10, 12)),
+            [datetime(2021, 8, 10, 10)]
+        )
+        rows = _read('position_rollups')
+        self.assertEqual(
+            [r['Minute'][-8:] for r in rows],
+            ['10:00:00', '10:10:00', '10:20:00', '10:30:00', '10:40:00', '10:50:00']
+        )
+        self.assertTrue(all(r['DeviationMean'] == '2.0' for r in rows))
+        self.assertEqual(len(_read('vehicle_tracks')), 12)
+
+        self.assertEqual(rollups.rollup_partitions(now=datetime(2021, 8, 10, 12)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
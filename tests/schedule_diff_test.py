@@ -0,0 +1,69 @@
+import unittest
+
+# project modules
+from schedule_diff import diff_schedules, INSERT, REMOVE, MODIFY
+
+
+def sched_row(trip_id, stop_seq, time):
+    return {
+        'Name': '70 - ARCHIVES', 'RouteID': '70', 'DirectionNum': 0,
+        'TripID': trip_id, 'StopID': str(1000 + stop_seq), 'StopSeq': stop_seq,
+        'Time': time, 'StartTime': '2021-08-10T05:00:00', 'EndTime': None,
+        'StopName': 'STOP', 'TripDirectionText': 'NORTH',
+        'TripHeadsign': 'SILVER SPRING'
+    }
+
+
+class ScheduleDiffTestCase(unittest.TestCase):
+
+    def test_diff_schedules(self):
+        previous = [
+            sched_row('1', 1, '2021-08-10T05:00:00'),
+            sched_row('1', 2, '2021-08-10T05:05:00'),
+            sched_row('2', 1, '2021-08-10T06:00:00')
+        ]
+        # previous rows as read back from csv, all strings
+        previous = [
+            {k: '' if v is None else str(v) for k, v in row.items()}
+            for row in previous
+        ]
+        current = [
+            sched_row('1', 1, '2021-08-10T05:00:00'),
+            sched_row('1', 2, '2021-08-10T05:07:00'),
+            sched_row('3', 1, '2021-08-10T07:00:00')
+        ]
+        changes = diff_schedules(previous, current)
+        self.assertEqual(
+            [(c['Op'], c['TripID'], c['StopSeq'], c['Changed']) for c in changes],
+            [(REMOVE, '2', '1', ''), (MODIFY, '1', '2', 'Time'), (INSERT, '3', '1', '')]
+        )
+        self.assertEqual(changes[1]['Time'], '2021-08-10T05:07:00')
+        self.assertEqual(diff_schedules(current, current), [])
+
+    def test_consecutive_dates(self):
+        def timetable(day: int, last_time: str = '00:30:00') -> list:
+            rows = list()
+            for trip in range(10):
+                for seq in range(1, 6):
+                    row = sched_row(
+                        str(trip), seq, f'2021-08-{day}T{5 + trip:02d}:{seq:02d}:00'
+                    )
+                    row['StartTime'] = f'2021-08-{day}T{5 + trip:02d}:00:00'
+                    row['EndTime'] = f'2021-08-{day}T{5 + trip:02d}:05:00'
+                    rows.append(row)
+            # a trip running past midnight into the next calendar date
+            row = sched_row('late', 1, f'2021-08-{day + 1}T{last_time}')
+            row['StartTime'] = f'2021-08-{day}T23:50:00'
+            rows.append(row)
+            return rows
+
+        self.assertEqual(diff_schedules(timetable(10), timetable(11)), [])
+        changes = diff_schedules(timetable(10), timetable(11, last_time='00:40:00'))
+        self.assertEqual(
+            [(c['Op'], c['TripID'], c['Changed']) for c in changes],
+            [(MODIFY, 'late', 'Time')]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from threading import Event
+from time import monotonic, sleep
+from unittest import mock
+
+# project modules
+from ratelimit import REALTIME, current_priority
+from scheduler import Job, build_jobs
+
+
+def _wait_until(test, condition, msg: str) -> None:
+    deadline = monotonic() + 5
+    while not condition():
+        test.assertLess(monotonic(), deadline, msg)
+        sleep(0.001)
+
+
+def _idle(job: Job) -> bool:
+    if job.lock.acquire(blocking=False):
+        job.lock.release()
+        return True
+    return False
+
+
+class JobTestCase(unittest.TestCase):
+
+    def test_no_overlap(self):
+        release = Event()
+        runs = list()
+
+        def func():
+            runs.append(current_priority())
+            release.wait(timeout=5)
+
+        job = Job('positions', func, level=REALTIME)
+        job()
+        job()  # skipped, the first run holds the lock
+        _wait_until(self, lambda: runs, 'job never ran')
+        job()
+        self.assertEqual(runs, [REALTIME])
+
+        release.set()
+        _wait_until(self, lambda: _idle(job), 'job never finished')
+        job()
+        _wait_until(self, lambda: len(runs) == 2, 'job never ran again')
+        self.assertEqual(runs, [REALTIME, REALTIME])
+
+    def test_failure_releases_lock(self):
+        job = Job('routes', lambda: 1 / 0)
+        job()
+        _wait_until(self, lambda: job.last_duration is not None, 'job never ran')
+        _wait_until(self, lambda: _idle(job), 'lock never released')
+
+
+class BuildJobsTestCase(unittest.TestCase):
+
+    def test_position_csv(self):
+        listened = list()
+        with mock.patch('scheduler.fetch_bus_positions', return_value='batch') as fetch:
+            build_jobs([listened.append])['positions'].func()
+            fetch.assert_called_once_with(to_firehose=True, to_csv=False)
+            build_jobs(position_csv=True)['positions'].func()
+            fetch.assert_called_with(to_firehose=True, to_csv=True)
+        self.assertEqual(listened, ['batch'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import random
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# project modules
+import shapes
+
+
+class ShapesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(7)
+        lat, lon = 38.890636, -77.084747
+        self.points = list()
+        for _ in range(500):
+            lat = round(lat + rand.uniform(-0.001, 0.001), 6)
+            lon = round(lon + rand.uniform(-0.001, 0.001), 6)
+            self.points.append((lat, lon))
+
+    def test_polyline_round_trip(self):
+        encoded = shapes.encode_polyline(self.points)
+        self.assertEqual(shapes.decode_polyline(encoded), self.points)
+        self.assertEqual(shapes.decode_polyline(''), [])
+        # google's reference example at precision 5
+        self.assertEqual(
+            shapes.encode_polyline(
+                [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)], precision=5
+            ),
+            '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+        )
+
+    def test_compact_path_shapes_dedup(self):
+        resp_json = {
+            'RouteID': '70', 'Name': '70 - ARCHIVES',
+            'Direction0': {
+                'DirectionNum': '0', 'DirectionText': 'NORTH',
+                'TripHeadsign': 'SILVER SPRING', 'Stops': [],
+                'Shape': [
+                    {'Lat': lat, 'Lon': lon, 'SeqNum': i}
+                    for i, (lat, lon) in reversed(list(enumerate(self.points)))
+                ]
+            },
+            'Direction1': None
+        }
+        with tempfile.TemporaryDirectory() as root:
+            rows = shapes.compact_path_shapes(resp_json, root=root)
+            again = shapes.compact_path_shapes(resp_json, root=root)
+            self.assertEqual(rows, again)
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(len(os.listdir(root)), 1)
+            self.assertEqual(rows[0]['Points'], len(self.points))
+            # points are stored in SeqNum order
+            self.assertEqual(
+                list(shapes.load_shape(rows[0]['ShapeID'], root)), self.points
+            )
+
+    def test_save_shape_threads(self):
+        encoded = shapes.encode_polyline(self.points)
+        with tempfile.TemporaryDirectory() as root, ThreadPoolExecutor(8) as executor:
+            # e.g. backfill threads storing the same route's shape
+            ids = list(executor.map(lambda _: shapes.save_shape(encoded, root), range(64)))
+            self.assertEqual(set(ids), {shapes.shape_id(encoded)})
+            self.assertEqual(os.listdir(root), [ids[0] + '.polyline'])
+            with open(shapes.shape_path(ids[0], root)) as f:
+                self.assertEqual(f.read(), encoded)
+
+    def test_route_line_project(self):
+        step = 100 / shapes.METERS_PER_DEGREE
+        line = shapes.RouteLine([(38.9, -77.0), (38.9 + step, -77.0), (38.9 + 2 * step, -77.0)])
+        self.assertAlmostEqual(line.length, 200, places=3)
+        distance, offset, segment = line.project(38.9 + 1.5 * step, -77.0)
+        self.assertAlmostEqual(distance, 150, places=3)
+        self.assertAlmostEqual(offset, 0, places=3)
+        self.assertEqual(segment, 1)
+        # searching only the first segment clamps to its end
+        distance, offset, segment = line.project(38.9 + 1.5 * step, -77.0, end=1)
+        self.assertAlmostEqual(distance, 100, places=3)
+        self.assertAlmostEqual(offset, 50, places=3)
+        self.assertEqual(segment, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
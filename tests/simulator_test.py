@@ -0,0 +1,65 @@
+import os
+import json
+import unittest
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import mock
+
+# project modules
+import wmata
+from simulator import SimulatorServer, fixture_name
+
+API_KEYS = {'default': 'key', 'bus_pos_key': 'key', 'bus_route_sched_key': 'key'}
+ROUTES = {'Routes': [{'RouteID': '70', 'Name': '70 - SILVER SPRING'}]}
+
+
+class SimulatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        routes_dir = os.path.join(self.tmp.name, 'jRoutes')
+        os.makedirs(routes_dir)
+        with open(os.path.join(routes_dir, fixture_name('')), mode='w') as f:
+            json.dump(ROUTES, f)
+        self.host = wmata.API_HOST
+        patcher = mock.patch('wmata.get_api_keys', return_value=API_KEYS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        wmata.set_api_host(self.host)
+        self.tmp.cleanup()
+
+    def start(self, **kwargs) -> SimulatorServer:
+        server = SimulatorServer(('127.0.0.1', 0), self.tmp.name, **kwargs)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        wmata.set_api_host(server.url)
+        return server
+
+    def test_replay(self):
+        server = self.start()
+        resp = wmata.get_routes()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(wmata.get_route_ids(resp.json()), ['70'])
+        self.assertEqual(wmata.get_stops().status_code, 404)
+        self.assertEqual(server.stats['served'], 1)
+        self.assertEqual(server.stats['missing'], 1)
+
+    def test_error_injection(self):
+        server = self.start(error_rate=1.0)
+        self.assertEqual(wmata.get_routes().status_code, 500)
+        server.error_rate = 0.0
+        server.throttle_rate = 1.0
+        self.assertEqual(wmata.get_routes().status_code, 429)
+
+    def test_rate_limit(self):
+        server = self.start(rate_limit=2)
+        codes = [wmata.get_routes().status_code for _ in range(4)]
+        self.assertEqual(codes.count(200), 2)
+        self.assertEqual(server.stats['rate_limited'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
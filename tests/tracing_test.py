@@ -0,0 +1,68 @@
+import os
+import json
+import unittest
+from tempfile import TemporaryDirectory
+
+# project modules
+import tracing
+
+
+class TracingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'trace.jsonl')
+
+    def tearDown(self):
+        tracing.disable()
+        self.tmp.cleanup()
+
+    def _spans(self) -> list:
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_noop(self):
+        with tracing.span('fetch', route_id='70') as s:
+            s.set(rows=10)
+        self.assertIs(s, tracing.NOOP_SPAN)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_nesting(self):
+        tracing.enable(self.path)
+        with tracing.span('extract') as outer:
+            with tracing.span('fetch', route_id='70'):
+                pass
+            # written once finished, without closing the file
+            self.assertEqual([s['name'] for s in self._spans()], ['fetch'])
+            with self.assertRaises(ValueError):
+                with tracing.span('flatten') as inner:
+                    inner.set(rows=3)
+                    raise ValueError('bad')
+        tracing.disable()
+
+        fetch, flatten, extract = self._spans()
+        self.assertEqual(extract['id'], outer.id)
+        self.assertIsNone(extract['parent'])
+        self.assertEqual(fetch['parent'], outer.id)
+        self.assertEqual(flatten['parent'], outer.id)
+        self.assertEqual(fetch['attrs'], {'route_id': '70'})
+        self.assertEqual(flatten['attrs'], {'rows': 3, 'error': "ValueError('bad')"})
+        self.assertGreaterEqual(extract['duration_ms'], fetch['duration_ms'])
+
+        # disabled again, spans aren't written
+        with tracing.span('extract'):
+            pass
+        self.assertEqual(len(self._spans()), 3)
+
+
+    def test_disable_during_span(self):
+        # e.g. a scheduler job still running when extract() ends
+        tracing.enable(self.path)
+        with tracing.span('fetch'):
+            with tracing.span('flatten'):
+                pass
+            tracing.disable()
+        self.assertEqual([s['name'] for s in self._spans()], ['flatten'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+# project modules
+import travel_times
+from positions import PositionBatch
+from shapes import METERS_PER_DEGREE
+from utils import to_epoch
+
+LAT, LON = 38.9, -77.0
+STEP = 500 / METERS_PER_DEGREE  # 500 m north between stops
+
+
+class TravelTimesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.key = ('70', 0)
+        self.stops = {self.key: [(f'S{i}', LAT + i * STEP, LON) for i in range(4)]}
+        # trips at 10 m/s from the first stop, sampled every 10 s
+        start = to_epoch('2021-08-02T08:00:00')  # a monday
+        self.trips = [
+            ('70', 0, [
+                (start + trip * 900 + t, LAT + 10 * t / METERS_PER_DEGREE, LON)
+                for t in range(0, 160, 10)
+            ])
+            for trip in range(3)
+        ]
+
+    def test_build_and_eta(self):
+        tables = travel_times.build_tables(self.stops, self.trips)
+        table = tables[self.key]
+        self.assertEqual(table.segments, 3)
+        base = (0 * travel_times.HOURS + 8) * table.segments
+        self.assertEqual(list(table.p50[base:base + 3]), [50.0, 50.0, 50.0])
+        self.assertEqual(list(table.counts[base:base + 3]), [3, 3, 3])
+
+        times = travel_times.TravelTimes(tables)
+        when = to_epoch('2021-08-09T08:30:00')
+        lat = LAT + 250 / METERS_PER_DEGREE  # half way to the second stop
+        self.assertEqual(times.eta('70', 0, 'S3', lat, LON, when), when + 125)
+        self.assertIsNone(times.eta('70', 0, 'S0', lat, LON, when))
+        self.assertIsNone(times.eta('70', 0, 'S3', lat, LON + 0.01, when))
+        # saturdays without samples fall back to all samples of the segment
+        saturday = to_epoch('2021-08-07T23:00:00')
+        self.assertEqual(times.eta('70', 0, 'S2', lat, LON, saturday), saturday + 75)
+
+    def test_default_speed_and_save(self):
+        tables = travel_times.build_tables(self.stops, [])
+        times = travel_times.TravelTimes(tables)
+        when = to_epoch('2021-08-09T08:00:00')
+        self.assertEqual(
+            times.eta('70', 0, 'S1', LAT, LON, when),
+            when + int(500 / travel_times.DEFAULT_SPEED)
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = times.save(os.path.join(tmp_dir, 'travel_times.json.gz'))
+            loaded = travel_times.TravelTimes.load(path)
+        self.assertEqual(loaded.tables[self.key].stops, self.stops[self.key])
+        self.assertEqual(loaded.tables[self.key].p50, tables[self.key].p50)
+
+    def test_predict(self):
+        times = travel_times.TravelTimes(travel_times.build_tables(self.stops, self.trips))
+        batch = PositionBatch.from_records([{
+            'VehicleID': '7001', 'RouteID': '70', 'DirectionNum': '0',
+            'DateTime': '2021-08-09T08:30:00', 'Lat': LAT + 250 / METERS_PER_DEGREE,
+            'Lon': LON
+        }])
+        when = to_epoch('2021-08-09T08:30:00')
+        self.assertEqual(list(times.predict(batch)), [
+            ('7001', '70', 0, 'S1', when + 25), ('7001', '70', 0, 'S2', when + 75),
+            ('7001', '70', 0, 'S3', when + 125)
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,13 @@
 import unittest
+from threading import Event, Thread
+from time import monotonic, sleep
+from unittest import mock
+import requests
 from requests import codes
 
 # project modules
 import wmata
+from metrics import REQUESTS
 
 
 class MyTestCase(unittest.TestCase):
@@ -143,5 +148,57 @@ class MyTestCase(unittest.TestCase):
         )
 
 
+class SingleFlightTestCase(unittest.TestCase):
+
+    def test_coalesce(self):
+        flight = wmata.SingleFlight()
+        release = Event()
+        calls = list()
+        results = list()
+
+        def fetch():
+            calls.append(1)
+            release.wait(timeout=5)
+            return 'resp'
+
+        key = ('routes', 'default', ())
+        threads = [
+            Thread(target=lambda: results.append(flight.do(key, fetch)))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        deadline = monotonic() + 5  # until every thread joined the flight
+        while sum(flight.requested.values()) < 5:
+            self.assertLess(monotonic(), deadline, 'threads never requested')
+            sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join(timeout=5)
+            self.assertFalse(t.is_alive(), 'coalesced call never returned')
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['resp'] * 5)
+        self.assertEqual(
+            flight.stats(), {'routes': {'requested': 5, 'coalesced': 4}}
+        )
+
+        # sequential calls are not coalesced
+        flight.do(key, fetch)
+        self.assertEqual(len(calls), 2)
+
+
+
+class RequestMetricsTestCase(unittest.TestCase):
+
+    def test_request_error_counted(self):
+        errors = REQUESTS.get(endpoint='incidents', status='error')
+        with mock.patch('wmata.get_api_keys', return_value={'default': 'key'}), \
+                mock.patch('wmata.requests.get', side_effect=requests.ConnectionError('refused')):
+            with self.assertRaises(requests.ConnectionError):
+                wmata._get('incidents', 'default')
+        self.assertEqual(REQUESTS.get(endpoint='incidents', status='error'), errors + 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+# project modules
+from extract import fetch_route_sched, fetch_stop_scheds
+from workqueue import WorkQueue
+
+
+class WorkQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'queue.db')
+        self.queue = WorkQueue(self.path, max_attempts=2)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def test_enqueue_claim_complete(self):
+        self.assertEqual(self.queue.enqueue('route_scheds', ['70', '79']), 2)
+        self.assertEqual(self.queue.enqueue('route_scheds', ['70']), 0)
+
+        other = WorkQueue(self.path)  # e.g. a second worker process
+        first = self.queue.claim('w1')
+        second = other.claim('w2')
+        self.assertEqual({first.item_id, second.item_id}, {'70', '79'})
+        self.assertIsNone(self.queue.claim('w1'))
+
+        self.assertTrue(self.queue.complete(first, 'w1'))
+        self.assertFalse(self.queue.complete(second, 'w1'))  # not the owner
+        self.assertTrue(other.complete(second, 'w2'))
+        self.assertEqual(self.queue.counts()['done'], 2)
+        other.close()
+
+    def test_expired_lease_reassigned(self):
+        self.queue.enqueue('path_details', ['70'], '2021-08-10')
+        task = self.queue.claim('w1', lease=-1)  # already expired
+        self.assertEqual(task.date, '2021-08-10')
+
+        retry = self.queue.claim('w2')
+        self.assertEqual(retry.id, task.id)
+        self.assertEqual(retry.attempts, 2)
+        self.assertFalse(self.queue.complete(task, 'w1'))
+        self.assertTrue(self.queue.complete(retry, 'w2'))
+
+    def test_fail_gives_up(self):
+        self.queue.enqueue('route_scheds', ['70'])
+        self.queue.fail(self.queue.claim('w1'), 'w1', 'error')
+        self.assertEqual(self.queue.counts()['pending'], 1)
+        self.queue.fail(self.queue.claim('w1'), 'w1', 'error')
+        self.assertEqual(self.queue.counts()['failed'], 1)
+        self.assertIsNone(self.queue.claim('w1'))
+
+    def test_enqueue_next_day(self):
+        fetch_route_sched(['70', '79'], '2021-08-10', queue=self.queue)
+        fetch_route_sched(['70', '79'], '2021-08-10', queue=self.queue)
+        self.assertEqual(self.queue.counts()['pending'], 2)
+
+        # the same routes are queued again for the next day
+        fetch_route_sched(['70', '79'], '2021-08-11', queue=self.queue)
+        self.assertEqual(self.queue.counts()['pending'], 4)
+        tasks = [self.queue.claim('w1') for _ in range(4)]
+        self.assertEqual({(task.item_id, task.date) for task in tasks}, {
+            ('70', '2021-08-10'), ('79', '2021-08-10'),
+            ('70', '2021-08-11'), ('79', '2021-08-11')
+        })
+
+    def test_stop_scheds_not_queued(self):
+        fetch_stop_scheds(['1001'], '2021-08-10', queue=self.queue)
+        self.assertIsNone(self.queue.claim('w1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
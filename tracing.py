@@ -0,0 +1,198 @@
+"""
+tracing.py
+----------
+
+Structured tracing spans and a sampling CPU profiler for extract runs.
+
+Spans are no-ops until enable() is called, after which every finished span
+is written as a JSON line with its name, parent, duration and attributes:
+
+    {"id": 7, "parent": 6, "name": "flatten", "start": ..., "duration_ms": 12.3,
+     "attrs": {"data_name": "route_scheds", "route_id": "70", "rows": 9120}}
+"""
+# built-in modules
+import os
+import sys
+import json
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from threading import Lock, Thread, Event, get_ident
+from time import perf_counter, time
+
+_current_span = ContextVar('current_span', default=None)
+_ids = count(1)
+_tracer = None
+
+
+class Span:
+    __slots__ = ('id', 'parent', 'name', 'start', 'attrs')
+
+    def __init__(self, name: str, parent, attrs: dict):
+        self.id = next(_ids)
+        self.parent = parent
+        self.name = name
+        self.start = time()
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        """Add attributes known only once the span's work is done."""
+        self.attrs.update(attrs)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Writes finished spans to a JSON lines file.
+
+    The file is line buffered, so each span is on disk once it finishes,
+    e.g. while positions are polled until the process is killed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, mode='a', buffering=1)
+        self.lock = Lock()
+
+    def emit(self, span: Span, duration: float) -> None:
+        line = json.dumps({
+            'id': span.id,
+            'parent': span.parent,
+            'name': span.name,
+            'start': span.start,
+            'duration_ms': round(duration * 1000, 3),
+            'attrs': span.attrs
+        }, default=str)
+        with self.lock:
+            if not self.file.closed:  # spans finishing after disable() are dropped
+                self.file.write(line + '\n')
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+def enable(path: str) -> None:
+    """Start writing spans to path."""
+    global _tracer
+    _tracer = Tracer(path)
+
+
+def disable() -> None:
+    """Stop tracing and close the spans file."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Trace the with block as a child of the current span."""
+    tracer = _tracer
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    s = Span(name, parent.id if parent is not None else None, attrs)
+    token = _current_span.set(s)
+    start = perf_counter()
+    try:
+        yield s
+    except Exception as e:
+        s.set(error=repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        tracer.emit(s, perf_counter() - start)
+
+
+class SamplingProfiler:
+    """Periodically samples the stack of a thread from a background thread.
+
+    Args:
+        interval (float): seconds between samples.
+        thread_id (int): Optional; thread to sample, defaults to the
+            thread calling start().
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = 0
+        self.self_counts = Counter()  # function executing when sampled
+        self.total_counts = Counter()  # function anywhere on the stack
+        self._stop = Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f'{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})'
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_counts[self._label(frame)] += 1
+            seen = set()
+            while frame is not None:
+                label = self._label(frame)
+                if label not in seen:  # count recursive functions once
+                    seen.add(label)
+                    self.total_counts[label] += 1
+                frame = frame.f_back
+
+    def start(self) -> None:
+        if self.thread_id is None:
+            self.thread_id = get_ident()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self, top: int = 20) -> str:
+        """Return text table of the top hot spots by self and total samples."""
+        lines = [
+            f'{self.samples} samples every {self.interval * 1000:g}ms', '',
+            f'{"self %":>8} {"total %":>8}  function'
+        ]
+        total = self.samples or 1
+        for label, hits in self.self_counts.most_common(top):
+            lines.append(
+                f'{100 * hits / total:>8.1f} '
+                f'{100 * self.total_counts[label] / total:>8.1f}  {label}'
+            )
+        lines.extend(['', f'{"total %":>8}  function (cumulative)'])
+        for label, hits in self.total_counts.most_common(top):
+            lines.append(f'{100 * hits / total:>8.1f}  {label}')
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def profile(path: str, interval: float = 0.005, top: int = 20):
+    """Sample the calling thread during the with block, write summary to path."""
+    profiler = SamplingProfiler(interval=interval)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        report = profiler.summary(top=top)
+        with open(path, mode='w') as f:
+            f.write(report)
+        print(report)
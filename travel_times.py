@@ -0,0 +1,361 @@
+"""
+travel_times.py
+---------------
+
+Historical stop-to-stop travel times and ETA lookups.
+
+The builder projects saved bus positions onto each route direction's stop
+sequence from path_details_stops, interpolates the time each trip passed
+every stop and keeps median and 90th percentile travel times per segment,
+day type (weekday, Saturday, Sunday) and hour of day in flat arrays. Bins
+without samples fall back to the segment's day type, then all samples,
+then DEFAULT_SPEED.
+
+Cumulative sums of the median arrays make the travel time between any two
+stops a difference of two array elements, so predicting arrivals of a
+whole fleet only costs one projection per vehicle:
+
+    python travel_times.py 2021-08-01 2021-08-31
+
+    times = TravelTimes.load()
+    times.eta('70', 0, '1001195', lat, lon, to_epoch('2021-09-01T08:00:00'))
+"""
+# built-in modules
+import os
+import csv
+import argparse
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# project modules
+from codec import loads, dumps
+from compression import is_csv, open_text
+from positions import PositionBatch, MISSING_TIME
+from query import query
+from shapes import RouteLine
+from utils import SAVE_PATH_TRAVEL_TIMES, timestamp_dir, to_epoch
+
+DAY_TYPES = 3  # weekday, saturday, sunday
+HOURS = 24
+DEFAULT_SPEED = 5.0  # meters/second, ~11 mph
+MAX_OFFSET = 100.0  # meters a position may be off the stop line
+MAX_GAP = 300  # seconds between positions to interpolate stop passages
+SEARCH_SEGMENTS = 5  # segments ahead a vehicle may move between positions
+POSITION_COLUMNS = [
+    'VehicleID', 'TripID', 'RouteID', 'DirectionNum', 'DateTime', 'Lat', 'Lon'
+]
+
+
+def time_bin(epoch: int) -> tuple:
+    """Return (day type, hour) of epoch seconds; 1970-01-01 was a Thursday."""
+    weekday = (epoch // 86400 + 3) % 7
+    return min(max(weekday - 4, 0), 2), epoch % 86400 // 3600
+
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class SegmentTable:
+    """Travel times of the segments between consecutive stops of a route
+    direction, indexed by (day type * HOURS + hour) * segments + segment.
+
+    Args:
+        route_id (str): route variant.
+        direction_num (int): direction of the stop sequence.
+        stops (list): (StopID, lat, lon) tuples in stop order.
+        p50 (array): median segment seconds.
+        p90 (array): 90th percentile segment seconds.
+        counts (array): samples per bin.
+    """
+
+    def __init__(self, route_id, direction_num, stops, p50, p90, counts):
+        self.route_id = route_id
+        self.direction_num = direction_num
+        self.stops = stops
+        self.stop_ids = [stop[0] for stop in stops]
+        self.stop_index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.line = RouteLine([(lat, lon) for _, lat, lon in stops])
+        self.segments = len(stops) - 1
+        self.p50, self.p90, self.counts = p50, p90, counts
+
+        # cumulative median seconds from the first stop, per time bin
+        n = self.segments + 1
+        self.cum = array('d', [0.0]) * (DAY_TYPES * HOURS * n)
+        for time_bin_index in range(DAY_TYPES * HOURS):
+            base, total = time_bin_index * self.segments, 0.0
+            for k in range(self.segments):
+                total += p50[base + k]
+                self.cum[time_bin_index * n + k + 1] = total
+
+    def travel_time(self, from_index: int, to_index: int, epoch: int) -> float:
+        """Return median seconds between two stops leaving at epoch."""
+        day_type, hour = time_bin(epoch)
+        base = (day_type * HOURS + hour) * (self.segments + 1)
+        return self.cum[base + to_index] - self.cum[base + from_index]
+
+    def locate(self, lat: float, lon: float) -> tuple:
+        """Return (segment, fraction of it travelled) of a position, or None
+        if the position is off the route."""
+        distance, offset, segment = self.line.project(lat, lon)
+        if offset > MAX_OFFSET or segment >= self.segments:
+            return None
+        start, end = self.line.distances[segment], self.line.distances[segment + 1]
+        return segment, (distance - start) / (end - start) if end > start else 0.0
+
+    def eta(self, to_index: int, segment: int, fraction: float, epoch: int):
+        """Return epoch seconds of arrival at stop to_index of a vehicle at
+        fraction of segment at epoch, None if the stop was passed."""
+        if to_index <= segment:
+            return None
+        day_type, hour = time_bin(epoch)
+        remaining = (1 - fraction) * self.p50[
+            (day_type * HOURS + hour) * self.segments + segment
+        ]
+        return int(epoch + remaining + self.travel_time(segment + 1, to_index, epoch))
+
+    def to_json(self) -> dict:
+        return {
+            'RouteID': self.route_id, 'DirectionNum': self.direction_num,
+            'Stops': [list(stop) for stop in self.stops],
+            'P50': self.p50.tolist(), 'P90': self.p90.tolist(),
+            'Counts': self.counts.tolist()
+        }
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return cls(
+            data['RouteID'], data['DirectionNum'], [tuple(s) for s in data['Stops']],
+            array('f', data['P50']), array('f', data['P90']), array('H', data['Counts'])
+        )
+
+
+def stop_passages(line: RouteLine, positions: list) -> dict:
+    """Return stop index -> epoch seconds a trip passed the stop.
+
+    Args:
+        line (RouteLine): line through the stops of the trip's direction.
+        positions (list): (epoch, lat, lon) of the trip in time order.
+    """
+    passages = dict()
+    prev = None  # (epoch, distance, segment)
+    for epoch, lat, lon in positions:
+        if prev is None:
+            distance, offset, segment = line.project(lat, lon)
+        else:
+            distance, offset, segment = line.project(
+                lat, lon, prev[2] - 1, prev[2] + SEARCH_SEGMENTS + 1
+            )
+            if offset > MAX_OFFSET:  # lost track, search the whole line
+                distance, offset, segment = line.project(lat, lon)
+        if offset > MAX_OFFSET:
+            continue
+        if prev and 0 < epoch - prev[0] <= MAX_GAP and distance > prev[1]:
+            for k in range(prev[2], min(segment + 2, len(line.distances))):
+                stop_distance = line.distances[k]
+                if prev[1] <= stop_distance <= distance and k not in passages:
+                    passages[k] = prev[0] + (stop_distance - prev[1]) / (
+                        distance - prev[1]) * (epoch - prev[0])
+        if prev is None or distance >= prev[1] or epoch - prev[0] > MAX_GAP:
+            prev = (epoch, distance, segment)
+    return passages
+
+
+def build_tables(stops: dict, trips) -> dict:
+    """Return (RouteID, DirectionNum) -> SegmentTable.
+
+    Args:
+        stops (dict): (RouteID, DirectionNum) -> (StopID, lat, lon) list.
+        trips: iterable of (RouteID, DirectionNum, positions) per trip,
+            positions being (epoch, lat, lon) in time order.
+    """
+    lines = {key: RouteLine([(lat, lon) for _, lat, lon in rows])
+             for key, rows in stops.items() if len(rows) > 1}
+    samples = defaultdict(list)  # (key, day type, hour, segment) -> seconds
+    for route_id, direction_num, positions in trips:
+        key = (route_id, direction_num)
+        line = lines.get(key)
+        if line is None:
+            continue
+        passages = stop_passages(line, positions)
+        for k, passed in passages.items():
+            if k + 1 in passages:
+                day_type, hour = time_bin(int(passed))
+                samples[key, day_type, hour, k].append(passages[k + 1] - passed)
+
+    # summarize per bin, falling back to coarser bins without samples
+    by_day_type, by_segment = defaultdict(list), defaultdict(list)
+    for (key, day_type, _, k), values in samples.items():
+        by_day_type[key, day_type, k].extend(values)
+        by_segment[key, k].extend(values)
+
+    tables = dict()
+    for key, line in lines.items():
+        segments = len(line.distances) - 1
+        size = DAY_TYPES * HOURS * segments
+        p50, p90 = array('f', [0.0]) * size, array('f', [0.0]) * size
+        counts = array('H', [0]) * size
+        for day_type in range(DAY_TYPES):
+            for hour in range(HOURS):
+                base = (day_type * HOURS + hour) * segments
+                for k in range(segments):
+                    values = (
+                        samples.get((key, day_type, hour, k))
+                        or by_day_type.get((key, day_type, k))
+                        or by_segment.get((key, k))
+                    )
+                    if values:
+                        p50[base + k] = _percentile(values, 0.5)
+                        p90[base + k] = _percentile(values, 0.9)
+                    else:
+                        p50[base + k] = p90[base + k] = (
+                            line.distances[k + 1] - line.distances[k]
+                        ) / DEFAULT_SPEED
+                    counts[base + k] = min(
+                        len(samples.get((key, day_type, hour, k), ())), 65535
+                    )
+        tables[key] = SegmentTable(key[0], key[1], stops[key], p50, p90, counts)
+    return tables
+
+
+class TravelTimes:
+    """ETA lookups over SegmentTables of all route directions."""
+
+    def __init__(self, tables: dict):
+        self.tables = tables
+        self.by_route = defaultdict(list)  # RouteID -> tables of its directions
+        for (route_id, _), table in tables.items():
+            self.by_route[route_id].append(table)
+
+    def save(self, path: str = None) -> str:
+        path = path or os.path.join(
+            SAVE_PATH_TRAVEL_TIMES,
+            'travel_times_' + datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + '.json.gz'
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open_text(path, 'w') as f:
+            f.write(dumps([t.to_json() for t in self.tables.values()]).decode())
+        return path
+
+    @classmethod
+    def load(cls, path: str = None):
+        """Load saved tables, by default the latest built ones."""
+        if path is None:
+            root = SAVE_PATH_TRAVEL_TIMES
+            names = sorted(
+                n for n in (os.listdir(root) if os.path.isdir(root) else [])
+                if n.startswith('travel_times_')
+            )
+            if not names:
+                raise FileNotFoundError(f'no travel times in {root}')
+            path = os.path.join(root, names[-1])  # names sort by build time
+        with open_text(path) as f:
+            tables = [SegmentTable.from_json(t) for t in loads(f.read())]
+        return cls({(t.route_id, t.direction_num): t for t in tables})
+
+    def eta(self, route_id: str, direction_num: int, stop_id: str,
+            lat: float, lon: float, epoch: int):
+        """Return epoch seconds a vehicle at lat/lon at epoch reaches stop_id,
+        None if unknown or already passed."""
+        table = self.tables.get((route_id, direction_num))
+        if table is None or stop_id not in table.stop_index:
+            return None
+        located = table.locate(lat, lon)
+        if located is None:
+            return None
+        return table.eta(table.stop_index[stop_id], located[0], located[1], epoch)
+
+    def predict(self, batch: PositionBatch):
+        """Yield (VehicleID, RouteID, DirectionNum, StopID, eta epoch) for the
+        remaining stops of every vehicle in a poll."""
+        columns = batch.columns
+        decode = batch.pool.decode
+        for vehicle, route, direction_num, epoch, lat, lon in zip(
+            columns['VehicleID'], columns['RouteID'], columns['DirectionNum'],
+            columns['DateTime'], columns['Lat'], columns['Lon']
+        ):
+            table = self.tables.get((decode(route), direction_num))
+            if table is None or epoch == MISSING_TIME:
+                continue
+            located = table.locate(lat, lon)
+            if located is None:
+                continue
+            segment, fraction = located
+            vehicle = decode(vehicle)
+            for k in range(segment + 1, table.segments + 1):
+                yield (
+                    vehicle, table.route_id, direction_num, table.stop_ids[k],
+                    table.eta(k, segment, fraction, epoch)
+                )
+
+
+def load_stops(date: datetime, max_days: int = 31) -> dict:
+    """Return (RouteID, DirectionNum) -> stops of the latest saved path
+    details on or before date, searching back up to max_days."""
+    for days in range(max_days):
+        day_dir = timestamp_dir('path_details_stops', 3, date - timedelta(days=days))
+        if os.path.isdir(day_dir):
+            files = sorted(n for n in os.listdir(day_dir) if is_csv(n))
+            if files:
+                break
+    else:
+        return dict()
+
+    stops = dict()
+    for name in files:  # later fetches of a route replace earlier ones
+        rows = defaultdict(list)
+        with open_text(os.path.join(day_dir, name)) as f:
+            for row in csv.DictReader(f):
+                rows[row['RouteID'], int(row['DirectionNum'])].append((
+                    int(row['StopNum']), row['StopID'],
+                    float(row['Lat']), float(row['Lon'])
+                ))
+        for key, route_stops in rows.items():
+            stops[key] = [stop[1:] for stop in sorted(route_stops)]
+    return stops
+
+
+def saved_trips(start: datetime, end: datetime):
+    """Yield (RouteID, DirectionNum, positions) of saved positions per trip,
+    a day at a time."""
+    day = start
+    while day < end:
+        day_end = min(day + timedelta(days=1), end)
+        # (TripID, VehicleID, RouteID, DirectionNum) -> epoch -> (lat, lon)
+        trips = defaultdict(dict)
+        for vehicle, trip, route, direction, timestamp, lat, lon in query(
+            'bus_positions', day, day_end, columns=POSITION_COLUMNS
+        ):
+            if trip and direction and lat and lon:
+                trips[trip, vehicle, route, int(direction)][to_epoch(timestamp)] = (
+                    float(lat), float(lon)
+                )
+        for (_, _, route, direction), positions in trips.items():
+            yield route, direction, [(t, *positions[t]) for t in sorted(positions)]
+        day = day_end
+
+
+def build_travel_times(start: str, end: str) -> str:
+    """Build travel time tables from positions saved from start to end date,
+    inclusive, and save them; returns the saved file path."""
+    start = datetime.strptime(start, '%Y-%m-%d')
+    end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)
+    stops = load_stops(end - timedelta(days=1))
+    if not stops:
+        raise ValueError('no path_details_stops saved, fetch routes with --path')
+    tables = build_tables(stops, saved_trips(start, end))
+    path = TravelTimes(tables).save()
+    samples = sum(sum(t.counts) for t in tables.values())
+    print(f'[travel_times] {len(tables)} route directions, {samples} samples: {path}')
+    return path
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Build stop-to-stop travel time tables from saved positions.'
+    )
+    arg_parser.add_argument('start', help='First date in YYYY-MM-DD format.')
+    arg_parser.add_argument('end', help='Last date in YYYY-MM-DD format.')
+    build_travel_times(**vars(arg_parser.parse_args()))
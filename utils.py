@@ -1,9 +1,10 @@
 import os
 from configparser import ConfigParser
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
 
-# libraries
-import boto3
+# project modules
+from metrics import SINK_LATENCY
 
 # dir path constants
 ROOT_DIR = os.path.abspath(
@@ -11,28 +12,47 @@ ROOT_DIR = os.path.abspath(
 )
 CONFIG_FILE = os.path.join(ROOT_DIR, 'config.ini')
 SAVE_PATH_BUS_POS = os.path.join('data', 'bus_positions')
+SAVE_PATH_POS_ROLLUPS = os.path.join('data', 'position_rollups')
+SAVE_PATH_VEHICLE_TRACKS = os.path.join('data', 'vehicle_tracks')
+SAVE_PATH_BUNCHING = os.path.join('data', 'bunching_events')
 SAVE_PATH_ROUTES = os.path.join('data', 'routes')
 SAVE_PATH_SCHEDULES = os.path.join('data', 'route_scheds')
+SAVE_PATH_SCHED_CHANGES = os.path.join('data', 'route_sched_changes')
 SAVE_PATH_INCIDENTS = os.path.join('data', 'incidents')
+SAVE_PATH_INCIDENT_CHANGES = os.path.join('data', 'incident_changes')
+INCIDENTS_STATE_FILE = os.path.join('data', 'incidents_state.json')
 SAVE_PATH_STOPS = os.path.join('data', 'stops')
 SAVE_PATH_DET_STOPS = os.path.join('data', 'path_details_stops')
 SAVE_PATH_DET_SHAPES = os.path.join('data', 'path_details_shapes')
+SAVE_PATH_SHAPES = os.path.join('data', 'shapes')
+SAVE_PATH_SHAPE_MAP = os.path.join('data', 'shape_map')
+SAVE_PATH_TRAVEL_TIMES = os.path.join('data', 'travel_times')
+SAVE_PATH_QUARANTINE = os.path.join('data', 'quarantine')
+SAVE_PATH_DEDUP = os.path.join('data', 'dedup')
 DATA_PATH_MAP = {
     'bus_positions': SAVE_PATH_BUS_POS,
+    'position_rollups': SAVE_PATH_POS_ROLLUPS,
+    'vehicle_tracks': SAVE_PATH_VEHICLE_TRACKS,
+    'bunching_events': SAVE_PATH_BUNCHING,
     'routes': SAVE_PATH_ROUTES,
     'route_scheds': SAVE_PATH_SCHEDULES,
+    'route_sched_changes': SAVE_PATH_SCHED_CHANGES,
     'incidents': SAVE_PATH_INCIDENTS,
+    'incident_changes': SAVE_PATH_INCIDENT_CHANGES,
     'stops': SAVE_PATH_STOPS,
     'path_details_stops': SAVE_PATH_DET_STOPS,
-    'path_details_shapes': SAVE_PATH_DET_SHAPES
+    'path_details_shapes': SAVE_PATH_DET_SHAPES,
+    'shape_map': SAVE_PATH_SHAPE_MAP
 }
 
 # aws firehose stream name constants
 POS_STREAM_NAME = 'wmata-api-bus-positions-stream'
 ROUTES_STREAM_NAME = 'wmata-api-routes-stream'
 ROUTES_SCHED_STREAM_NAME = 'wmata-api-route-scheds-stream'
+ROUTES_SCHED_CHANGES_STREAM_NAME = 'wmata-api-route-sched-changes-stream'
 STOPS_STREAM_NAME = 'wmata-api-stops-stream'
 STOPS_SCHED_STREAM_NAME = 'wmata-api-stop-scheds-stream'
+INCIDENTS_STREAM_NAME = 'wmata-api-incidents-stream'
 
 # API data fieldnames
 BUS_POS_FIELD_NAMES = [
@@ -40,16 +60,29 @@ BUS_POS_FIELD_NAMES = [
     'DirectionText', 'Lat', 'Lon', 'RouteID', 'TripEndTime',
     'TripHeadsign', 'TripID', 'TripStartTime', 'VehicleID'
 ]
+POS_ROLLUP_FIELD_NAMES = [
+    'Minute', 'RouteID', 'Vehicles', 'Positions', 'DeviationMean',
+    'DeviationP50', 'DeviationP90', 'Coverage'
+]
+VEHICLE_TRACK_FIELD_NAMES = [
+    'VehicleID', 'DateTime', 'RouteID', 'TripID', 'Lat', 'Lon', 'Deviation'
+]
+BUNCHING_FIELD_NAMES = [
+    'DateTime', 'Event', 'RouteID', 'DirectionNum', 'VehicleID',
+    'LeadVehicleID', 'Spacing', 'DistanceAlong'
+]
 BUS_ROUTES_FIELD_NAMES = ['Name', 'RouteID', 'LineDescription']
 BUS_SCHED_FIELD_NAMES = [
     'Name', 'DirectionNum', 'EndTime', 'RouteID',
     'StartTime', 'StopID', 'StopName', 'StopSeq', 'Time',
     'TripDirectionText', 'TripHeadsign', 'TripID'
 ]
+BUS_SCHED_CHANGES_FIELD_NAMES = ['Op', 'Changed'] + BUS_SCHED_FIELD_NAMES
 BUS_INCIDENTS_FIELD_NAMES = [
     'DateUpdated', 'Description', 'IncidentID',
     'IncidentType', 'RoutesAffected'
 ]
+INCIDENT_CHANGES_FIELD_NAMES = ['Change'] + BUS_INCIDENTS_FIELD_NAMES
 BUS_STOP_FIELD_NAMES = ['StopID', 'Name', 'Lat', 'Lon', 'Routes']
 BUS_PATH_DET_STOPS_FIELD_NAMES = [
     'RouteName', 'RouteID', 'DirectionNum', 'DirectionText',
@@ -60,21 +93,39 @@ BUS_PATH_DET_SHAPES_FIELD_NAMES = [
     'RouteName', 'RouteID', 'DirectionNum', 'DirectionText',
     'TripHeadsign', 'Lat', 'Lon', 'SeqNum'
 ]
+SHAPE_MAP_FIELD_NAMES = [
+    'RouteID', 'DirectionNum', 'DirectionText', 'TripHeadsign',
+    'ShapeID', 'Points'
+]
+EPOCH = datetime(1970, 1, 1)
 DATA_FIELDNAMES_MAP = {
     'bus_positions': BUS_POS_FIELD_NAMES,
+    'position_rollups': POS_ROLLUP_FIELD_NAMES,
+    'vehicle_tracks': VEHICLE_TRACK_FIELD_NAMES,
+    'bunching_events': BUNCHING_FIELD_NAMES,
     'routes': BUS_ROUTES_FIELD_NAMES,
     'route_scheds': BUS_SCHED_FIELD_NAMES,
+    'route_sched_changes': BUS_SCHED_CHANGES_FIELD_NAMES,
     'incidents': BUS_INCIDENTS_FIELD_NAMES,
+    'incident_changes': INCIDENT_CHANGES_FIELD_NAMES,
     'stops': BUS_STOP_FIELD_NAMES,
     'path_details_stops': BUS_PATH_DET_STOPS_FIELD_NAMES,
-    'path_details_shapes': BUS_PATH_DET_SHAPES_FIELD_NAMES
+    'path_details_shapes': BUS_PATH_DET_SHAPES_FIELD_NAMES,
+    'shape_map': SHAPE_MAP_FIELD_NAMES
 }
 
 
-def config(section: str) -> dict:
-    """Returns parameters for given section of the config.in file."""
+@lru_cache(maxsize=None)
+def _config_parser() -> ConfigParser:
+    """Parse config.ini once per process."""
     parser = ConfigParser()
     parser.read(CONFIG_FILE)
+    return parser
+
+
+def config(section: str) -> dict:
+    """Returns parameters for given section of the config.in file."""
+    parser = _config_parser()
 
     # get section parameters
     opts = dict()
@@ -88,22 +139,44 @@ def config(section: str) -> dict:
     return opts
 
 
-def get_aws_session() -> boto3.Session:
-    """Return aws session object."""
+def config_defaults(section: str, defaults: dict) -> dict:
+    """Returns defaults updated by the optional section of the config.ini file."""
+    opts = dict(defaults)
+    try:
+        opts.update(config(section))
+    except ValueError:
+        pass
+    return opts
+
+
+def get_aws_session():
+    """Return aws session object.
+
+    boto3 is imported here, so runs that never use an aws sink don't pay for
+    importing it.
+    """
+    import boto3
     aws_config = config(section='aws')
     return boto3.Session(**aws_config)
 
 
+@lru_cache(maxsize=None)
+def get_firehose_client():
+    """Return firehose client, created on first use."""
+    return get_aws_session().client('firehose')
+
+
 def firehose_batch(
         client, data_name: str, records: list,
         stream_name: str, verbose=False
 ) -> dict:
     # TODO: handle exceptions, likely via storing locally and pushing
     # TODO: subsequently via batch process.
-    resp = client.put_record_batch(
-        DeliveryStreamName=stream_name,
-        Records=records
-    )
+    with SINK_LATENCY.time(sink='firehose', data_name=data_name):
+        resp = client.put_record_batch(
+            DeliveryStreamName=stream_name,
+            Records=records
+        )
     if verbose:
         print(f'[{data_name}] Firehose response: {resp}')
     return resp
@@ -115,10 +188,11 @@ def firehose_put(
 ) -> dict:
     # TODO: handle exceptions, likely via storing locally and pushing
     # TODO: subsequently via batch process.
-    resp = client.put_record(
-        DeliveryStreamName=stream_name,
-        Record=record
-    )
+    with SINK_LATENCY.time(sink='firehose', data_name=data_name):
+        resp = client.put_record(
+            DeliveryStreamName=stream_name,
+            Record=record
+        )
     if verbose:
         print(f'[{data_name}] Firehose response: {resp}')
     return resp
@@ -131,22 +205,57 @@ def add_name_timestamp(resp_data: dict, data_name: str) -> dict:
     return resp_data
 
 
-def mkdir_timestamp(data_type: str, level: int = 3) -> str:
-    """Expand data directory to include current timestamp subfolders.
+def csv_file_prefix(api_type: str, custom: str = '') -> str:
+    """Return start of csv file names for api_type and custom id."""
+    if custom:
+        custom = ''.join(e for e in custom if e.isalnum())  # rm spec chars
+        return '_'.join([api_type, custom]) + '_'
+    return api_type + '_'
+
+
+def timestamp_dir(data_type: str, level: int = 3, timestamp: datetime = None) -> str:
+    """Return data directory with timestamp subfolders, without creating it.
 
         Args:
             data_type (str): type of api data.
             level (int): represents year, month, day, and hour level to
                 include in timestamp, respectively.
-
-        Returns:
-            The path for the timestamp directory.
+            timestamp (datetime): Optional; defaults to now.
         """
     dir_path = DATA_PATH_MAP[data_type]
-    levels = datetime.now().strftime('%Y-%m-%d-%H').split('-')
+    levels = (timestamp or datetime.now()).strftime('%Y-%m-%d-%H').split('-')
     for i in range(level):
         dir_path = os.path.join(dir_path, levels[i])
-    else:
-        os.makedirs(name=dir_path, exist_ok=True)
+    return dir_path
+
+
+def mkdir_timestamp(data_type: str, level: int = 3, timestamp: datetime = None) -> str:
+    """Expand data directory to include current timestamp subfolders.
+
+        Args:
+            data_type (str): type of api data.
+            level (int): represents year, month, day, and hour level to
+                include in timestamp, respectively.
+            timestamp (datetime): Optional; partition timestamp, e.g. the
+                date of historical data. Defaults to now.
 
+        Returns:
+            The path for the timestamp directory.
+        """
+    dir_path = timestamp_dir(data_type, level, timestamp)
+    os.makedirs(name=dir_path, exist_ok=True)
     return dir_path
+
+
+def to_epoch(timestamp: str) -> int:
+    """Return seconds since EPOCH for WMATA ISO timestamp, e.g. 2021-08-10T10:20:42.
+
+    WMATA timestamps are local (Eastern) time without an offset, so the value
+    is treated as naive and not shifted to UTC.
+    """
+    return int((datetime.fromisoformat(timestamp) - EPOCH).total_seconds())
+
+
+def from_epoch(seconds: int) -> str:
+    """Inverse of to_epoch, returns the WMATA ISO timestamp string."""
+    return (EPOCH + timedelta(seconds=seconds)).isoformat()
@@ -1,10 +1,21 @@
+# built-in modules
+from collections import Counter
+from functools import lru_cache
+from threading import Event, Lock
+
 # libraries
 import requests
 
 # project modules
+from metrics import (
+    REQUEST_LATENCY, REQUESTS, RESPONSE_BYTES, REQUESTS_COALESCED
+)
+from ratelimit import RATE_LIMITER
+from tracing import span
 from utils import config
 
-API_BASE_URL = 'https://api.wmata.com/Bus.svc/json'
+API_HOST = 'https://api.wmata.com'
+API_BASE_URL = f'{API_HOST}/Bus.svc/json'
 API_END_POINTS = {
     'bus_position': f'{API_BASE_URL}/jBusPositions',
     'path_details': f'{API_BASE_URL}/jRouteDetails',
@@ -12,15 +23,140 @@ API_END_POINTS = {
     'route_scheds ': f'{API_BASE_URL}/jRouteSchedule',
     'stop_scheds ': f'{API_BASE_URL}/jStopSchedule',
     'stops': f'{API_BASE_URL}/jStops',
-    'validate_key': 'https://api.wmata.com/Misc/Validate'
+    'incidents': f'{API_HOST}/Incidents.svc/json/BusIncidents',
+    'validate_key': f'{API_HOST}/Misc/Validate'
 }
-API_KEYS = config('wmata')
 DATA_CHOICES = [
     'positions', 'routes', 'route_scheds ',
     'incident', 'stops', 'stop_scheds'
 ]
 
 
+API_KEY_SECTION = 'wmata'
+
+
+@lru_cache(maxsize=None)
+def get_api_keys() -> dict:
+    """Return API_KEY_SECTION of config.ini, read on first request."""
+    return config(API_KEY_SECTION)
+
+
+def set_api_key_section(section: str) -> None:
+    """Use api keys from another config.ini section, e.g. one per worker."""
+    global API_KEY_SECTION
+    API_KEY_SECTION = section
+    get_api_keys.cache_clear()
+
+
+def __getattr__(name: str):
+    # API_KEYS is resolved lazily so importing wmata doesn't require config.ini
+    if name == 'API_KEYS':
+        return get_api_keys()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class _Call:
+    """In-flight request shared by all callers of the same resource."""
+    __slots__ = ('done', 'resp', 'error')
+
+    def __init__(self):
+        self.done = Event()
+        self.resp = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicates concurrent identical requests.
+
+    The first caller for a key performs the request, callers arriving while
+    it is in flight wait and receive the same response object.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = dict()
+        self.requested = Counter()  # endpoint -> calls made by clients
+        self.coalesced = Counter()  # endpoint -> calls served by another's request
+
+    def do(self, key: tuple, fn):
+        endpoint = key[0]
+        with self._lock:
+            self.requested[endpoint] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced[endpoint] += 1
+                REQUESTS_COALESCED.inc(endpoint=endpoint.strip())
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.resp
+
+        try:
+            call.resp = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.resp
+
+    def stats(self) -> dict:
+        """Return requested and coalesced call counts per endpoint."""
+        with self._lock:
+            return {
+                endpoint: {
+                    'requested': count,
+                    'coalesced': self.coalesced[endpoint]
+                } for endpoint, count in self.requested.items()
+            }
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+
+def set_api_host(host: str) -> None:
+    """Point API_END_POINTS at another host, e.g. a local simulator or proxy."""
+    global API_HOST
+    host = host.rstrip('/')
+    for name, url in API_END_POINTS.items():
+        API_END_POINTS[name] = host + url[len(API_HOST):]
+    API_HOST = host
+
+
+def _get(end_point: str, key_name: str, params: dict = None):
+    """GET api end point, sharing the response with concurrent identical calls."""
+    params = params or dict()
+    headers = {
+        'api_key': get_api_keys()[key_name]
+    }
+    key = (end_point, key_name, tuple(sorted(params.items())))
+
+    def fetch():
+        endpoint = end_point.strip()
+        with span('rate_limit', endpoint=endpoint):
+            RATE_LIMITER.acquire()
+        try:
+            with REQUEST_LATENCY.time(endpoint=endpoint):
+                r = requests.get(
+                    url=API_END_POINTS[end_point],
+                    headers=headers, params=params
+                )
+        except Exception:  # e.g. timeouts and connection errors
+            REQUESTS.inc(endpoint=endpoint, status='error')
+            raise
+        REQUESTS.inc(endpoint=endpoint, status=r.status_code)
+        RESPONSE_BYTES.inc(len(r.content), endpoint=endpoint)
+        return r
+    return SINGLE_FLIGHT.do(key, fetch)
+
+
 def validate_key(api_key: str) -> bool:
     header = {
         'api_key': api_key
@@ -57,9 +193,6 @@ def get_bus_position(route_id=None, lat=None, lon=None, radius=None):
         Request response object where json() method provides the following elements:
             BusPositions - array containing bus position information.
     """
-    headers = {
-        'api_key': API_KEYS['bus_pos_key']
-    }
     # configure api parameters
     params = dict()
     if route_id:
@@ -71,11 +204,7 @@ def get_bus_position(route_id=None, lat=None, lon=None, radius=None):
     if radius:
         params['Radius'] = radius
 
-    r = requests.get(
-        url=API_END_POINTS['bus_position'],
-        headers=headers, params=params
-    )
-    return r
+    return _get('bus_position', 'bus_pos_key', params)
 
 
 def get_path_details(route_id: str, date=None):
@@ -95,9 +224,6 @@ def get_path_details(route_id: str, date=None):
             Name - descriptive name for the route.
             RouteID - bus ute variant (e.g.: 10A, 10Av1, ect.)
     """
-    headers = {
-        'api_key': API_KEYS['default']
-    }
     # configure api parameters
     params = dict()
     if route_id:
@@ -105,11 +231,7 @@ def get_path_details(route_id: str, date=None):
     if date:
         params['Date'] = date
 
-    r = requests.get(
-        url=API_END_POINTS['path_details'],
-        headers=headers, params=params
-    )
-    return r
+    return _get('path_details', 'default', params)
 
 
 def get_routes():
@@ -123,15 +245,7 @@ def get_routes():
         Request response object where json() method provides the following elements:
             Routes - array containing route variant information.
     """
-    headers = {
-        'api_key': API_KEYS['default']
-    }
-
-    r = requests.get(
-        url=API_END_POINTS['routes'],
-        headers=headers
-    )
-    return r
+    return _get('routes', 'default')
 
 
 def get_schedule(route_id: str, date=None, including_variations=None):
@@ -150,9 +264,6 @@ def get_schedule(route_id: str, date=None, including_variations=None):
             Direction1 - structures describing path/stop information for the route.
             Name - descriptive name for the route.
     """
-    headers = {
-        'api_key': API_KEYS['bus_route_sched_key']
-    }
     # configure api parameters
     params = dict()
     if route_id:
@@ -162,11 +273,7 @@ def get_schedule(route_id: str, date=None, including_variations=None):
     if including_variations:
         params['IncludingVariations'] = including_variations
 
-    r = requests.get(
-        url=API_END_POINTS['route_scheds '],
-        headers=headers, params=params
-    )
-    return r
+    return _get('route_scheds ', 'bus_route_sched_key', params)
 
 
 def get_stop_schedule(stop_id: str, date=None):
@@ -182,9 +289,6 @@ def get_stop_schedule(stop_id: str, date=None):
                 ScheduleArrivals - array containing scheduled arrival information.
                 Stop - structures describing stop information.
         """
-    headers = {
-        'api_key': API_KEYS['default']
-    }
     # configure api parameters
     params = dict()
     if stop_id:
@@ -192,11 +296,7 @@ def get_stop_schedule(stop_id: str, date=None):
     if date:
         params['Date'] = date
 
-    r = requests.get(
-        url=API_END_POINTS['stop_scheds '],
-        headers=headers, params=params
-    )
-    return r
+    return _get('stop_scheds ', 'default', params)
 
 
 def get_stops(lat=None, lon=None, radius=None):
@@ -217,9 +317,6 @@ def get_stops(lat=None, lon=None, radius=None):
         Request response object where json() method provides the following elements:
             Stops - array containing stop information.
     """
-    headers = {
-        'api_key': API_KEYS['bus_pos_key']
-    }
     # configure api parameters
     params = dict()
     if lat:
@@ -229,11 +326,32 @@ def get_stops(lat=None, lon=None, radius=None):
     if radius:
         params['Radius'] = radius
 
-    r = requests.get(
-        url=API_END_POINTS['stops'],
-        headers=headers, params=params
-    )
-    return r
+    return _get('stops', 'bus_pos_key', params)
+
+
+def get_incidents(route_id=None):
+    """
+    Returns a set of reported bus incidents/delays for a given route.
+
+    Omit the route to return all reported items. Note that the Route parameter
+    accepts only base route names and no variations, i.e.: use 10A instead of
+    10Av1 and 10Av2.
+
+    Args:
+        route_id (str): Optional; Base bus route, e.g.: 70, 10A.
+
+    Returns:
+        Request response object where json() method provides the following elements:
+            BusIncidents - array containing bus incident information:
+                DateUpdated, Description, IncidentID, IncidentType and
+                RoutesAffected.
+    """
+    # configure api parameters
+    params = dict()
+    if route_id:
+        params['Route'] = route_id
+
+    return _get('incidents', 'default', params)
 
 
 def get_route_ids(routes_data: dict) -> list:
@@ -255,19 +373,22 @@ def get_stop_ids(stops_data: dict) -> list:
 def flatten_route_sched_data(resp_json: dict) -> list:
     """
     Helper function to reformat bus schedule response data into flat format.
+
+    resp_json is not modified, so a response decoded once can be reused.
     """
-    # Remove and store name
     name = resp_json['Name']
-    del resp_json['Name']
 
     # Process direction, trip, and stop information
     data = list()
     for direction, trip_elem in resp_json.items():  # list of dicts
+        if direction == 'Name' or not trip_elem:  # skip name and null directions
+            continue
         for trip in trip_elem:  # trip_elem is list of dicts
+            trip_row = {'Name': name}
+            trip_row.update(trip)  # add trip data for respective stop
+            del trip_row['StopTimes']  # remove StopTimes dict object
             for stop in trip['StopTimes']:  # stops is list of dicts
-                row = {'Name': name}
-                row.update(trip)  # add trip data for respective stop
-                del row['StopTimes']  # remove StopTimes dict object
+                row = trip_row.copy()
                 row.update(stop)  # store specific stop_time as row data
                 data.append(row)
     return data
@@ -281,39 +402,42 @@ def flatten_stop_sched_data(resp_json: dict) -> list:
     raise NotImplementedError
 
 
-def flatten_path_details_data(resp_json: dict) -> dict:
-    # Remove and store name and route id
+def flatten_path_details_data(resp_json: dict, shapes=True) -> dict:
+    """
+    Helper function to reformat path details response data into flat
+    path_details_stops and, if shapes, path_details_shapes rows.
+
+    resp_json is not modified, so a response decoded once can be reused.
+    """
     name = resp_json['Name']
     route_id = resp_json['RouteID']
-    del resp_json['Name']
-    del resp_json['RouteID']
 
     # Process direction elements to get stops and shapes information
     path_stops = list()
     path_shapes = list()
-    data = {
-        'path_details_stops': path_stops,
-        'path_details_shapes': path_shapes
-    }
+    data = {'path_details_stops': path_stops}
+    if shapes:
+        data['path_details_shapes'] = path_shapes
     for direction, trip_elem in resp_json.items():  # direction is dict of dict
-        if not trip_elem:  # skip if direction is empty dict
+        if direction in ('Name', 'RouteID') or not trip_elem:  # skip empty dict
             continue
 
+        # trip data shared by every stop and shape row of the direction
+        trip_row = {'RouteName': name, 'RouteID': route_id}
+        trip_row.update(trip_elem)
+        del trip_row['Shape']  # remove Shape dict object
+        del trip_row['Stops']  # remove StopTimes dict object
+
         # create path details stops rows
         for stop_num, stop in enumerate(trip_elem['Stops'], 1):  # list of dicts
             row = {'RouteName': name, 'RouteID': route_id, 'StopNum': stop_num}
-            row.update(trip_elem)  # add trip data for respective stop
-            del row['Shape']  # remove Shape dict object
-            del row['Stops']  # remove StopTimes dict object
+            row.update(trip_row)
             row.update(stop)  # store specific stop_time as row data
             path_stops.append(row)
 
         # create path details shapes rows
-        for shape in trip_elem['Shape']:  # list of dicts
-            row = {'RouteName': name, 'RouteID': route_id}
-            row.update(trip_elem)  # add trip data for respective stop
-            del row['Shape']  # remove Shape dict object
-            del row['Stops']  # remove StopTimes dict object
+        for shape in trip_elem['Shape'] if shapes else ():  # list of dicts
+            row = trip_row.copy()
             row.update(shape)  # store specific shapes as row data
             path_shapes.append(row)
     return data
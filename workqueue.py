@@ -0,0 +1,153 @@
+"""
+workqueue.py
+------------
+
+Durable SQLite-backed work queue for distributing route and stop fetches
+across worker processes.
+
+Producers enqueue (kind, item_id, date) tasks; workers claim one task at a
+time under a lease. A task whose lease expires before it is completed,
+e.g. because its worker died, is handed to the next worker that claims.
+"""
+# built-in modules
+import os
+import sqlite3
+import socket
+from collections import namedtuple
+from time import time
+
+Task = namedtuple('Task', ['id', 'kind', 'item_id', 'date', 'attempts'])
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    date TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (kind, item_id, date)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+'''
+
+
+def worker_name() -> str:
+    """Return default worker name, unique per host and process."""
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkQueue:
+    """Work queue stored in a SQLite database file.
+
+    Args:
+        path (str): database file, shared by producers and workers.
+        max_attempts (int): claims after which a failing task is given up.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def enqueue(self, kind: str, item_ids: list, date: str = '') -> int:
+        """Add tasks, ignoring ones already queued; returns number added."""
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO tasks (kind, item_id, date) VALUES (?, ?, ?)',
+                [(kind, item_id, date or '') for item_id in item_ids]
+            )
+            return self.conn.total_changes - before
+
+    def claim(self, owner: str, lease: float = 300, kinds: list = None):
+        """Lease the next pending or expired task to owner, None if none left."""
+        now = time()
+        query = (
+            'SELECT id, kind, item_id, date, attempts FROM tasks '
+            'WHERE (status = ? OR (status = ? AND lease_expires < ?)) '
+            'AND attempts < ?'
+        )
+        params = [PENDING, LEASED, now, self.max_attempts]
+        if kinds:
+            query += f' AND kind IN ({",".join("?" * len(kinds))})'
+            params.extend(kinds)
+        query += ' ORDER BY id LIMIT 1'
+
+        self.conn.execute('BEGIN IMMEDIATE')  # serialize concurrent claims
+        try:
+            self.conn.execute(  # give up on tasks whose workers keep dying
+                'UPDATE tasks SET status = ?, error = ? WHERE status = ? '
+                'AND lease_expires < ? AND attempts >= ?',
+                (FAILED, 'lease expired', LEASED, now, self.max_attempts)
+            )
+            row = self.conn.execute(query, params).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            self.conn.execute(
+                'UPDATE tasks SET status = ?, owner = ?, lease_expires = ?, '
+                'attempts = attempts + 1 WHERE id = ?',
+                (LEASED, owner, now + lease, row[0])
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        task = Task(*row)
+        return task._replace(attempts=task.attempts + 1)
+
+    def renew(self, task: Task, owner: str, lease: float = 300) -> bool:
+        """Extend the lease, returns False if the task was reassigned."""
+        with self.conn:
+            cursor = self.conn.execute(
+                'UPDATE tasks SET lease_expires = ? '
+                'WHERE id = ? AND owner = ? AND status = ?',
+                (time() + lease, task.id, owner, LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, task: Task, owner: str) -> bool:
+        """Mark task done, returns False if the task was reassigned."""
+        with self.conn:
+            cursor = self.conn.execute(
+                'UPDATE tasks SET status = ?, lease_expires = NULL, error = NULL '
+                'WHERE id = ? AND owner = ? AND status = ?',
+                (DONE, task.id, owner, LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, task: Task, owner: str, error: str) -> None:
+        """Release task for retry, or mark it failed after max_attempts."""
+        status = FAILED if task.attempts >= self.max_attempts else PENDING
+        with self.conn:
+            self.conn.execute(
+                'UPDATE tasks SET status = ?, lease_expires = NULL, error = ? '
+                'WHERE id = ? AND owner = ? AND status = ?',
+                (status, error, task.id, owner, LEASED)
+            )
+
+    def counts(self) -> dict:
+        """Return number of tasks by status, expired leases count as pending."""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        rows = self.conn.execute(
+            'SELECT CASE WHEN status = ? AND lease_expires < ? THEN ? '
+            'ELSE status END, COUNT(*) FROM tasks GROUP BY 1',
+            (LEASED, time(), PENDING)
+        )
+        for status, n in rows:
+            counts[status] = counts.get(status, 0) + n
+        return counts